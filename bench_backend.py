@@ -0,0 +1,383 @@
+"""Load benchmark for the dashboard backend (ingestion, queries, WebSockets).
+
+Starts dashboard/backend/main.py under a local uvicorn on a temporary SQLite
+file (or targets a running backend with --url) and drives, open loop with
+Poisson arrivals:
+
+    writes  POST /api/metrics, /api/logs, /api/alerts, /api/trace_observed,
+            /api/incidents in roughly the proportions the stream processor
+            sends them, with a few trace_observed replays of recent ids
+    reads   GET /api/alerts, /api/metrics/{service}/{type},
+            /api/logs?trace_id=  (ids the writers recently used)
+    --ws N  WebSocket subscribers on /ws, timing metric broadcasts
+
+Latency is measured from each request's scheduled send time, so a backend
+that falls behind shows up in the percentiles rather than slowing the load;
+histograms are trigger_traffic.py's.
+Reports sustained RPS and latency percentiles per endpoint, broadcast lag,
+and SQLite file growth (with -wal/-shm) and row counts.
+
+Usage:
+    python bench_backend.py
+    python bench_backend.py --write-rps 1000 --read-rps 100 --ws 20 --duration 60
+    python bench_backend.py --url http://localhost:8000 --db dashboard/backend/telemetry.db --json load.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import sqlite3
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import Counter, deque
+from datetime import datetime, timezone
+
+import httpx
+
+from trigger_traffic import LatencyHistogram
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dashboard", "backend")
+SERVICES = ("api-gateway", "python-service", "node-service")
+ROUTES = ("/api/quote", "/api/slow-quote", "/api/n-plus-1", "/api/pii")
+WRITE_MIX = {"metrics": 0.60, "logs": 0.24, "trace_observed": 0.10, "alerts": 0.05, "incidents": 0.01}
+READ_MIX = {"metrics": 0.50, "alerts": 0.30, "logs": 0.20}
+DB_TABLES = ("alerts", "metrics", "logs", "trace_inventory", "trace_counters",
+             "observed_traces", "incidents")
+# Fraction of trace_observed posts that resend a recent trace id, as a
+# restarted stream processor does.
+REPLAY_RATE = 0.01
+
+
+class EndpointStats:
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.errors = 0
+
+
+# ---- Workload ---------------------------------------------------------------
+
+class Workload:
+
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        self.trace_ids = deque(maxlen=1000)
+        self.observed = deque(maxlen=1000)
+        self.incidents = {}  # incident_id -> last event sent
+
+    def _now_iso(self):
+        return datetime.now(timezone.utc).isoformat()
+
+    def _trace_id(self):
+        trace_id = "%032x" % self.rng.getrandbits(128)
+        self.trace_ids.append(trace_id)
+        return trace_id
+
+    def write(self, kind):
+        rng = self.rng
+        service = rng.choice(SERVICES)
+        if kind == "metrics":
+            metric_type, route = rng.choice((
+                ("throughput", None), ("p99_latency", None),
+                ("critical_path_ms", None), ("critical_path_ms", rng.choice(ROUTES)),
+            ))
+            return "POST", "/api/metrics", {
+                "service": service, "route": route, "metric_type": metric_type,
+                "value": rng.lognormvariate(4.0, 1.0), "timestamp": self._now_iso(),
+            }
+        if kind == "logs":
+            return "POST", "/api/logs", {
+                "trace_id": self._trace_id(), "span_id": "%016x" % rng.getrandbits(64),
+                "service_name": service, "body": f"quote served id={rng.randint(1, 500)}",
+                "severity": rng.choice(("INFO", "INFO", "INFO", "WARN", "ERROR")),
+                "timestamp": self._now_iso(),
+            }
+        if kind == "trace_observed":
+            if self.observed and rng.random() < REPLAY_RATE:
+                trace_id = rng.choice(self.observed)
+            else:
+                trace_id = self._trace_id()
+                self.observed.append(trace_id)
+            return "POST", "/api/trace_observed", {
+                "trace_id": trace_id, "services": rng.sample(SERVICES, 2),
+                "is_anomaly": rng.random() < 0.05,
+            }
+        if kind == "incidents":
+            return "POST", "/api/incidents", self._incident_event(service)
+        trace_id = self._trace_id()
+        route = rng.choice(ROUTES)
+        spans = [
+            {"name": f"GET {route}", "service": service, "duration_ms": rng.uniform(50, 2000),
+             "start_time": self._now_iso(), "trace_id": trace_id,
+             "span_id": "%016x" % rng.getrandbits(64), "parent_span_id": "", "status_code": 0}
+            for _ in range(rng.randint(2, 20))
+        ]
+        return "POST", "/api/alerts", {
+            "service": service, "route": f"GET {route}", "anomaly_score": rng.random(),
+            "is_anomaly": True, "duration_ms": spans[0]["duration_ms"], "trace_id": trace_id,
+            "timestamp": self._now_iso(), "spans": spans, "reasons": ["latency_spike"],
+            "ml_scores": {"iso": rng.random()}, "rule_flags": {"n_plus_1": False},
+            "anomaly_type": "Latency Spike",
+        }
+
+    def _incident_event(self, service):
+        """Open, update or resolve one of a handful of incidents."""
+        rng, now = self.rng, self._now_iso()
+        if self.incidents and rng.random() < 0.9:
+            event = dict(self.incidents[rng.choice(list(self.incidents))])
+            event["occurrences"] += rng.randint(1, 50)
+            event["last_seen"] = now
+            event["exemplar_trace_ids"] = (event["exemplar_trace_ids"] + [self._trace_id()])[:5]
+            if rng.random() < 0.1:
+                event.update(event="resolve", resolved_at=now)
+                del self.incidents[event["incident_id"]]
+                return event
+            event["event"] = "update"
+        else:
+            event = {
+                "event": "open", "incident_id": "inc-%016x" % rng.getrandbits(64),
+                "service": service, "route": f"GET {rng.choice(ROUTES)}",
+                "anomaly_type": "Latency Spike", "opened_at": now, "last_seen": now,
+                "resolved_at": None, "occurrences": 1, "exemplar_trace_ids": [self._trace_id()],
+            }
+        event["max_score"] = max(event.get("max_score", 0.0), rng.random())
+        event["mean_score"] = event["max_score"] * rng.uniform(0.5, 1.0)
+        self.incidents[event["incident_id"]] = event
+        return event
+
+    def read(self, kind):
+        rng = self.rng
+        if kind == "metrics":
+            return "GET", f"/api/metrics/{rng.choice(SERVICES)}/{rng.choice(('throughput', 'p99_latency'))}", None
+        if kind == "alerts":
+            return "GET", "/api/alerts", None
+        trace_id = rng.choice(self.trace_ids) if self.trace_ids else "0" * 32
+        return "GET", f"/api/logs?trace_id={trace_id}", None
+
+
+async def _request(client, method, path, body, scheduled, stats):
+    loop = asyncio.get_running_loop()
+    try:
+        resp = await client.request(method, path, json=body)
+        failed = resp.status_code >= 400
+    except httpx.HTTPError:
+        failed = True
+    stats.latency.record((loop.time() - scheduled) * 1000.0)
+    stats.errors += failed
+
+
+async def open_loop(client, rate, duration, mix, make, stats, rng):
+    """Poisson arrivals at `rate`/s for `duration` s; never waits for replies."""
+    if rate <= 0:
+        return
+    loop = asyncio.get_running_loop()
+    kinds, weights = zip(*mix.items())
+    start = scheduled = loop.time()
+    tasks = set()
+    while True:
+        scheduled += rng.expovariate(rate)
+        if scheduled - start >= duration:
+            break
+        delay = scheduled - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        kind = rng.choices(kinds, weights)[0]
+        method, path, body = make(kind)
+        task = asyncio.create_task(_request(client, method, path, body, scheduled, stats[f"{method} {kind}"]))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks)
+
+
+async def subscriber(ws_url, stop, lag, counts):
+    import websockets  # shipped with uvicorn[standard]
+
+    async with websockets.connect(ws_url, max_size=None) as ws:
+        while not stop.is_set():
+            try:
+                message = json.loads(await asyncio.wait_for(ws.recv(), 0.5))
+            except asyncio.TimeoutError:
+                continue
+            counts[message.get("type")] += 1
+            if message.get("type") == "metric_update":
+                sent = datetime.fromisoformat(message["data"]["timestamp"]).timestamp()
+                lag.record((time.time() - sent) * 1000.0)
+
+
+# ---- DB growth --------------------------------------------------------------
+
+def db_bytes(path):
+    return sum(os.path.getsize(p) for p in (path, path + "-wal", path + "-shm") if os.path.exists(p))
+
+
+def db_rows(path):
+    with sqlite3.connect(f"file:{path}?mode=ro", uri=True) as db:
+        rows = {}
+        for table in DB_TABLES:
+            try:
+                rows[table] = db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            except sqlite3.OperationalError:
+                pass
+        return rows
+
+
+async def sample_db(path, stop, series, start):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        series.append((round(loop.time() - start, 2), db_bytes(path)))
+        try:
+            await asyncio.wait_for(stop.wait(), 1.0)
+        except asyncio.TimeoutError:
+            pass
+
+
+# ---- Server -----------------------------------------------------------------
+
+def start_server(db_path):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=dict(os.environ, OBSERVEX_DB_PATH=db_path),
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"backend exited with code {proc.returncode}")
+        try:
+            if httpx.get(f"{base_url}/api/stats", timeout=1.0).status_code == 200:
+                return proc, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("backend did not become ready within 30s")
+
+
+# ---- Run --------------------------------------------------------------------
+
+async def run(args, base_url, db_path):
+    workload = Workload(args.seed)
+    stats = {}
+    for method, mix in (("POST", WRITE_MIX), ("GET", READ_MIX)):
+        for kind in mix:
+            stats[f"{method} {kind}"] = EndpointStats()
+    lag, ws_counts = LatencyHistogram(), Counter()
+    stop = asyncio.Event()
+    series = []
+    loop = asyncio.get_running_loop()
+
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30.0) as client:
+        ws_url = base_url.replace("http", "ws", 1) + "/ws"
+        subscribers = [asyncio.create_task(subscriber(ws_url, stop, lag, ws_counts)) for _ in range(args.ws)]
+        bytes_before = db_bytes(db_path) if db_path else 0
+        sampler = asyncio.create_task(sample_db(db_path, stop, series, loop.time())) if db_path else None
+
+        start = loop.time()
+        await asyncio.gather(
+            open_loop(client, args.write_rps, args.duration, WRITE_MIX, workload.write, stats,
+                      random.Random(args.seed + 1)),
+            open_loop(client, args.read_rps, args.duration, READ_MIX, workload.read, stats,
+                      random.Random(args.seed + 2)),
+        )
+        elapsed = loop.time() - start
+        stop.set()
+        for task in subscribers + ([sampler] if sampler else []):
+            try:
+                await task
+            except Exception as e:
+                print(f"  background task failed: {e}", file=sys.stderr)
+
+    endpoints = {
+        name: dict(
+            requests=s.latency.n, errors=s.errors,
+            rps=s.latency.n / elapsed if elapsed else 0.0,
+            latency_ms=s.latency.summary(),
+        )
+        for name, s in stats.items() if s.latency.n
+    }
+    writes = sum(s.latency.n for name, s in stats.items() if name.startswith("POST"))
+    result = {
+        "config": {k: getattr(args, k) for k in ("duration", "write_rps", "read_rps", "ws", "connections", "seed")},
+        "elapsed_s": elapsed,
+        "write_rps": writes / elapsed if elapsed else 0.0,
+        "read_rps": sum(s.latency.n for name, s in stats.items() if name.startswith("GET")) / elapsed if elapsed else 0.0,
+        "endpoints": endpoints,
+        "websocket": {
+            "subscribers": args.ws,
+            "messages": dict(ws_counts),
+            "metric_broadcast_lag_ms": lag.summary(),
+        },
+    }
+    if db_path:
+        bytes_after = db_bytes(db_path)
+        result["db"] = {
+            "bytes_before": bytes_before,
+            "bytes_after": bytes_after,
+            "bytes_per_write": (bytes_after - bytes_before) / writes if writes else 0.0,
+            "rows": db_rows(db_path),
+            "size_series": series,
+        }
+    return result
+
+
+def print_report(result):
+    print(f"{result['elapsed_s']:.1f}s  writes {result['write_rps']:,.0f}/s  reads {result['read_rps']:,.0f}/s")
+    print(f"  {'endpoint':22s} {'req':>8s} {'err':>6s} {'rps':>8s} {'p50':>8s} {'p90':>8s} {'p99':>8s} {'p99.9':>8s} {'max':>8s}")
+    for name, e in result["endpoints"].items():
+        lat = e["latency_ms"]
+        print(f"  {name:22s} {e['requests']:8d} {e['errors']:6d} {e['rps']:8.1f} "
+              f"{lat['p50']:8.1f} {lat['p90']:8.1f} {lat['p99']:8.1f} {lat['p99.9']:8.1f} {lat['max']:8.1f}")
+    ws = result["websocket"]
+    if ws["subscribers"]:
+        lag = ws["metric_broadcast_lag_ms"]
+        print(f"  ws x{ws['subscribers']}: {sum(ws['messages'].values())} messages, metric broadcast lag "
+              f"p50 {lag['p50']:.1f}ms p99 {lag['p99']:.1f}ms max {lag['max']:.1f}ms")
+    db = result.get("db")
+    if db:
+        print(f"  db {db['bytes_before'] / 2**20:.1f} -> {db['bytes_after'] / 2**20:.1f} MiB "
+              f"({db['bytes_per_write']:.0f} B/write)  rows {db['rows']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of load")
+    parser.add_argument("--write-rps", type=float, default=500.0)
+    parser.add_argument("--read-rps", type=float, default=50.0)
+    parser.add_argument("--ws", type=int, default=5, help="WebSocket subscribers")
+    parser.add_argument("--connections", type=int, default=100, help="HTTP connection pool size")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--url", help="Target a running backend instead of starting one")
+    parser.add_argument("--db", help="SQLite file to measure with --url")
+    parser.add_argument("--json", metavar="PATH", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    proc = None
+    if args.url:
+        base_url, db_path = args.url.rstrip("/"), args.db
+    else:
+        db_path = os.path.join(tempfile.mkdtemp(prefix="observex-backend-bench-"), "telemetry.db")
+        proc, base_url = start_server(db_path)
+    try:
+        result = asyncio.run(run(args, base_url, db_path))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=10)
+    print_report(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Bound the number of distinct service and route keys.
+
+Detector state, the per-service Bytewax keys, the ML pool, incidents and
+the backend's metric series are all keyed by service and route strings
+taken from the telemetry. One span name with an id in it
+(`GET /api/users/123`) would give each of them unbounded state, so keys go
+through two steps first:
+
+  * `template_route` replaces path segments that look like ids (numbers,
+    UUIDs, long hex or token strings) with placeholders;
+  * a `CardinalityGuard` admits at most `max_keys` distinct keys per scope
+    and maps everything else to OVERFLOW_KEY. Well below the cap a key is
+    admitted on first sight (`min_count`); once NEAR_CAP of the slots are
+    taken, candidates are ranked by a Space-Saving summary (Metwally et
+    al.) of `4 * max_keys` counters and admitted only when their guaranteed
+    count reaches `near_cap_min_count`, so a stream of one-off keys cannot
+    take the last slots from a real route.
+
+Admission is sticky: downstream state keyed by an admitted key is never
+orphaned, and memory stays at `max_keys` keys plus the fixed-size summary
+per scope however hostile the input. Routes are guarded per service.
+Vendored from stream-processor/cardinality.py for the metric series caps;
+keep the two copies in step.
+"""
+import re
+import heapq
+import threading
+from typing import Dict, Iterable, Optional
+
+OVERFLOW_KEY = "__other__"
+
+_UUID = re.compile(r"^[0-9a-fA-F]{8}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{12}$")
+_NUMBER = re.compile(r"^\d+$")
+_HEX = re.compile(r"^(?=.*\d)[0-9a-fA-F]{16,}$")
+_TOKEN = re.compile(r"^(?=.*\d)[A-Za-z0-9_\-=.~]{20,}$")
+_EMAIL = re.compile(r"^[^@\s]+@[^@\s]+$")
+# Every placeholder pattern needs a digit or an "@" (a digit-free UUID is
+# left alone), so most span names skip the per-segment checks.
+_MAYBE_ID = re.compile(r"[\d@]")
+
+
+def _template_segment(segment: str) -> str:
+    if not segment or segment.startswith("{"):
+        return segment
+    if _NUMBER.match(segment):
+        return "{id}"
+    if _UUID.match(segment):
+        return "{uuid}"
+    if _HEX.match(segment):
+        return "{hex}"
+    if _EMAIL.match(segment):
+        return "{email}"
+    if _TOKEN.match(segment):
+        return "{token}"
+    return segment
+
+
+def template_route(route: Optional[str]) -> str:
+    """"GET /api/users/123?x=1" -> "GET /api/users/{id}". Names without a
+    path ("security.pii_density") pass through unchanged."""
+    if not route:
+        return "unknown"
+    route = route.split("?", 1)[0].split("#", 1)[0]
+    if "/" not in route or not _MAYBE_ID.search(route):
+        return route
+    return "/".join(_template_segment(seg) for seg in route.split("/"))
+
+
+class SpaceSaving:
+    """Top-k frequency summary in `capacity` counters (Space-Saving).
+
+    An unmonitored key replaces the current minimum and inherits its count
+    as `error`, so `count - error` never overestimates the key's true
+    frequency. The minimum is found through a lazily cleaned heap.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, int(capacity))
+        self._counts: Dict[str, int] = {}
+        self._errors: Dict[str, int] = {}
+        self._heap = []  # (count, key), stale entries skipped on pop
+
+    def offer(self, key: str) -> int:
+        """Count one occurrence of `key`; returns its guaranteed count."""
+        counts = self._counts
+        if key in counts:
+            counts[key] += 1
+        else:
+            error = 0
+            if len(counts) >= self.capacity:
+                while True:
+                    count, victim = heapq.heappop(self._heap)
+                    if counts.get(victim) == count:
+                        break
+                del counts[victim]
+                del self._errors[victim]
+                error = count
+            counts[key] = error + 1
+            self._errors[key] = error
+        heapq.heappush(self._heap, (counts[key], key))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(c, k) for k, c in counts.items()]
+            heapq.heapify(self._heap)
+        return counts[key] - self._errors[key]
+
+    def top(self, n: int = 10):
+        return sorted(self._counts.items(), key=lambda kv: -kv[1])[:n]
+
+
+class CardinalityGuard:
+
+    # Fraction of max_keys after which near_cap_min_count applies.
+    NEAR_CAP = 0.8
+
+    def __init__(self, max_keys: int, min_count: int = 1, near_cap_min_count: int = 2,
+                 reserved: Iterable[str] = ()):
+        self.max_keys = max(1, int(max_keys))
+        self.min_count = max(1, int(min_count))
+        self.near_cap_min_count = max(self.min_count, int(near_cap_min_count))
+        self._near_cap = int(self.max_keys * self.NEAR_CAP)
+        self._summary = SpaceSaving(4 * self.max_keys)
+        # Always admitted and not counted against max_keys.
+        self._reserved = frozenset(reserved) | {OVERFLOW_KEY}
+        self._admitted = set()
+        self._lock = threading.Lock()
+        self.collapsed = 0
+
+    def key(self, key: str) -> str:
+        """`key` if admitted (or admitted now), else OVERFLOW_KEY."""
+        if key in self._admitted or key in self._reserved:
+            return key
+        with self._lock:
+            if key in self._admitted:
+                return key
+            admitted = len(self._admitted)
+            needed = self.min_count if admitted < self._near_cap else self.near_cap_min_count
+            guaranteed = self._summary.offer(key) if needed > 1 else 1
+            if guaranteed >= needed and admitted < self.max_keys:
+                self._admitted.add(key)
+                return key
+            self.collapsed += 1
+            return OVERFLOW_KEY
+
+    def size(self) -> int:
+        return len(self._admitted)
+
+
+class KeyLimiter:
+    """Service names and per-service route templates, each behind a guard."""
+
+    def __init__(self, max_services: int = 200, max_routes_per_service: int = 100,
+                 min_count: int = 1, near_cap_min_count: int = 2,
+                 reserved_services: Iterable[str] = ("unknown",)):
+        self.max_routes_per_service = max_routes_per_service
+        self.min_count = min_count
+        self.near_cap_min_count = near_cap_min_count
+        self.services = CardinalityGuard(max_services, min_count, near_cap_min_count,
+                                         reserved_services)
+        self._routes: Dict[str, CardinalityGuard] = {}
+        self._lock = threading.Lock()
+
+    def service(self, service: Optional[str]) -> str:
+        return self.services.key(service or "unknown")
+
+    def route(self, service: str, route: Optional[str]) -> str:
+        """Templated `route`, guarded within `service` (already guarded:
+        the number of route guards is bounded by the service guard)."""
+        guard = self._routes.get(service)
+        if guard is None:
+            with self._lock:
+                guard = self._routes.setdefault(
+                    service, CardinalityGuard(
+                        self.max_routes_per_service, self.min_count, self.near_cap_min_count
+                    )
+                )
+        return guard.key(template_route(route))
+
+    def stats(self) -> Dict[str, float]:
+        routes = list(self._routes.values())
+        return {
+            "services": self.services.size(),
+            "routes": sum(g.size() for g in routes),
+            "collapsed_services": self.services.collapsed,
+            "collapsed_routes": sum(g.collapsed for g in routes),
+        }
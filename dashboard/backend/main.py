@@ -1,4 +1,5 @@
 import os
+import time
 import logging
 import json
 import asyncio
@@ -9,10 +10,15 @@ from typing import List, Dict, Optional, Any
 from abc import ABC, abstractmethod
 from dotenv import load_dotenv
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Request, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
 
+import profiling
+import self_metrics
+from cardinality import KeyLimiter
+
 import google.generativeai as genai
 
 # Load environment variables
@@ -36,6 +42,68 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# --- KEY CARDINALITY ---
+# Caps on the services / routes that get their own metric series and trace
+# counters; anything past them is stored under "__other__".
+
+series_keys = KeyLimiter(
+    max_services=int(os.getenv("OBSERVEX_MAX_SERVICES", "200")),
+    max_routes_per_service=int(os.getenv("OBSERVEX_MAX_ROUTES_PER_SERVICE", "100")),
+)
+
+# --- SELF METRICS ---
+# Served as Prometheus text at GET /metrics; gauges are read only on scrape.
+
+HTTP_SECONDS = self_metrics.histogram(
+    "observex_http_seconds", "Request handling time", ("method", "route", "status")
+)
+DB_COMMIT_SECONDS = self_metrics.histogram("observex_db_commit_seconds", "SQLite commit time", ("op",))
+BROADCAST_SECONDS = self_metrics.histogram(
+    "observex_ws_broadcast_seconds", "Time to send one message to every WebSocket client", ("type",)
+)
+INGEST_DUPLICATES = self_metrics.counter(
+    "observex_ingest_duplicates_total", "Replayed writes ignored by idempotency keys", ("kind",)
+)
+self_metrics.gauge("observex_cardinality", "Admitted and collapsed service / route keys",
+                   series_keys.stats, ("field",))
+BROADCAST_DROPPED = self_metrics.counter(
+    "observex_ws_dropped_clients_total", "WebSocket clients removed after a failed send"
+)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # Route template, not the raw path, so IDs don't become label values.
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    HTTP_SECONDS.labels(request.method, route, f"{response.status_code // 100}xx").observe(
+        time.perf_counter() - start
+    )
+    return response
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(self_metrics.render(), media_type=self_metrics.CONTENT_TYPE)
+
+# --- ON-DEMAND PROFILING (OBSERVEX_PROFILING=1) ---
+
+if profiling.PROFILING_ENABLED:
+    profiling.install_signal_handler()
+
+@app.post("/api/admin/profile", status_code=202)
+async def start_profile(seconds: float = profiling.DEFAULT_SECONDS):
+    if not profiling.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled (OBSERVEX_PROFILING=1)")
+    if not profiling.start_capture(seconds=seconds):
+        raise HTTPException(status_code=409, detail="A capture is already running")
+    return {"started": True, "seconds": seconds, "dir": profiling.PROFILE_DIR}
+
+@app.get("/api/admin/profile")
+async def profile_status():
+    if not profiling.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled (OBSERVEX_PROFILING=1)")
+    return {"running": profiling.is_running(), "last": profiling.last_result()}
+
 # --- STORAGE LAYER (DAO PATTERN) ---
 
 class TelemetryStorage(ABC):
@@ -44,19 +112,33 @@ class TelemetryStorage(ABC):
     @abstractmethod
     async def get_alerts(self, service: Optional[str] = None, limit: int = 50): pass
     @abstractmethod
+    async def save_incident(self, event: Dict): pass
+    @abstractmethod
+    async def get_incidents(self, service: Optional[str] = None, status: Optional[str] = None,
+                            limit: int = 50): pass
+    @abstractmethod
     async def save_metric(self, metric: Dict): pass
     @abstractmethod
-    async def get_metrics(self, service: str, metric_type: str, limit: int = 60): pass
+    async def get_metrics(self, service: str, metric_type: str, limit: int = 60,
+                          route: Optional[str] = None): pass
     @abstractmethod
     async def save_log(self, log: Dict): pass
     @abstractmethod
     async def get_logs(self, service: Optional[str] = None, severity: Optional[str] = None,
                        trace_id: Optional[str] = None, limit: int = 100): pass
 
+# Trace ids remembered for counter idempotency (older replays count again).
+OBSERVED_TRACES_RETAIN = int(os.getenv("OBSERVEX_OBSERVED_TRACES_RETAIN", "200000"))
+
 class SQLiteStorage(TelemetryStorage):
     def __init__(self, db_path="telemetry.db"):
         self.db_path = db_path
 
+    async def _commit(self, db, op: str):
+        start = time.perf_counter()
+        await db.commit()
+        DB_COMMIT_SECONDS.labels(op).observe(time.perf_counter() - start)
+
     async def init_db(self):
         async with aiosqlite.connect(self.db_path) as db:
             await db.execute("""
@@ -73,7 +155,8 @@ class SQLiteStorage(TelemetryStorage):
                     reasons_json TEXT,
                     ml_scores_json TEXT,
                     rule_flags_json TEXT,
-                    anomaly_type TEXT
+                    anomaly_type TEXT,
+                    trace_index_json TEXT
                 )
             """)
             # Idempotent migrations for pre-existing DBs.
@@ -82,6 +165,7 @@ class SQLiteStorage(TelemetryStorage):
                 "ALTER TABLE alerts ADD COLUMN ml_scores_json TEXT",
                 "ALTER TABLE alerts ADD COLUMN rule_flags_json TEXT",
                 "ALTER TABLE alerts ADD COLUMN anomaly_type TEXT",
+                "ALTER TABLE alerts ADD COLUMN trace_index_json TEXT",
             ):
                 try:
                     await db.execute(col_sql)
@@ -93,9 +177,14 @@ class SQLiteStorage(TelemetryStorage):
                     service TEXT,
                     metric_type TEXT,
                     value REAL,
-                    timestamp TEXT
+                    timestamp TEXT,
+                    route TEXT
                 )
             """)
+            try:
+                await db.execute("ALTER TABLE metrics ADD COLUMN route TEXT")
+            except Exception:
+                pass
             await db.execute("""
                 CREATE TABLE IF NOT EXISTS trace_inventory (
                     trace_id TEXT PRIMARY KEY,
@@ -124,24 +213,75 @@ class SQLiteStorage(TelemetryStorage):
                     anomalous INTEGER NOT NULL DEFAULT 0
                 )
             """)
+            # Idempotency keys for replayed deliveries: one alert per
+            # (trace_id, anomaly_type), one counter increment per trace_id.
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS observed_traces (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    trace_id TEXT NOT NULL UNIQUE
+                )
+            """)
+            has_unique = await (await db.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_alerts_trace_type'"
+            )).fetchone()
+            if not has_unique:
+                # Pre-existing DBs: keep the first of any duplicated alerts.
+                removed = (await db.execute(
+                    "DELETE FROM alerts WHERE id NOT IN "
+                    "(SELECT MIN(id) FROM alerts GROUP BY trace_id, COALESCE(anomaly_type, ''))"
+                )).rowcount
+                if removed:
+                    logger.warning(
+                        f"Removed {removed} duplicate alert row(s) (same trace_id and "
+                        f"anomaly_type) before adding idx_alerts_trace_type"
+                    )
+                await db.execute(
+                    "CREATE UNIQUE INDEX idx_alerts_trace_type ON alerts(trace_id, COALESCE(anomaly_type, ''))"
+                )
+            # Grouped alerts: one row per incident, updated in place by the
+            # processor's open/update/resolve events.
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS incidents (
+                    incident_id TEXT PRIMARY KEY,
+                    service TEXT,
+                    route TEXT,
+                    anomaly_type TEXT,
+                    status TEXT,
+                    opened_at TEXT,
+                    last_seen TEXT,
+                    resolved_at TEXT,
+                    occurrences INTEGER NOT NULL DEFAULT 0,
+                    max_score REAL,
+                    mean_score REAL,
+                    exemplar_trace_ids_json TEXT
+                )
+            """)
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_incidents_service ON incidents(service, last_seen)")
             await db.execute("CREATE INDEX IF NOT EXISTS idx_logs_severity ON logs(severity)")
             await db.execute("CREATE INDEX IF NOT EXISTS idx_alerts_service ON alerts(service)")
-            await db.commit()
+            await self._commit(db, "init")
 
-    async def save_alert(self, alert: Dict):
+    async def save_alert(self, alert: Dict) -> bool:
+        """False (nothing written) if this trace already has an alert of the
+        same anomaly_type."""
         async with aiosqlite.connect(self.db_path) as db:
             spans_json = json.dumps(alert.get("spans", []))
             reasons_json = json.dumps(alert.get("reasons") or [])
             ml_scores_json = json.dumps(alert.get("ml_scores") or {})
             rule_flags_json = json.dumps(alert.get("rule_flags") or {})
             anomaly_type = alert.get("anomaly_type")
-            await db.execute(
-                "INSERT INTO alerts (service, route, anomaly_score, is_anomaly, duration_ms, trace_id, timestamp, spans_json, reasons_json, ml_scores_json, rule_flags_json, anomaly_type) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            trace_index = alert.get("trace_index")
+            trace_index_json = json.dumps(trace_index) if trace_index else None
+            cursor = await db.execute(
+                "INSERT OR IGNORE INTO alerts (service, route, anomaly_score, is_anomaly, duration_ms, trace_id, timestamp, spans_json, reasons_json, ml_scores_json, rule_flags_json, anomaly_type, trace_index_json) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
                 (alert["service"], alert["route"], alert["anomaly_score"], alert["is_anomaly"],
                  alert["duration_ms"], alert["trace_id"], alert["timestamp"], spans_json,
-                 reasons_json, ml_scores_json, rule_flags_json, anomaly_type)
+                 reasons_json, ml_scores_json, rule_flags_json, anomaly_type, trace_index_json)
             )
-            await db.commit()
+            if cursor.rowcount == 0:
+                return False
+            await self._commit(db, "alert")
+            return True
 
     async def get_alerts(self, service: Optional[str] = None, limit: int = 50):
         async with aiosqlite.connect(self.db_path) as db:
@@ -158,29 +298,81 @@ class SQLiteStorage(TelemetryStorage):
                 d["reasons"] = json.loads(d["reasons_json"]) if d.get("reasons_json") else []
                 d["ml_scores"] = json.loads(d["ml_scores_json"]) if d.get("ml_scores_json") else {}
                 d["rule_flags"] = json.loads(d["rule_flags_json"]) if d.get("rule_flags_json") else {}
+                d["trace_index"] = json.loads(d["trace_index_json"]) if d.get("trace_index_json") else None
+                results.append(d)
+            return results
+
+    async def save_incident(self, event: Dict):
+        # Replayed or reordered events never move counts back or reopen a
+        # resolved incident.
+        status = "resolved" if event["event"] == "resolve" else "open"
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute(
+                "INSERT INTO incidents (incident_id, service, route, anomaly_type, status, opened_at, last_seen, resolved_at, occurrences, max_score, mean_score, exemplar_trace_ids_json) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(incident_id) DO UPDATE SET "
+                "status = CASE WHEN incidents.status = 'resolved' THEN 'resolved' ELSE excluded.status END, "
+                "resolved_at = COALESCE(incidents.resolved_at, excluded.resolved_at), "
+                "last_seen = MAX(incidents.last_seen, excluded.last_seen), "
+                "occurrences = MAX(incidents.occurrences, excluded.occurrences), "
+                "max_score = MAX(incidents.max_score, excluded.max_score), "
+                "mean_score = CASE WHEN excluded.occurrences >= incidents.occurrences "
+                "THEN excluded.mean_score ELSE incidents.mean_score END, "
+                "exemplar_trace_ids_json = CASE WHEN excluded.occurrences >= incidents.occurrences "
+                "THEN excluded.exemplar_trace_ids_json ELSE incidents.exemplar_trace_ids_json END",
+                (event["incident_id"], event["service"], event["route"], event.get("anomaly_type"),
+                 status, event["opened_at"], event["last_seen"], event.get("resolved_at"),
+                 event["occurrences"], event["max_score"], event["mean_score"],
+                 json.dumps(event.get("exemplar_trace_ids") or []))
+            )
+            await self._commit(db, "incident")
+
+    async def get_incidents(self, service: Optional[str] = None, status: Optional[str] = None,
+                            limit: int = 50):
+        query, params = "SELECT * FROM incidents WHERE 1=1", []
+        if service and service != "All Services":
+            query += " AND service = ?"
+            params.append(service)
+        if status:
+            query += " AND status = ?"
+            params.append(status)
+        query += " ORDER BY last_seen DESC LIMIT ?"
+        params.append(limit)
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            rows = await (await db.execute(query, params)).fetchall()
+            results = []
+            for row in rows:
+                d = dict(row)
+                d["exemplar_trace_ids"] = json.loads(d.pop("exemplar_trace_ids_json") or "[]")
                 results.append(d)
             return results
 
     async def save_metric(self, metric: Dict):
         async with aiosqlite.connect(self.db_path) as db:
             await db.execute(
-                "INSERT INTO metrics (service, metric_type, value, timestamp) VALUES (?, ?, ?, ?)",
-                (metric["service"], metric["metric_type"], metric["value"], metric["timestamp"])
+                "INSERT INTO metrics (service, metric_type, value, timestamp, route) VALUES (?, ?, ?, ?, ?)",
+                (metric["service"], metric["metric_type"], metric["value"], metric["timestamp"],
+                 metric.get("route"))
             )
-            await db.commit()
+            await self._commit(db, "metric")
 
-    async def get_metrics(self, service: str, metric_type: str, limit: int = 60):
+    async def get_metrics(self, service: str, metric_type: str, limit: int = 60,
+                          route: Optional[str] = None):
+        # Service-level rows have no route; per-route rows only when asked for.
+        route_sql = "route = ?" if route else "route IS NULL"
+        route_params = (route,) if route else ()
         async with aiosqlite.connect(self.db_path) as db:
             db.row_factory = aiosqlite.Row
             if service == "All Services":
                 cursor = await db.execute(
-                    "SELECT * FROM metrics WHERE metric_type = ? ORDER BY id DESC LIMIT ?",
-                    (metric_type, limit)
+                    f"SELECT * FROM metrics WHERE metric_type = ? AND {route_sql} ORDER BY id DESC LIMIT ?",
+                    (metric_type, *route_params, limit)
                 )
             else:
                 cursor = await db.execute(
-                    "SELECT * FROM metrics WHERE service = ? AND metric_type = ? ORDER BY id DESC LIMIT ?",
-                    (service, metric_type, limit)
+                    f"SELECT * FROM metrics WHERE service = ? AND metric_type = ? AND {route_sql} ORDER BY id DESC LIMIT ?",
+                    (service, metric_type, *route_params, limit)
                 )
             rows = await cursor.fetchall()
             return [dict(row) for row in reversed(rows)]
@@ -191,7 +383,7 @@ class SQLiteStorage(TelemetryStorage):
                 "INSERT OR REPLACE INTO trace_inventory (trace_id, duration_ms, spans_json, timestamp) VALUES (?, ?, ?, ?)",
                 (trace["trace_id"], trace["duration_ms"], json.dumps(trace["spans"]), datetime.now(timezone.utc).isoformat())
             )
-            await db.commit()
+            await self._commit(db, "trace")
 
     async def get_trace(self, trace_id: str):
         async with aiosqlite.connect(self.db_path) as db:
@@ -219,6 +411,28 @@ class SQLiteStorage(TelemetryStorage):
             anomaly_count = row[1] if row else 0
             return {"total_traces": total_traces, "anomaly_count": anomaly_count}
 
+    async def observe_trace(self, trace_id: str, services: List[str], is_anomaly: bool) -> bool:
+        """Count a trace once per service, at most once per trace_id (the
+        newest OBSERVED_TRACES_RETAIN ids are remembered). False if it was
+        already counted."""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                "INSERT OR IGNORE INTO observed_traces (trace_id) VALUES (?)", (trace_id,)
+            )
+            if cursor.rowcount == 0:
+                return False
+            await db.executemany(
+                "INSERT INTO trace_counters (service, total, anomalous) VALUES (?, 1, ?) "
+                "ON CONFLICT(service) DO UPDATE SET total = total + 1, anomalous = anomalous + excluded.anomalous",
+                [(svc, 1 if is_anomaly else 0) for svc in services],
+            )
+            await db.execute(
+                "DELETE FROM observed_traces WHERE id < (SELECT MAX(id) - ? FROM observed_traces)",
+                (OBSERVED_TRACES_RETAIN,)
+            )
+            await self._commit(db, "trace_counter")
+            return True
+
     async def increment_trace_counter(self, service: str, is_anomaly: bool):
         async with aiosqlite.connect(self.db_path) as db:
             await db.execute(
@@ -226,7 +440,7 @@ class SQLiteStorage(TelemetryStorage):
                 "ON CONFLICT(service) DO UPDATE SET total = total + 1, anomalous = anomalous + excluded.anomalous",
                 (service, 1 if is_anomaly else 0),
             )
-            await db.commit()
+            await self._commit(db, "trace_counter")
 
     async def save_log(self, log: Dict):
         async with aiosqlite.connect(self.db_path) as db:
@@ -239,7 +453,7 @@ class SQLiteStorage(TelemetryStorage):
             await db.execute("""
                 DELETE FROM logs WHERE id < (SELECT MAX(id) - 1000 FROM logs)
             """)
-            await db.commit()
+            await self._commit(db, "log")
 
     async def get_logs(self, service: Optional[str] = None, severity: Optional[str] = None,
                        trace_id: Optional[str] = None, limit: int = 100):
@@ -265,7 +479,7 @@ class SQLiteStorage(TelemetryStorage):
             rows = await cursor.fetchall()
             return [dict(row) for row in rows]
 
-storage = SQLiteStorage()
+storage = SQLiteStorage(os.getenv("OBSERVEX_DB_PATH", "telemetry.db"))
 
 # --- GEMINI AI ---
 
@@ -303,6 +517,23 @@ class AnomalyEvent(BaseModel):
     ml_scores: Optional[Dict[str, float]] = None
     rule_flags: Optional[Dict[str, Any]] = None
     anomaly_type: Optional[str] = None
+    # Compact TraceIndex from the stream processor (structure of the full
+    # trace, not just the first 20 spans carried in `spans`).
+    trace_index: Optional[Dict[str, Any]] = None
+
+class IncidentEvent(BaseModel):
+    event: str  # open | update | resolve
+    incident_id: str
+    service: str
+    route: str
+    anomaly_type: Optional[str] = None
+    opened_at: str
+    last_seen: str
+    resolved_at: Optional[str] = None
+    occurrences: int
+    max_score: float
+    mean_score: float
+    exemplar_trace_ids: List[str] = []
 
 class TraceInventory(BaseModel):
     trace_id: str
@@ -314,6 +545,7 @@ class MetricUpdate(BaseModel):
     metric_type: str
     value: float
     timestamp: str
+    route: Optional[str] = None
 
 class LogEvent(BaseModel):
     trace_id: str = ""
@@ -326,9 +558,17 @@ class LogEvent(BaseModel):
 # --- REAL-TIME HUB ---
 
 active_connections: List[WebSocket] = []
+_broadcasts_in_flight = 0
+
+self_metrics.gauge("observex_ws_clients", "Connected WebSocket clients", lambda: len(active_connections))
+self_metrics.gauge("observex_ws_broadcasts_in_flight", "Broadcasts still sending to clients",
+                   lambda: _broadcasts_in_flight)
 
 async def broadcast(message: dict):
     """Broadcast a message to all connected WebSocket clients, safely removing dead ones."""
+    global _broadcasts_in_flight
+    _broadcasts_in_flight += 1
+    start = time.perf_counter()
     dead = []
     for connection in active_connections:
         try:
@@ -338,6 +578,9 @@ async def broadcast(message: dict):
     for d in dead:
         if d in active_connections:
             active_connections.remove(d)
+            BROADCAST_DROPPED.inc()
+    _broadcasts_in_flight -= 1
+    BROADCAST_SECONDS.labels(message.get("type", "unknown")).observe(time.perf_counter() - start)
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
@@ -356,13 +599,32 @@ async def websocket_endpoint(websocket: WebSocket):
 @app.post("/api/alerts")
 async def receive_alert(event: AnomalyEvent):
     event_dict = event.model_dump()
-    await storage.save_alert(event_dict)
+    if not await storage.save_alert(event_dict):
+        INGEST_DUPLICATES.labels("alert").inc()
+        return {"status": "duplicate"}
     await broadcast({"type": "new_anomaly", "data": event_dict})
     return {"status": "ok"}
 
+@app.post("/api/incidents")
+async def receive_incident(event: IncidentEvent):
+    if event.event not in ("open", "update", "resolve"):
+        raise HTTPException(status_code=422, detail="event must be open, update or resolve")
+    event_dict = event.model_dump()
+    await storage.save_incident(event_dict)
+    await broadcast({"type": "incident_update", "data": event_dict})
+    return {"status": "ok"}
+
+@app.get("/api/incidents")
+async def get_incidents(service: Optional[str] = None, status: Optional[str] = None,
+                        limit: int = 50):
+    return await storage.get_incidents(service=service, status=status, limit=limit)
+
 @app.post("/api/metrics")
 async def receive_metric(metric: MetricUpdate):
     metric_dict = metric.model_dump()
+    metric_dict["service"] = series_keys.service(metric_dict["service"])
+    if metric_dict.get("route"):
+        metric_dict["route"] = series_keys.route(metric_dict["service"], metric_dict["route"])
     await storage.save_metric(metric_dict)
     await broadcast({"type": "metric_update", "data": metric_dict})
     return {"status": "ok"}
@@ -376,9 +638,16 @@ async def get_stats(service: Optional[str] = None):
     return await storage.get_stats(service=service)
 
 @app.post("/api/trace_observed")
-async def observe_trace(payload: Dict):
-    services = payload.get("services", [])
+async def observe_trace(payload: Dict, idempotency_key: Optional[str] = Header(None)):
+    services = sorted({series_keys.service(svc) for svc in payload.get("services", [])})
     is_anomaly = bool(payload.get("is_anomaly", False))
+    # The trace_id (or an Idempotency-Key header) makes replays no-ops.
+    key = payload.get("trace_id") or idempotency_key
+    if key:
+        if not await storage.observe_trace(key, services, is_anomaly):
+            INGEST_DUPLICATES.labels("trace_observed").inc()
+            return {"status": "duplicate"}
+        return {"status": "ok"}
     for svc in services:
         await storage.increment_trace_counter(svc, is_anomaly)
     return {"status": "ok"}
@@ -396,8 +665,8 @@ async def get_trace(trace_id: str):
     return trace
 
 @app.get("/api/metrics/{service}/{metric_type}")
-async def get_metrics_ts(service: str, metric_type: str):
-    return await storage.get_metrics(service, metric_type)
+async def get_metrics_ts(service: str, metric_type: str, route: Optional[str] = None):
+    return await storage.get_metrics(service, metric_type, route=route)
 
 @app.post("/api/logs")
 async def receive_log(event: LogEvent):
@@ -411,6 +680,33 @@ async def get_logs(service: Optional[str] = None, severity: Optional[str] = None
     return await storage.get_logs(service=service, severity=severity,
                                    trace_id=trace_id, limit=limit)
 
+def _index_from_spans(spans: List[Dict]) -> Dict:
+    """Same shape as the processor's TraceIndex.compact(), built from the
+    spans an alert carries (used for alerts stored before trace_index)."""
+    span_ids = {s.get("span_id") for s in spans if s.get("span_id")}
+    edges, dangling, services = [], [], {}
+    for s in spans:
+        parent = s.get("parent_span_id") or ""
+        sid = s.get("span_id") or ""
+        label = f"{s.get('service') or '?'}::{s.get('name') or '?'}"
+        if parent and parent in span_ids:
+            edges.append([parent, sid, label])
+        elif parent:
+            dangling.append([sid, label, parent])
+        svc = services.setdefault(s.get("service", "?"), {"spans": 0})
+        svc["spans"] += 1
+    durations = [s.get("duration_ms", 0) for s in spans]
+    return {
+        "span_count": len(spans),
+        "slow_span_count": sum(1 for s in spans if s.get("is_anomaly")),
+        "min_span_ms": min(durations) if durations else 0,
+        "max_span_ms": max(durations) if durations else 0,
+        "avg_span_ms": sum(durations) / len(durations) if durations else 0,
+        "edges": edges,
+        "dangling": dangling,
+        "services": services,
+    }
+
 @app.post("/api/rca/{trace_id}")
 async def analyze_trace(trace_id: str, event: AnomalyEvent):
     if not model:
@@ -428,38 +724,47 @@ async def analyze_trace(trace_id: str, event: AnomalyEvent):
     timestamp = event.timestamp
     spans = [s.model_dump() for s in (event.spans or [])]
 
-    # ── Span statistics ─────────────────────────────────────────────
-    span_count = len(spans)
-    error_spans = [s for s in spans if s.get("is_anomaly")]
-    error_count = len(error_spans)
-    unique_services = list({s.get("service", "?") for s in spans})
-    durations = [s.get("duration_ms", 0) for s in spans]
-    max_span_dur = max(durations) if durations else 0
-    min_span_dur = min(durations) if durations else 0
-    avg_span_dur = sum(durations) / len(durations) if durations else 0
-
-    # ── Dependency chain (parent → child relationships) ─────────────
-    span_ids = {s.get("span_id") or "" for s in spans if s.get("span_id")}
-    dep_chain_lines = []
-    dangling_parents = []
-    for s in spans:
-        parent = s.get("parent_span_id") or ""
-        sid = s.get("span_id") or ""
-        svc = s.get("service") or "?"
-        name = s.get("name") or "?"
-        if parent and parent in span_ids:
-            dep_chain_lines.append(f"  {parent[:8]}… → {sid[:8]}… ({svc}::{name})")
-        elif parent and parent not in span_ids:
-            dangling_parents.append(f"  ⚠ {sid[:8]}… ({svc}::{name}) references missing parent {parent[:8]}…")
+    # ── Span statistics + dependency chain ──────────────────────────
+    # Prefer the processor's TraceIndex; rebuild from the carried spans
+    # only for alerts that predate it.
+    index = event.trace_index or _index_from_spans(spans)
+    span_count = index["span_count"]
+    error_count = index["slow_span_count"]
+    unique_services = list(index["services"])
+    max_span_dur = index["max_span_ms"]
+    min_span_dur = index["min_span_ms"]
+    avg_span_dur = index["avg_span_ms"]
+
+    dep_chain_lines = [
+        f"  {parent[:8]}… → {sid[:8]}… ({label})" for parent, sid, label in index["edges"]
+    ]
+    dangling_parents = [
+        f"  ⚠ {sid[:8]}… ({label}) references missing parent {parent[:8]}…"
+        for sid, label, parent in index["dangling"]
+    ]
     dep_block = "\n".join(dep_chain_lines[:15]) if dep_chain_lines else "  (no parent-child links found)"
     dangling_block = "\n".join(dangling_parents) if dangling_parents else "  (none)"
 
+    # ── Latency attribution (critical path / self time) ─────────────
+    attribution = index.get("attribution") or {}
+    attribution_lines = [
+        f"  - {svc}: critical={agg['critical_ms']:.0f}ms self={agg['self_ms']:.0f}ms"
+        for svc, agg in sorted(attribution.get("services", {}).items(),
+                               key=lambda kv: kv[1]["critical_ms"], reverse=True)
+    ]
+    attribution_lines += [
+        f"  → {label} on critical path for {ms:.0f}ms" for _, label, ms in attribution.get("path", [])
+    ]
+    attribution_block = "\n".join(attribution_lines) or "  (no attribution; span timings unavailable)"
+
     # ── Rule detectors (human-readable) ─────────────────────────────
     fired_detectors = []
     if rule_flags.get("n_plus_1"):
+        operation = rule_flags.get("n_plus_1_operation")
         fired_detectors.append(
-            f"N+1 Query Regression — span_count={rule_flags.get('n_plus_1_count', 0)} "
-            "(Chebyshev bound on rolling span-count distribution)"
+            f"N+1 Query Regression — fan-out=×{rule_flags.get('n_plus_1_count', 0)}"
+            + (f" of '{operation}' under one parent" if operation else "")
+            + " (Chebyshev bound on rolling fan-out distribution)"
         )
     if rule_flags.get("bimodal_latency"):
         fired_detectors.append(
@@ -542,6 +847,9 @@ DEPENDENCY CHAIN (parent → child):
 DANGLING PARENTS (dependency breaks):
 {dangling_block}
 
+LATENCY ATTRIBUTION (critical path {attribution.get('critical_path_ms', 0.0):.0f}ms):
+{attribution_block}
+
 ═══════════════════════════════════════════
 RULE DETECTORS FIRED
 ═══════════════════════════════════════════
@@ -0,0 +1,206 @@
+"""Self-instrumentation counters and histograms in Prometheus text format.
+
+Vendored from stream-processor/self_metrics.py without its standalone
+listener (`serve`, `add_route`): the app serves `render()` from its own
+GET /metrics. Keep the two copies in step.
+
+Recording is a cached dict lookup and an add under a per-series lock;
+nothing is formatted until a scrape, and gauges are callbacks evaluated
+only then. No dependency on prometheus_client; the output is the 0.0.4
+text format.
+"""
+import bisect
+import logging
+import threading
+from typing import Callable, Dict, Iterable, Tuple
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds, 100µs .. 10s.
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_str(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _CounterChild:
+    __slots__ = ("_lock", "value")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ("_lock", "_bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self._lock = threading.Lock()
+        self._bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last: +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self._bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def render(self):
+        lines = self._header()
+        for values, child in list(self._children.items()):
+            lines.append(f"{self.name}{_label_str(self.labelnames, values)} {_num(child.value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def render(self):
+        lines = self._header()
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts, total, count = list(child.counts), child.sum, child.count
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = _label_str(self.labelnames, values, f'le="{_num(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _label_str(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_num(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Read at scrape time from `fn`: a number, or {label values: number}.
+    Returning None omits the series (e.g. while a component is starting)."""
+    kind = "gauge"
+
+    def __init__(self, name, help_text, fn: Callable, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self.fn = fn
+
+    def render(self):
+        try:
+            value = self.fn()
+        except Exception as e:
+            logger.debug(f"Gauge {self.name} failed: {e}")
+            value = None
+        if value is None:
+            return []
+        lines = self._header()
+        if isinstance(value, dict):
+            for values, v in value.items():
+                values = values if isinstance(values, tuple) else (values,)
+                lines.append(f"{self.name}{_label_str(self.labelnames, values)} {_num(v)}")
+        else:
+            lines.append(f"{self.name} {_num(value)}")
+        return lines
+
+
+class Registry:
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            # Re-registering returns the existing metric (modules reloaded by
+            # tooling, or two modules sharing a series).
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help_text, labelnames=()) -> Counter:
+    return REGISTRY.register(Counter(name, help_text, labelnames))
+
+
+def histogram(name, help_text, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help_text, labelnames, buckets))
+
+
+def gauge(name, help_text, fn, labelnames=()) -> Gauge:
+    return REGISTRY.register(Gauge(name, help_text, fn, labelnames))
+
+
+def render() -> str:
+    return REGISTRY.render()
+
@@ -69,6 +69,32 @@ const RULE_PILLS = [
   { key: "dependency_break", label: "Dangling Parent",  metaKey: "dangling_span",    fmt: (v) => v ? `@${v}` : null, color: "red" },
   { key: "pii_density",      label: "PII Density",      metaKey: "redaction_ratio",  fmt: (v) => v > 0 ? `${Math.round(v * 100)}%` : null, color: "purple" },
 ];
+// Folds one incident_update event into the incident list the way the
+// backend stores it: replayed or reordered events never move counts back or
+// reopen a resolved incident.
+function mergeIncident(prev, event) {
+  const incoming = { ...event, status: event.event === "resolve" ? "resolved" : "open" };
+  delete incoming.event;
+  const current = prev.find(i => i.incident_id === incoming.incident_id);
+  let merged = incoming;
+  if (current) {
+    const newer = incoming.occurrences >= current.occurrences;
+    merged = {
+      ...current,
+      status: current.status === "resolved" ? "resolved" : incoming.status,
+      resolved_at: current.resolved_at || incoming.resolved_at,
+      last_seen: incoming.last_seen > current.last_seen ? incoming.last_seen : current.last_seen,
+      occurrences: Math.max(current.occurrences, incoming.occurrences),
+      max_score: Math.max(current.max_score, incoming.max_score),
+      mean_score: newer ? incoming.mean_score : current.mean_score,
+      exemplar_trace_ids: newer ? incoming.exemplar_trace_ids : current.exemplar_trace_ids,
+    };
+  }
+  return [merged, ...prev.filter(i => i.incident_id !== incoming.incident_id)]
+    .sort((a, b) => (a.last_seen < b.last_seen ? 1 : -1))
+    .slice(0, 50);
+}
+
 const PILL_COLOR = {
   orange: "bg-orange-500/10 text-orange-300 border-orange-500/30",
   amber:  "bg-amber-500/10 text-amber-300 border-amber-500/30",
@@ -78,6 +104,7 @@ const PILL_COLOR = {
 
 export default function App() {
   const [anomalies, setAnomalies] = useState([]);
+  const [incidents, setIncidents] = useState([]);
   const [stats, setStats] = useState({ total_traces: 0, anomaly_count: 0 });
   const [statsHistory, setStatsHistory] = useState([]);
   const [metrics, setMetrics] = useState([]);
@@ -126,6 +153,11 @@ export default function App() {
       const alertData = await alertRes.json();
       setAnomalies(alertData);
 
+      fetch(`${BACKEND_URL}/api/incidents?service=${encodeURIComponent(selectedService)}`)
+        .then(r => r.ok ? r.json() : [])
+        .then(setIncidents)
+        .catch(() => {});
+
       fetch(`${BACKEND_URL}/api/stats`)
         .then(r => r.ok ? r.json() : null)
         .then(s => {
@@ -199,6 +231,8 @@ export default function App() {
               }
             })
             .catch(() => {});
+        } else if (msg.type === "incident_update") {
+          setIncidents(prev => mergeIncident(prev, msg.data));
         } else if (msg.type === "metric_update") {
           setMetrics(prev => [...prev, msg.data].slice(-60));
         } else if (msg.type === "history") {
@@ -270,6 +304,7 @@ export default function App() {
           reasons: selectedTrace?.reasons,
           rule_flags: selectedTrace?.rule_flags,
           ml_scores: selectedTrace?.ml_scores,
+          trace_index: selectedTrace?.trace_index,
           spans: (traceContext.spans || []).map(s => ({
             name: s.name || "unknown",
             service: s.service || "unknown",
@@ -394,6 +429,39 @@ export default function App() {
     return filtered;
   }, [anomalies, anomaliesOnly, searchQuery]);
 
+  // Open incidents first, then recently resolved ones; the WS feed is
+  // unfiltered, so apply the service selection here as well.
+  const visibleIncidents = useMemo(() => {
+    let filtered = incidents;
+    if (selectedService !== "All Services") {
+      filtered = filtered.filter(i => i.service === selectedService);
+    }
+    if (searchQuery.trim()) {
+      const q = searchQuery.toLowerCase();
+      filtered = filtered.filter(i =>
+        (i.service || "").toLowerCase().includes(q) ||
+        (i.route || "").toLowerCase().includes(q) ||
+        (i.exemplar_trace_ids || []).some(t => t.toLowerCase().includes(q))
+      );
+    }
+    return [...filtered].sort((a, b) => (a.status === "open") === (b.status === "open") ? 0 : a.status === "open" ? -1 : 1);
+  }, [incidents, selectedService, searchQuery]);
+
+  // An exemplar opens like an alert row: the alert itself if it is loaded,
+  // otherwise the incident's context for that trace.
+  const openExemplar = (incident, traceId) => {
+    const alert = anomalies.find(a => a.trace_id === traceId);
+    runRCA(alert || {
+      trace_id: traceId,
+      service: incident.service,
+      route: incident.route,
+      anomaly_type: incident.anomaly_type,
+      anomaly_score: incident.max_score,
+      is_anomaly: true,
+      timestamp: incident.last_seen,
+    });
+  };
+
   // Sync metrics when mode/service changes
   useEffect(() => {
     fetchHistory();
@@ -565,6 +633,25 @@ export default function App() {
         {/* Incident Stream */}
         <div className="grid grid-cols-1 lg:grid-cols-2 gap-8">
           <div>
+            <h3 className="text-lg font-bold mb-4 flex items-center gap-2">
+              <Zap className="w-5 h-5 text-rose-400" />
+              Active Incidents
+              <span className="text-[10px] font-black text-slate-500 uppercase tracking-widest">
+                {visibleIncidents.filter(i => i.status === "open").length} open
+              </span>
+            </h3>
+            <div className="space-y-3 max-h-[320px] overflow-y-auto custom-scrollbar pr-1 mb-8">
+              {visibleIncidents.length === 0 ? (
+                <div className="text-center py-6 text-slate-600 text-sm">
+                  No grouped incidents. Repeated anomalies on one route are folded into one here.
+                </div>
+              ) : (
+                visibleIncidents.map(incident => (
+                  <IncidentRow key={incident.incident_id} incident={incident} onExemplar={(traceId) => openExemplar(incident, traceId)} />
+                ))
+              )}
+            </div>
+
             <h3 className="text-lg font-bold mb-4 flex items-center gap-2">
               <AlertTriangle className="w-5 h-5 text-orange-400" />
               Historical Incident Stream
@@ -1113,6 +1200,53 @@ function AnomalyRow({ item, onClick }) {
   );
 }
 
+function IncidentRow({ incident, onExemplar }) {
+  const style = styleFor(incident.anomaly_type);
+  const open = incident.status === "open";
+  return (
+    <div className={cn("bg-slate-900/40 p-3 rounded-xl border transition-all", open ? "border-slate-700" : "border-slate-800/50 opacity-60")}>
+      <div className="flex items-center justify-between gap-4">
+        <div className="flex items-center gap-4 min-w-0">
+          <div className={cn("w-2 h-8 rounded-full flex items-center justify-center", style.bg)}>
+            <div className={cn("w-1.5 h-1.5 rounded-full", style.dot, open && "animate-pulse")} />
+          </div>
+          <div className="min-w-0">
+            <div className="flex items-center gap-2 flex-wrap">
+              <div className="text-sm font-bold text-slate-200 truncate">{incident.service} <span className="text-slate-500 font-medium">→ {incident.route}</span></div>
+              {incident.anomaly_type && (
+                <span className={cn("text-[9px] font-bold uppercase tracking-wider px-1.5 py-0.5 rounded border", style.text, style.bg, style.border)}>
+                  {incident.anomaly_type}
+                </span>
+              )}
+            </div>
+            <div className="text-[10px] text-slate-500 font-mono">
+              {open ? "open" : "resolved"} • since {new Date(incident.opened_at).toLocaleTimeString()} • last {new Date(incident.last_seen).toLocaleTimeString()}
+            </div>
+          </div>
+        </div>
+        <div className="text-right flex-shrink-0">
+          <div className="text-sm font-black text-rose-500">×{incident.occurrences}</div>
+          <div className="text-[9px] text-slate-500 font-mono">max {(incident.max_score ?? 0).toFixed(2)}</div>
+        </div>
+      </div>
+      {(incident.exemplar_trace_ids || []).length > 0 && (
+        <div className="flex flex-wrap gap-1.5 mt-2 pl-6">
+          {incident.exemplar_trace_ids.map(traceId => (
+            <button
+              key={traceId}
+              onClick={() => onExemplar(traceId)}
+              className="text-[9px] font-mono px-1.5 py-0.5 rounded border border-slate-700 text-slate-400 hover:text-white hover:border-indigo-500/50 transition-colors"
+              title="Investigate this trace"
+            >
+              #{traceId.slice(0, 12)}
+            </button>
+          ))}
+        </div>
+      )}
+    </div>
+  );
+}
+
 function PIIRedactionPanel({ backendUrl }) {
   const [series, setSeries] = useState({ "api-gateway": [], "python-service": [] });
 
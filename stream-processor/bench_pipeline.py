@@ -0,0 +1,250 @@
+"""End-to-end benchmark of the real detection dataflow.
+
+Builds `dataflow.build_flow` over a Bytewax TestingSource fed from
+otlp_synth (trigger_traffic.py's normal / N+1 / bimodal / PII mix, traces
+plus their logs) and captures the output in memory: scored traces through
+a timestamping sink, dashboard POSTs through `dataflow.dashboard_sink`.
+Nothing talks to RabbitMQ or the backend.
+
+Each (workers, batch size) run reports traces/s and spans/s over the wall
+time of the run, and end-to-end latency percentiles from the moment a trace
+payload leaves the source (or was due to, with --rate) to the moment its
+verdict reaches the sink. Latency includes the trace window
+(OBSERVEX_TRACE_WINDOW_SEC, 1s here unless set) and the scoring batch
+timeout, as in production.
+
+Usage:
+    python bench_pipeline.py
+    python bench_pipeline.py --traces 20000 --workers 1 2 4 --batch 64 256 1024
+    python bench_pipeline.py --rate 2000 --json run.json --baseline baseline.json
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+import argparse
+import platform
+import threading
+from collections import Counter
+
+# Before dataflow is imported: short trace windows, snapshots kept out of
+# the working tree, no metrics listener, no replay dedup.
+os.environ.setdefault("OBSERVEX_TRACE_WINDOW_SEC", "1")
+os.environ.setdefault("OBSERVEX_SNAPSHOT_DIR", tempfile.mkdtemp(prefix="observex-bench-"))
+os.environ.setdefault("OBSERVEX_SNAPSHOT_INTERVAL_SEC", "1e9")
+os.environ.setdefault("OBSERVEX_METRICS_PORT", "0")
+os.environ.setdefault("OBSERVEX_DEDUP_CAPACITY", "0")  # every run replays the same ids
+
+import bytewax
+from bytewax.outputs import DynamicSink, StatelessSinkPartition
+from bytewax.testing import TestingSource, cluster_main, run_main
+
+import dataflow
+import otlp_synth
+
+PERCENTILES = (50, 95, 99)
+
+
+class _Capture:
+    """Verdict arrival times and dashboard POST counts for one run."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sent = {}       # trace_id -> perf_counter when (due to be) sent
+        self.done = {}       # trace_id -> perf_counter at the sink
+        self.anomalies = Counter()  # reason -> flagged traces
+        self.posts = Counter()
+
+    def dashboard(self, path, payload):
+        with self.lock:
+            self.posts[path] += 1
+
+
+class _CapturePartition(StatelessSinkPartition):
+
+    def __init__(self, capture):
+        self._capture = capture
+
+    def write_batch(self, items):
+        now = time.perf_counter()
+        with self._capture.lock:
+            for _, (trace_id, _, _, verdict) in items:
+                self._capture.done[trace_id] = now
+                if verdict["is_anomaly"]:
+                    self._capture.anomalies.update(verdict["reasons"])
+
+
+class CaptureSink(DynamicSink):
+
+    def __init__(self, capture):
+        self._capture = capture
+
+    def build(self, step_id, worker_index, worker_count):
+        return _CapturePartition(self._capture)
+
+
+def make_input(traces, seed):
+    """[(payload, trace_id or None for log payloads)] and the span count."""
+    items, spans = [], 0
+    for payload, _ in otlp_synth.generate(traces, seed=seed, mix=otlp_synth.TRAFFIC_MIX, logs=True):
+        if "resourceSpans" in payload:
+            rs = payload["resourceSpans"]
+            spans += sum(len(ss["spans"]) for r in rs for ss in r["scopeSpans"])
+            items.append((payload, rs[0]["scopeSpans"][0]["spans"][0]["traceId"]))
+        else:
+            items.append((payload, None))
+    return items, spans
+
+
+def feed(items, capture, rate):
+    # Open loop with --rate: latency counts from when a trace was due, so a
+    # stalled source shows up in the percentiles instead of hiding.
+    start = time.perf_counter()
+    n = 0
+    for payload, trace_id in items:
+        if trace_id is not None:
+            due = now = time.perf_counter()
+            if rate:
+                due = start + n / rate
+                if due > now:
+                    time.sleep(due - now)
+            n += 1
+            capture.sent[trace_id] = due
+        yield payload
+
+
+def percentile(ordered, q):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100.0))]
+
+
+def run_once(items, spans, workers, batch, rate, source_batch):
+    capture = _Capture()
+    dataflow.dashboard_sink = capture.dashboard
+    flow = dataflow.build_flow(
+        TestingSource(feed(items, capture, rate), batch_size=source_batch),
+        trace_sink=CaptureSink(capture),
+        score_batch_max=batch,
+    )
+    start = time.perf_counter()
+    if workers == 1:
+        run_main(flow)
+    else:
+        cluster_main(flow, [], 0, worker_count_per_proc=workers)
+    wall_s = time.perf_counter() - start
+    dataflow.dashboard_sink = None
+
+    latencies = sorted(
+        (capture.done[tid] - sent) * 1000.0
+        for tid, sent in capture.sent.items() if tid in capture.done
+    )
+    traces = len(capture.done)
+    return {
+        "workers": workers,
+        "batch": batch,
+        "traces_in": len(capture.sent),
+        "traces_out": traces,
+        "spans": spans,
+        "wall_s": wall_s,
+        "traces_per_s": traces / wall_s if wall_s else 0.0,
+        "spans_per_s": spans / wall_s if wall_s else 0.0,
+        "latency_ms": dict(
+            {f"p{q}": percentile(latencies, q) for q in PERCENTILES},
+            max=latencies[-1] if latencies else 0.0,
+        ),
+        "anomalies": dict(capture.anomalies),
+        "dashboard_posts": dict(capture.posts),
+    }
+
+
+def compare(runs, baseline_path, tolerance):
+    """Print throughput / p99 deltas against a previous run; returns the
+    configurations whose throughput dropped by more than `tolerance`."""
+    with open(baseline_path) as f:
+        baseline = {(r["workers"], r["batch"]): r for r in json.load(f)["runs"]}
+    regressions = []
+    print(f"\nvs {baseline_path}:")
+    for run in runs:
+        base = baseline.get((run["workers"], run["batch"]))
+        if base is None or not base["traces_per_s"]:
+            continue
+        tput = run["traces_per_s"] / base["traces_per_s"] - 1.0
+        p99 = run["latency_ms"]["p99"] - base["latency_ms"]["p99"]
+        flag = tput < -tolerance
+        print(f"  w={run['workers']} batch={run['batch']:5d}  traces/s {tput:+7.1%}"
+              f"  p99 {p99:+9.1f}ms" + ("  REGRESSION" if flag else ""))
+        if flag:
+            regressions.append((run["workers"], run["batch"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--traces", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--batch", type=int, nargs="+", default=[64, 256, 1024],
+                        help="Per-service scoring batch sizes (SCORE_BATCH_MAX)")
+    parser.add_argument("--rate", type=float, default=0.0,
+                        help="Offered load in traces/s (default: as fast as the source runs); "
+                             "pacing sleeps on the worker that reads the source")
+    parser.add_argument("--source-batch", type=int, default=16,
+                        help="Payloads per TestingSource batch")
+    parser.add_argument("--warmup", type=int, default=500, help="Traces in an unrecorded first run")
+    parser.add_argument("--ml-timeout", type=float, default=300.0,
+                        help="Seconds to wait for the ML ensemble before benchmarking")
+    parser.add_argument("--json", metavar="PATH", help="Write results as JSON")
+    parser.add_argument("--baseline", metavar="PATH", help="Compare against a previous --json run")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Throughput drop vs --baseline reported as a regression")
+    args = parser.parse_args()
+
+    if not dataflow.wait_for_ml(args.ml_timeout):
+        print("ML ensemble not ready; benchmarking rules-only scoring.", file=sys.stderr)
+    items, spans = make_input(args.traces, args.seed)
+    if args.warmup:
+        warm, warm_spans = make_input(args.warmup, args.seed + 1)
+        run_once(warm, warm_spans, 1, args.batch[0], 0.0, args.source_batch)
+
+    runs = []
+    print(f"{args.traces} traces ({spans} spans), trace window {dataflow.TRACE_WINDOW_SEC:g}s")
+    for workers in args.workers:
+        for batch in args.batch:
+            run = run_once(items, spans, workers, batch, args.rate, args.source_batch)
+            runs.append(run)
+            lat = run["latency_ms"]
+            print(f"  w={workers} batch={batch:5d}  {run['traces_per_s']:8,.0f} traces/s"
+                  f"  {run['spans_per_s']:9,.0f} spans/s"
+                  f"  p50 {lat['p50']:7.1f}ms  p95 {lat['p95']:7.1f}ms  p99 {lat['p99']:7.1f}ms"
+                  + ("" if run["traces_out"] == run["traces_in"]
+                     else f"  ({run['traces_in'] - run['traces_out']} traces missing)"))
+
+    result = {
+        "config": {
+            "traces": args.traces,
+            "seed": args.seed,
+            "rate": args.rate,
+            "source_batch": args.source_batch,
+            "trace_window_sec": dataflow.TRACE_WINDOW_SEC,
+            "ml_pool": dataflow.ml_pool_stats(),
+        },
+        "env": {
+            "python": platform.python_version(),
+            "bytewax": getattr(bytewax, "__version__", None),
+            "cpus": os.cpu_count(),
+            "platform": platform.platform(),
+        },
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "runs": runs,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.baseline and compare(runs, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Benchmark ML warmup: row-by-row learn_one replay vs. bulk learn_many.
+
+Usage:
+    python bench_warmup.py                       # synthetic_telemetry.jsonl, else generated
+    python bench_warmup.py --corpus path.jsonl
+    python bench_warmup.py --rows 5000           # generated log-normal corpus
+"""
+import os
+import time
+import argparse
+
+# Row-by-row replay is timed with inline fits (the pre-pool behaviour);
+# must be set before ml_scorer is imported.
+os.environ.setdefault("OBSERVEX_RETRAIN_WORKERS", "0")
+
+import numpy as np
+
+from ml_scorer import ObserveXScorer, load_corpus_matrix
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), "synthetic_telemetry.jsonl")
+# Rows generated when the corpus is missing (it is not checked in).
+FALLBACK_ROWS = 5000
+
+
+def bench_learn_one(X):
+    scorer = ObserveXScorer()
+    start = time.perf_counter()
+    for d, c, e in X.tolist():
+        scorer.learn_one({"duration_ms": d, "span_count": c, "error_rate": e})
+    scorer.wait_for_retrain()
+    return time.perf_counter() - start, scorer
+
+
+def bench_learn_many(X):
+    scorer = ObserveXScorer()
+    start = time.perf_counter()
+    scorer.learn_many(X)
+    return time.perf_counter() - start, scorer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--rows", type=int, default=0,
+                        help="Generate N log-normal rows instead of reading --corpus")
+    args = parser.parse_args()
+
+    rows = args.rows
+    if rows <= 0 and not os.path.exists(args.corpus):
+        print(f"Corpus not found at {args.corpus}; generating {FALLBACK_ROWS} rows instead.")
+        rows = FALLBACK_ROWS
+
+    if rows > 0:
+        rng = np.random.default_rng(42)
+        d = rng.lognormal(mean=np.log(120), sigma=0.5, size=rows)
+        X = np.column_stack([d, np.ones_like(d), np.zeros_like(d)])
+        source = f"{rows} generated rows"
+    else:
+        start = time.perf_counter()
+        X = load_corpus_matrix(args.corpus)
+        source = f"{args.corpus} ({len(X)} rows, loaded in {(time.perf_counter() - start) * 1000:.0f}ms)"
+
+    print(f"Corpus: {source}")
+    one_s, one = bench_learn_one(X)
+    many_s, many = bench_learn_many(X)
+    print(f"  learn_one replay: {one_s * 1000:9.1f}ms  retrains={one.retrain_stats()['retrains']}")
+    print(f"  learn_many bulk:  {many_s * 1000:9.1f}ms  retrains={many.retrain_stats()['retrains']}")
+    if many_s > 0:
+        print(f"  speedup:          {one_s / many_s:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,155 +1,458 @@
 import os
-import json
 import time
+import atexit
+import signal
 import logging
+import threading
 import httpx
 from datetime import datetime, timedelta, timezone
+from urllib.parse import quote
 from bytewax import operators as op
 from bytewax.dataflow import Dataflow
 from bytewax.connectors.stdio import StdOutSink
 from bytewax.operators import windowing as win
 from bytewax.operators.windowing import SystemClock, TumblingWindower
 
+import profiling
+import self_metrics
+from cardinality import KeyLimiter
+from dedup import RecentCloses, SeenTraces
+from incidents import IncidentAggregator
 from rabbit_source import RabbitSource
 from telemetry_parser import parse_trace, parse_log
-from ml_scorer import ObserveXScorer
+from trace_index import TraceIndex
+from trace_assembly import (
+    get_trace_id_key,
+    build_full_trace,
+    fold_full_trace,
+    merge_full_trace,
+)
 from detectors import (
     extract_features,
-    CompositeScorer,
-    RuleDetectorScorer,
-    MLScorer,
+    ServiceDetectorState,
     PIIDensityDetector,
+    RedactionMatcher,
+    DEFAULT_REDACTION_TOKENS,
     build_rule_flags,
     classify_anomaly,
 )
 
 # Configuration
 DASHBOARD_URL = "http://localhost:8000"
-SPAN_ANOMALY_MS = 500.0  # cosmetic per-span flag; trace-level verdict comes from scorer
 WARMUP_JSONL = os.getenv(
     "OBSERVEX_WARMUP_JSONL",
     os.path.join(os.path.dirname(__file__), "synthetic_telemetry.jsonl"),
 )
+# Comma-separated override of the collector's redaction tokens.
+REDACTION_TOKENS = tuple(
+    t.strip() for t in os.getenv("OBSERVEX_REDACTION_TOKENS", "").split(",") if t.strip()
+) or DEFAULT_REDACTION_TOKENS
+SNAPSHOT_DIR = os.getenv(
+    "OBSERVEX_SNAPSHOT_DIR",
+    os.path.join(os.path.dirname(__file__), "snapshots"),
+)
+SNAPSHOT_INTERVAL_SEC = float(os.getenv("OBSERVEX_SNAPSHOT_INTERVAL_SEC", "300"))
+# ML ensemble pooling: "global" (one shared ensemble), "service" or
+# "service_route" (per-key ensembles, LRU-evicted under the memory budget).
+ML_POOL_MODE = os.getenv("OBSERVEX_ML_POOL", "service")
+ML_POOL_BUDGET_MB = float(os.getenv("OBSERVEX_ML_POOL_BUDGET_MB", "512"))
+ML_POOL_MAX_MODELS = int(os.getenv("OBSERVEX_ML_POOL_MAX_MODELS", "64"))
+ML_POOL_MIN_TRACES = int(os.getenv("OBSERVEX_ML_POOL_MIN_TRACES", "50"))
+# Spans of one trace are assembled within a tumbling window of this length.
+TRACE_WINDOW_SEC = float(os.getenv("OBSERVEX_TRACE_WINDOW_SEC", "10"))
+REDACTION_WINDOW_SEC = 5  # matches the PII panel's poll interval
+ATTRIBUTION_WINDOW_SEC = 10
+# Traces closed by one tumbling window arrive together; collect them per
+# service into one scoring batch.
+SCORE_BATCH_TIMEOUT = timedelta(milliseconds=500)
+SCORE_BATCH_MAX = 256
+# Replay protection: trace ids already scored are remembered for one to two
+# windows (capacity ids per window at the given false-positive rate, which
+# is also the chance of dropping a genuine trace). Capacity 0 disables.
+DEDUP_CAPACITY = int(os.getenv("OBSERVEX_DEDUP_CAPACITY", "1000000"))
+DEDUP_ERROR_RATE = float(os.getenv("OBSERVEX_DEDUP_ERROR_RATE", "1e-4"))
+DEDUP_WINDOW_SEC = float(os.getenv("OBSERVEX_DEDUP_WINDOW_SEC", "3600"))
+# Alerts for one (service, route, anomaly_type) are grouped into an incident
+# that resolves after INCIDENT_WINDOW_SEC without occurrences; 0 sends every
+# alert as before.
+INCIDENT_WINDOW_SEC = float(os.getenv("OBSERVEX_INCIDENT_WINDOW_SEC", "300"))
+INCIDENT_UPDATE_SEC = float(os.getenv("OBSERVEX_INCIDENT_UPDATE_SEC", "30"))
+INCIDENT_EXEMPLARS = int(os.getenv("OBSERVEX_INCIDENT_EXEMPLARS", "5"))
+# Cardinality caps on service names and (templated) routes per service;
+# keys past the cap become "__other__". A new key is admitted after
+# MIN_COUNT sightings, or NEAR_CAP_MIN_COUNT once the cap is 80% full.
+MAX_SERVICES = int(os.getenv("OBSERVEX_MAX_SERVICES", "200"))
+MAX_ROUTES_PER_SERVICE = int(os.getenv("OBSERVEX_MAX_ROUTES_PER_SERVICE", "100"))
+CARDINALITY_MIN_COUNT = int(os.getenv("OBSERVEX_CARDINALITY_MIN_COUNT", "1"))
+CARDINALITY_NEAR_CAP_MIN_COUNT = int(os.getenv("OBSERVEX_CARDINALITY_NEAR_CAP_MIN_COUNT", "2"))
+# Prometheus text /metrics for the processor itself; 0 disables.
+METRICS_PORT = int(os.getenv("OBSERVEX_METRICS_PORT", "9464"))
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-flow = Dataflow("otel-anomaly-detection")
 
-# Source
-stream = op.input("rabbitmq-stream", flow, RabbitSource("otel-telemetry"))
+# ---- Self metrics ------------------------------------------------------------
+# Gauges are read only when /metrics is scraped.
 
-# Parsing
-parsed_traces = op.flat_map("parse-traces", stream, parse_trace)
-parsed_logs = op.flat_map("parse-logs", stream, parse_log)
+PARSE_SECONDS = self_metrics.histogram(
+    "observex_parse_seconds", "Parse time per payload that yielded items", ("kind",)
+)
+PARSED_ITEMS = self_metrics.counter("observex_parsed_items_total", "Spans / log records parsed", ("kind",))
+TRACES_CLOSED = self_metrics.counter("observex_traces_closed_total", "Traces closed by the trace window")
+TRACE_SPANS = self_metrics.histogram(
+    "observex_trace_spans", "Spans per closed trace", buckets=self_metrics.SIZE_BUCKETS
+)
+SCORE_BATCH_SECONDS = self_metrics.histogram(
+    "observex_score_batch_seconds", "Per-service batch scoring time", ("scorer",)
+)
+SCORE_BATCH_SIZE = self_metrics.histogram(
+    "observex_score_batch_traces", "Traces per scoring batch", buckets=self_metrics.SIZE_BUCKETS
+)
+SINK_SECONDS = self_metrics.histogram("observex_sink_seconds", "Dashboard POST time", ("path",))
+SINK_ERRORS = self_metrics.counter("observex_sink_errors_total", "Failed dashboard POSTs", ("path",))
+REPLAYED_TRACES = self_metrics.counter(
+    "observex_replayed_traces_total", "Closed traces dropped as already scored"
+)
+LATE_PARTIAL_TRACES = self_metrics.counter(
+    "observex_late_partial_traces_total",
+    "Traces emitted again by the next trace window with spans that arrived after it closed",
+)
+INCIDENT_EVENTS = self_metrics.counter(
+    "observex_incident_events_total", "Incident events sent", ("event",)
+)
+ALERTS_SUPPRESSED = self_metrics.counter(
+    "observex_alerts_grouped_total", "Alerts folded into an already open incident"
+)
+SINK_LAG_SECONDS = self_metrics.histogram(
+    "observex_sink_lag_seconds", "Trace window close to verdict sent",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
 
 # Bytewax 0.20 windowing
 clock = SystemClock()
 align_to = datetime(2023, 1, 1, tzinfo=timezone.utc)
-window_cfg = TumblingWindower(length=timedelta(seconds=10), align_to=align_to)
+window_cfg = TumblingWindower(length=timedelta(seconds=TRACE_WINDOW_SEC), align_to=align_to)
 
 
 # ---- ML warmup -------------------------------------------------------------
 
-def _warmup_ml(path: str, scorer: ObserveXScorer) -> int:
+def _warmup_ml(path: str, scorer) -> int:
+    from ml_scorer import load_corpus_matrix
+
     if not os.path.exists(path):
         logger.warning(f"Warmup corpus not found at {path}; ML scorer starts cold.")
         return 0
-    count = 0
-    with open(path) as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                rec = json.loads(line)
-            except Exception:
-                continue
-            # Corpus is span-level; feed one row at a time.
-            scorer.learn_one({
-                "duration_ms": rec.get("duration_ms", 0),
-                "span_count": 1,
-                "error_rate": 0.0,
-            })
-            count += 1
-    logger.info(f"ObserveXScorer warmed on {count} synthetic records from {path}")
-    return count
+    start = time.perf_counter()
+    X = load_corpus_matrix(path)
+    loaded = time.perf_counter()
+    scorer.learn_many(X)
+    logger.info(
+        f"ObserveXScorer warmed on {len(X)} synthetic records from {path} in "
+        f"{(time.perf_counter() - start) * 1000:.0f}ms "
+        f"(load {(loaded - start) * 1000:.0f}ms)"
+    )
+    return len(X)
 
 
 # ---- Scorer wiring ---------------------------------------------------------
-# One ML instance per worker process. Rule detectors own structural rules;
-# MLScorer adapts ObserveXScorer to the Scorer interface. CompositeScorer
-# unions their verdicts (max score, union of reasons, merged per-model).
-ml_scorer = ObserveXScorer()
-_warmup_ml(WARMUP_JSONL, ml_scorer)
+# Detector state is keyed by primary service (see "score-by-service"): each
+# key owns a ServiceDetectorState with its rule baselines, so state shards
+# across workers and is included in recovery snapshots (`python -m
+# bytewax.run dataflow:flow -w N -r <recovery_dir>`).
+#
+# ML ensembles live in a process-wide ModelPool instead and are lent to the
+# state for one batch at a time. Per OBSERVEX_ML_POOL a key (service, or
+# service + root route) is scored by the shared global ensemble until it has
+# OBSERVEX_ML_POOL_MIN_TRACES traces, then by its own clone of it; resident
+# clones are LRU-evicted under OBSERVEX_ML_POOL_BUDGET_MB, so the pool stays
+# bounded however many services appear.
+#
+# The global ensemble and every resident clone are written to SNAPSHOT_DIR
+# every SNAPSHOT_INTERVAL_SEC by a background thread, and at exit; startup
+# restores the newest snapshot and only warms up when there is none. A clone
+# is only ever read by its owning worker: after scoring, that worker
+# refreshes the clone's frozen copy once per interval (ModelPool.checkpoint)
+# and the snapshot thread writes the copies. The global ensemble is frozen
+# by the snapshot thread itself under the pool's global lock.
+#
+# Fast start: the ML stack (numpy/sklearn) is imported and the global
+# ensemble restored or warmed on a background thread. Until it is ready,
+# service states score with rules only and verdicts carry ml_pending.
+TEMPLATE_KEY = "__template__"
+
+ml_pool = None
+_ml_ready = threading.Event()
+_snapshot_lock = threading.Lock()
+
+
+def _init_ml():
+    global ml_pool
+    start = time.perf_counter()
+    try:
+        from ml_scorer import FrozenScorer, ObserveXScorer, load_latest_snapshot
+        from model_pool import ModelPool
+
+        restored = load_latest_snapshot(SNAPSHOT_DIR) or {}
+        if TEMPLATE_KEY in restored:
+            template = restored.pop(TEMPLATE_KEY)
+        else:
+            template = ObserveXScorer()
+            _warmup_ml(WARMUP_JSONL, template)
+        pool = ModelPool(
+            template,
+            mode=ML_POOL_MODE,
+            budget_bytes=int(ML_POOL_BUDGET_MB * 2 ** 20),
+            max_models=ML_POOL_MAX_MODELS,
+            min_traces=ML_POOL_MIN_TRACES,
+            freeze=FrozenScorer,
+        )
+        pool.restore(restored)
+        # No worker has these yet, so they can be frozen from this thread.
+        for key, model in restored.items():
+            pool.checkpoint(key, model)
+        ml_pool = pool
+    except Exception as e:
+        logger.error(f"ML ensemble initialisation failed; staying rules-only: {e}")
+        return
+    _ml_ready.set()
+    logger.info(
+        f"ML ensemble ready after {time.perf_counter() - start:.1f}s "
+        f"(pool: {ml_pool.stats()})"
+    )
+
+
+def wait_for_ml(timeout=None) -> bool:
+    return _ml_ready.wait(timeout)
+
+
+def ml_pool_stats():
+    """Resident per-key ensemble count and estimated memory, or None while
+    the ML stack is still loading."""
+    return ml_pool.stats() if _ml_ready.is_set() else None
+
+
+def snapshot_ensembles():
+    with _snapshot_lock:
+        save_seen_traces()
+        if not _ml_ready.is_set():
+            return
+        from ml_scorer import FrozenScorer, save_snapshot
+
+        try:
+            with ml_pool.global_lock:
+                ensembles = {TEMPLATE_KEY: FrozenScorer(ml_pool.global_model)}
+            # Hot keys only: cold keys are rebuilt from the global ensemble.
+            ensembles.update(ml_pool.frozen())
+            path = save_snapshot(SNAPSHOT_DIR, ensembles)
+            logger.info(f"Saved {len(ensembles)} ensemble(s) to {path} (pool: {ml_pool.stats()})")
+        except Exception as e:
+            logger.error(f"Failed to save ensemble snapshot: {e}")
+
+
+def _snapshot_loop():
+    while True:
+        time.sleep(SNAPSHOT_INTERVAL_SEC)
+        snapshot_ensembles()
+
+
+# ---- Replay dedup ------------------------------------------------------------
+# Process-wide like log_buffer: a trace id is keyed to one worker, so the
+# shared filter only needs its own lock. Saved next to the ensemble
+# snapshots so a restart that re-reads the stream skips what it scored.
+SEEN_TRACES_PATH = os.path.join(SNAPSHOT_DIR, "seen-traces.bloom")
+
+seen_traces = None
+recent_closes = RecentCloses(TRACE_WINDOW_SEC)
+if DEDUP_CAPACITY > 0:
+    seen_traces = SeenTraces.load(
+        SEEN_TRACES_PATH, DEDUP_CAPACITY, DEDUP_ERROR_RATE, DEDUP_WINDOW_SEC
+    ) or SeenTraces(DEDUP_CAPACITY, DEDUP_ERROR_RATE, DEDUP_WINDOW_SEC)
+
+
+def save_seen_traces():
+    if seen_traces is None:
+        return
+    try:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        seen_traces.save(SEEN_TRACES_PATH)
+    except Exception as e:
+        logger.error(f"Failed to save trace dedup filter: {e}")
+
+
+def is_new_trace(item):
+    trace_id, (metadata_tw, _) = item
+    if seen_traces is None:
+        return True
+    late = recent_closes.late_partial(trace_id, metadata_tw.close_time.timestamp())
+    if not seen_traces.check_and_add(trace_id):
+        return True
+    if late:
+        # The rest of a trace that straddled a window boundary: scored as
+        # before dedup existed, not dropped as a replay.
+        LATE_PARTIAL_TRACES.inc()
+        return True
+    REPLAYED_TRACES.inc()
+    return False
+
+
+# ---- Incident grouping --------------------------------------------------------
+# Shared across workers like seen_traces: alerts of one service come from
+# one worker, the PII alerts from the log handler's.
+incidents = (
+    IncidentAggregator(INCIDENT_WINDOW_SEC, INCIDENT_UPDATE_SEC, INCIDENT_EXEMPLARS)
+    if INCIDENT_WINDOW_SEC > 0 else None
+)
 
-rule_scorer = RuleDetectorScorer()
-scorer = CompositeScorer([rule_scorer, MLScorer(ml_scorer)])
-pii_detector = PIIDensityDetector()
 
+# ---- Key cardinality ------------------------------------------------------------
+# Every service / route that keys state (Bytewax keys, detector state, ML
+# pool, incidents, dashboard series) goes through `keys` once per trace.
+keys = KeyLimiter(
+    MAX_SERVICES, MAX_ROUTES_PER_SERVICE, CARDINALITY_MIN_COUNT, CARDINALITY_NEAR_CAP_MIN_COUNT
+)
 
-# ---- Trace reconstruction --------------------------------------------------
 
-def get_trace_id_key(span):
-    return span["trace_id"]
+def guarded_route(stats, service, route):
+    # Memoised per trace: each keys.route call counts toward admission.
+    cache = stats.setdefault("guarded_routes", {})
+    if (service, route) not in cache:
+        cache[(service, route)] = keys.route(service, route)
+    return cache[(service, route)]
 
 
-def build_full_trace():
-    return {"duration_ms": 0, "spans": [], "has_anomaly": False, "start_time": None}
+threading.Thread(target=_init_ml, name="observex-ml-init", daemon=True).start()
+threading.Thread(target=_snapshot_loop, name="observex-snapshot", daemon=True).start()
+atexit.register(snapshot_ensembles)
 
 
-def fold_full_trace(stats, span):
-    start_time = span.get("start_time") or datetime.now(timezone.utc).isoformat()
-    duration = span.get("duration_ms", 0)
-    stats["spans"].append({
-        "name": span.get("route", "unknown"),
-        "service": span.get("service_name", "unknown"),
-        "duration_ms": duration,
-        "start_time": start_time,
-        "trace_id": span.get("trace_id", "unknown"),
-        "span_id": span.get("span_id", ""),
-        "parent_span_id": span.get("parent_span_id", ""),
-        "status_code": span.get("status_code", 0),
-        "is_anomaly": duration > SPAN_ANOMALY_MS,
-    })
-    stats["duration_ms"] = max(stats["duration_ms"], duration)
-    if duration > SPAN_ANOMALY_MS:
-        stats["has_anomaly"] = True
-    if not stats["start_time"] or start_time < stats["start_time"]:
-        stats["start_time"] = start_time
-    return stats
+# ---- Shutdown ----------------------------------------------------------------
+# SIGTERM (stop.sh, `docker stop`) ends the process without running atexit.
+# The handler runs on the main thread, which may be holding the pool's global
+# lock or the dedup filter's, so the final snapshot is taken on its own
+# thread, which then exits the process with the usual SIGTERM status.
+_shutting_down = threading.Event()
 
 
-def merge_full_trace(s1, s2):
-    return {
-        "duration_ms": max(s1["duration_ms"], s2["duration_ms"]),
-        "spans": s1["spans"] + s2["spans"],
-        "has_anomaly": s1["has_anomaly"] or s2["has_anomaly"],
-        "start_time": s1["start_time"] if (
-            not s2["start_time"] or (s1["start_time"] and s1["start_time"] < s2["start_time"])
-        ) else s2["start_time"],
-    }
+def _shutdown(signum):
+    logger.info(f"Received signal {signum}; saving snapshots before exit.")
+    snapshot_ensembles()
+    logging.shutdown()
+    os._exit(128 + signum)
 
 
-keyed_by_trace = op.key_on("key-by-trace", parsed_traces, get_trace_id_key)
-trace_reconstructor = win.fold_window(
-    "window-reconstruct",
-    keyed_by_trace,
-    clock,
-    window_cfg,
-    build_full_trace,
-    fold_full_trace,
-    merge_full_trace,
-)
+def _on_sigterm(signum, _frame):
+    if _shutting_down.is_set():
+        return
+    _shutting_down.set()
+    threading.Thread(target=_shutdown, args=(signum,), name="observex-shutdown").start()
+
+
+try:
+    signal.signal(signal.SIGTERM, _on_sigterm)
+except ValueError:  # imported off the main thread
+    logger.warning("SIGTERM handler not installed; snapshots are only saved at a clean exit.")
+
+
+def _retrain_gauges():
+    if not _ml_ready.is_set():
+        return None
+    stats = ml_pool.global_model.retrain_stats()
+    return {field: stats[field] for field in ("generation", "retrains", "failed", "queue_depth")}
+
+
+def _pool_gauges():
+    stats = ml_pool_stats()
+    if stats is None:
+        return None
+    return {field: v for field, v in stats.items() if isinstance(v, (int, float))}
+
+
+self_metrics.gauge("observex_ml_ready", "1 once the ML ensemble is loaded", lambda: float(_ml_ready.is_set()))
+self_metrics.gauge("observex_ml_pool", "ModelPool state (ml_pool_stats)", _pool_gauges, ("field",))
+self_metrics.gauge("observex_ml_retrain", "Global ensemble retrain state", _retrain_gauges, ("field",))
+self_metrics.gauge("observex_dedup", "Trace dedup filter state",
+                   lambda: seen_traces.stats() if seen_traces else None, ("field",))
+self_metrics.gauge("observex_incidents_open", "Incidents not yet resolved",
+                   lambda: incidents.open_count() if incidents else None)
+self_metrics.gauge("observex_cardinality", "Admitted and collapsed service / route keys",
+                   keys.stats, ("field",))
+self_metrics.gauge("observex_log_buffer_traces", "Traces with buffered logs awaiting a verdict",
+                   lambda: len(log_buffer))
+
+
+def _start_profile(query):
+    # POST /debug/profile?seconds=N starts a capture.
+    try:
+        seconds = float(query.get("seconds", profiling.DEFAULT_SECONDS))
+    except ValueError:
+        return 400, {"error": "seconds must be a number"}
+    if not profiling.start_capture(seconds=seconds):
+        return 409, {"error": "a capture is already running"}
+    return 202, {"started": True, "seconds": seconds, "dir": profiling.PROFILE_DIR}
+
+
+def _profile_status(query):
+    # GET /debug/profile reports whether one is running and the last result.
+    return 200, {"running": profiling.is_running(), "last": profiling.last_result()}
+
+
+if profiling.PROFILING_ENABLED:
+    profiling.install_signal_handler()
+    self_metrics.add_route("/debug/profile", _start_profile, method="POST")
+    self_metrics.add_route("/debug/profile", _profile_status)
+if METRICS_PORT:
+    self_metrics.serve(METRICS_PORT)
+
+
+# ---- Trace reconstruction --------------------------------------------------
+# Fold callbacks live in trace_assembly so the offline replay tool can
+# assemble traces without Bytewax.
 
 _http_client = httpx.Client(timeout=2.0)
+# When set, called as dashboard_sink(path, payload) instead of POSTing to
+# the backend (bench_pipeline.py captures the pipeline's output this way).
+dashboard_sink = None
 
 
 def send_to_dashboard(path, payload):
-    try:
-        _http_client.post(f"{DASHBOARD_URL}{path}", json=payload)
-    except Exception as e:
-        logger.error(f"Failed to send to dashboard: {e}")
+    start = time.perf_counter()
+    if dashboard_sink is not None:
+        dashboard_sink(path, payload)
+    else:
+        try:
+            _http_client.post(f"{DASHBOARD_URL}{path}", json=payload)
+        except Exception as e:
+            SINK_ERRORS.labels(path).inc()
+            logger.error(f"Failed to send to dashboard: {e}")
+    SINK_SECONDS.labels(path).observe(time.perf_counter() - start)
+
+
+def _send_incident_events(events):
+    for event in events:
+        INCIDENT_EVENTS.labels(event["event"]).inc()
+        send_to_dashboard("/api/incidents", event)
+
+
+def send_alert(alert) -> bool:
+    """Send `alert` if it opens an incident (always, with grouping off).
+    True if its trace is an exemplar worth keeping forensics for."""
+    if incidents is None:
+        send_to_dashboard("/api/alerts", alert)
+        return True
+    events, exemplar = incidents.record(alert)
+    opened = bool(events) and events[-1]["event"] == "open"
+    if opened:
+        send_to_dashboard("/api/alerts", alert)
+    else:
+        ALERTS_SUPPRESSED.inc()
+    _send_incident_events(events)
+    return exemplar
+
+
+def sweep_incidents():
+    if incidents is not None:
+        _send_incident_events(incidents.sweep())
 
 
 # ---- Log buffer for anomaly correlation ------------------------------------
@@ -157,17 +460,71 @@ log_buffer = {}
 LOG_BUFFER_MAX_PER_TRACE = 50
 
 
-def process_full_trace(item):
+def attach_features(item):
+    # The TraceIndex is built once here and travels in `stats` to the
+    # detectors (via the features), the metrics and the alert.
     trace_id, (metadata_tw, stats) = item
-    spans = stats["spans"]
-    if not spans:
-        return item
+    stats["index"] = TraceIndex(stats["spans"])
+    stats["window_close"] = metadata_tw.close_time.timestamp()
+    TRACES_CLOSED.inc()
+    TRACE_SPANS.observe(len(stats["spans"]))
+    features = extract_features(stats, stats["spans"], stats["index"])
+    # Raw service name -> guarded key, for every service in the trace.
+    stats["services"] = {svc: keys.service(svc) for svc in stats["index"].services}
+    service = stats["services"].get(features["primary_service"]) or keys.service(features["primary_service"])
+    features["primary_service"] = service
+    stats["route"] = guarded_route(stats, service, stats["spans"][0]["name"])
+    return (trace_id, stats, features)
+
+
+def score_trace_batch(state, batch):
+    service = batch[0][2]["primary_service"]
+    if state is None:
+        state = ServiceDetectorState()
+
+    # One group per pool key (a single one unless pooling by route), in
+    # order of first appearance.
+    groups = {}
+    for i, (_, stats, _) in enumerate(batch):
+        key = ml_pool.key_for(service, stats["route"]) if ml_pool else service
+        groups.setdefault(key, []).append(i)
+
+    verdicts = [None] * len(batch)
+    SCORE_BATCH_SIZE.observe(len(batch))
+    for key, idx in groups.items():
+        features_list = [batch[i][2] for i in idx]
+        spans_list = [batch[i][1]["spans"] for i in idx]
+        start = time.perf_counter()
+        if _ml_ready.is_set():
+            with ml_pool.lease(key, len(idx)) as ml:
+                with state.using_ml(ml):
+                    group_verdicts = state.score_many(features_list, spans_list)
+                ml_pool.checkpoint(key, ml, SNAPSHOT_INTERVAL_SEC)
+            SCORE_BATCH_SECONDS.labels("ensemble").observe(time.perf_counter() - start)
+        else:
+            group_verdicts = state.score_many(features_list, spans_list)
+            SCORE_BATCH_SECONDS.labels("rules").observe(time.perf_counter() - start)
+        for i, verdict in zip(idx, group_verdicts):
+            verdicts[i] = verdict
+
+    scored = [
+        (trace_id, stats, features, verdict)
+        for (trace_id, stats, features), verdict in zip(batch, verdicts)
+    ]
+    return (state, scored)
+
+
+def unbatch_scored(item):
+    service, scored = item
+    return [(service, trace) for trace in scored]
 
-    # 1. Extract features, run composite scorer, update ML online.
-    features = extract_features(stats, spans)
-    verdict = scorer.score(features, spans)
-    ml_scorer.learn_one(features)  # continue learning from live traffic
 
+def process_full_trace(item):
+    service, (trace_id, stats, features, verdict) = item
+    spans = stats["spans"]
+    index = stats["index"]
+
+    # 1. Verdict already computed by the service-keyed scorer.
     is_anom = verdict["is_anomaly"]
     reasons = verdict["reasons"]
     rule_flags = build_rule_flags(reasons, verdict.get("metadata", {}))
@@ -175,14 +532,36 @@ def process_full_trace(item):
     anomaly_type = classify_anomaly(reasons, ml_scores) if is_anom else None
 
     # 2. Cumulative trace counters (for true anomaly rate denominator).
-    services_in_trace = sorted({s["service"] for s in spans})
+    services_in_trace = sorted(set(stats["services"].values()))
     send_to_dashboard("/api/trace_observed", {
+        "trace_id": trace_id,
         "services": services_in_trace,
         "is_anomaly": bool(is_anom),
     })
 
-    # 3. Forensic inventory + correlated log flush for anomalous traces.
+    # 3. One enriched trace-level alert when anomalous, grouped into
+    #    incidents: only an incident's first alert is sent.
+    exemplar = False
     if is_anom:
+        exemplar = send_alert({
+            "service": features["primary_service"],
+            "route": stats["route"],
+            "anomaly_score": verdict["score"],
+            "is_anomaly": True,
+            "duration_ms": stats["duration_ms"],
+            "trace_id": trace_id,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "spans": spans[:20],
+            "reasons": reasons,
+            "ml_scores": ml_scores,
+            "rule_flags": rule_flags,
+            "anomaly_type": anomaly_type,
+            "trace_index": index.compact(),
+        })
+
+    # 4. Forensic inventory + correlated log flush for the incident's
+    #    exemplar traces.
+    if exemplar:
         send_to_dashboard("/api/traces", {
             "trace_id": trace_id,
             "duration_ms": stats["duration_ms"],
@@ -195,73 +574,135 @@ def process_full_trace(item):
             f"Anomalous trace {trace_id[:12]} type={anomaly_type} "
             f"reasons={reasons} score={verdict['score']:.2f} "
             f"logs_flushed={len(correlated)}"
+            + (" ml_pending" if verdict.get("ml_pending") else "")
         )
     else:
         log_buffer.pop(trace_id, None)
 
-    # 3. Per-service throughput + p99.
-    services_seen = {s["service"] for s in spans}
-    for svc in services_seen:
-        svc_spans = [s for s in spans if s["service"] == svc]
-        durations = sorted(s["duration_ms"] for s in svc_spans)
+    # 5. Per-service throughput + p99 (collapsed services report separately
+    #    under the overflow key).
+    for raw_svc, agg in index.services.items():
+        svc = stats["services"][raw_svc]
+        durations = sorted(agg["durations"])
         p99_index = max(0, int(len(durations) * 0.99) - 1)
         p99_latency = durations[p99_index]
         now_iso = datetime.now(timezone.utc).isoformat()
         send_to_dashboard("/api/metrics", {
             "service": svc, "metric_type": "throughput",
-            "value": float(len(svc_spans)), "timestamp": now_iso,
+            "value": float(agg["spans"]), "timestamp": now_iso,
         })
         send_to_dashboard("/api/metrics", {
             "service": svc, "metric_type": "p99_latency",
             "value": float(p99_latency), "timestamp": now_iso,
         })
 
-    # 4. One enriched trace-level alert when anomalous.
-    if is_anom:
-        send_to_dashboard("/api/alerts", {
-            "service": features["primary_service"],
-            "route": spans[0]["name"],
-            "anomaly_score": verdict["score"],
-            "is_anomaly": True,
-            "duration_ms": stats["duration_ms"],
-            "trace_id": trace_id,
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "spans": spans[:20],
-            "reasons": reasons,
-            "ml_scores": ml_scores,
-            "rule_flags": rule_flags,
-            "anomaly_type": anomaly_type,
-        })
-
+    sweep_incidents()
+    if "window_close" in stats:
+        SINK_LAG_SECONDS.observe(time.time() - stats["window_close"])
     return item
 
 
-op.map("emit-trace-data", trace_reconstructor.down, process_full_trace)
+# ---- Latency attribution: critical path / self time per service + route ----
+
+attribution_window_cfg = TumblingWindower(
+    length=timedelta(seconds=ATTRIBUTION_WINDOW_SEC), align_to=align_to
+)
+
+
+def attribution_by_service(item):
+    trace_id, stats, features = item
+    attribution = stats["index"].latency_attribution()
+    out = []
+    for raw_svc, agg in attribution["services"].items():
+        svc = stats["services"].get(raw_svc) or keys.service(raw_svc)
+        routes = {}
+        for route, route_agg in attribution["routes"][raw_svc].items():
+            into = routes.setdefault(
+                guarded_route(stats, svc, route), {"critical_ms": 0.0, "self_ms": 0.0}
+            )
+            into["critical_ms"] += route_agg["critical_ms"]
+            into["self_ms"] += route_agg["self_ms"]
+        out.append((svc, {
+            "traces": 1,
+            "critical_ms": agg["critical_ms"],
+            "self_ms": agg["self_ms"],
+            "routes": routes,
+        }))
+    return out
+
+
+def build_attribution():
+    return {"traces": 0, "critical_ms": 0.0, "self_ms": 0.0, "routes": {}}
+
+
+def fold_attribution(acc, item):
+    acc["traces"] += item["traces"]
+    acc["critical_ms"] += item["critical_ms"]
+    acc["self_ms"] += item["self_ms"]
+    for route, agg in item["routes"].items():
+        into = acc["routes"].setdefault(route, {"critical_ms": 0.0, "self_ms": 0.0})
+        into["critical_ms"] += agg["critical_ms"]
+        into["self_ms"] += agg["self_ms"]
+    return acc
+
+
+def merge_attribution(a1, a2):
+    routes = {route: dict(agg) for route, agg in a1["routes"].items()}
+    for route, agg in a2["routes"].items():
+        into = routes.setdefault(route, {"critical_ms": 0.0, "self_ms": 0.0})
+        into["critical_ms"] += agg["critical_ms"]
+        into["self_ms"] += agg["self_ms"]
+    return {
+        "traces": a1["traces"] + a2["traces"],
+        "critical_ms": a1["critical_ms"] + a2["critical_ms"],
+        "self_ms": a1["self_ms"] + a2["self_ms"],
+        "routes": routes,
+    }
+
+
+def emit_attribution_metrics(item):
+    # Window totals: how much critical-path and self time each service (and
+    # each of its routes) accounted for across the traces it appeared in.
+    service, (metadata_tw, acc) = item
+    if not acc["traces"]:
+        return item
+    now_iso = datetime.now(timezone.utc).isoformat()
+    for route, agg in [(None, acc)] + sorted(acc["routes"].items()):
+        send_to_dashboard("/api/metrics", {
+            "service": service, "route": route, "metric_type": "critical_path_ms",
+            "value": float(agg["critical_ms"]), "timestamp": now_iso,
+        })
+        send_to_dashboard("/api/metrics", {
+            "service": service, "route": route, "metric_type": "self_time_ms",
+            "value": float(agg["self_ms"]), "timestamp": now_iso,
+        })
+    return item
 
 
 # ---- Log handler: redaction counting + PII density + trace correlation -----
 
-REDACTION_TOKENS = ("[REDACTED_EMAIL]", "[REDACTED_AUTHOR]", "[REDACTED_CC]")
+redaction_matcher = RedactionMatcher(REDACTION_TOKENS)
+
+
+def tag_redactions(log):
+    # The guarded name keys the log handler, PII density and redaction
+    # windows (and is what the flushed log is stored under).
+    log["service_name"] = keys.service(log.get("service_name"))
+    log["redactions"] = redaction_matcher.count(log.get("body", ""))
+    return log
 
 
 def handle_log_with_redaction(state, log):
+    # Per-service PII density window; redaction counts are windowed in
+    # "window-redactions".
     if state is None:
-        state = {"redaction_count": 0}
-
+        state = PIIDensityDetector()
     body = log.get("body", "")
     service = log.get("service_name", "unknown")
-    is_redacted = any(tok in body for tok in REDACTION_TOKENS)
-
-    if is_redacted:
-        state["redaction_count"] += 1
-        send_to_dashboard("/api/metrics", {
-            "service": service, "metric_type": "redaction_count",
-            "value": float(state["redaction_count"]),
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-        })
+    is_redacted = bool(log.get("redactions"))
 
     # PII density detector — paper §IV-C (security primitive).
-    detection = pii_detector.observe(service, is_redacted)
+    detection = state.observe(service, is_redacted)
     if detection:
         ratio = detection["redaction_ratio"]
         logger.warning(
@@ -269,12 +710,13 @@ def handle_log_with_redaction(state, log):
             f"over {detection['window_log_count']} logs"
         )
         pii_rule_flags = {
-            "n_plus_1": False, "n_plus_1_count": 0,
+            "n_plus_1": False, "n_plus_1_count": 0, "n_plus_1_operation": None,
             "bimodal_latency": False, "latency_variance": 0.0,
             "dependency_break": False, "dangling_span": None,
             "pii_density": True, "redaction_ratio": ratio,
+            "ml_pending": False,
         }
-        send_to_dashboard("/api/alerts", {
+        send_alert({
             "service": service,
             "route": "security.pii_density",
             "anomaly_score": ratio,
@@ -304,10 +746,201 @@ def handle_log_with_redaction(state, log):
                 "timestamp": log.get("timestamp", datetime.now(timezone.utc).isoformat()),
             })
 
+    sweep_incidents()
     return (state, log)
 
 
-log_keyed = op.key_on("key-log-svc", parsed_logs, lambda x: x.get("service_name", "unknown"))
-op.stateful_map("log-handler", log_keyed, handle_log_with_redaction)
+# ---- Windowed redaction metrics ---------------------------------------------
+# One set of points per service per window instead of one POST per redacted log.
+
+redaction_window_cfg = TumblingWindower(
+    length=timedelta(seconds=REDACTION_WINDOW_SEC), align_to=align_to
+)
+
+
+def build_redaction_counts():
+    return {"redacted_logs": 0, "tokens": {}}
+
+
+def fold_redaction_counts(counts, log):
+    tokens = log.get("redactions")
+    if tokens:
+        counts["redacted_logs"] += 1
+        for kind, n in tokens.items():
+            counts["tokens"][kind] = counts["tokens"].get(kind, 0) + n
+    return counts
+
+
+def merge_redaction_counts(c1, c2):
+    tokens = dict(c1["tokens"])
+    for kind, n in c2["tokens"].items():
+        tokens[kind] = tokens.get(kind, 0) + n
+    return {"redacted_logs": c1["redacted_logs"] + c2["redacted_logs"], "tokens": tokens}
+
+
+# Cumulative totals the dashboard already showed before this start (no
+# recovery), fetched on a background thread the first time a service has a
+# window: the step never waits on the backend. Until a service's total is
+# back its redaction_count point is held; deltas are sent as usual.
+_restored_redaction_totals = {}
+_restore_lock = threading.Lock()
+
+
+def _restore_redaction_total(service):
+    try:
+        rows = httpx.get(
+            f"{DASHBOARD_URL}/api/metrics/{quote(service, safe='')}/redaction_count",
+            timeout=2.0,
+        ).json()
+        total = int(rows[-1]["value"]) if rows else 0
+    except Exception as e:
+        logger.warning(f"Could not restore redaction total for {service}; starting at 0: {e}")
+        total = 0
+    _restored_redaction_totals[service] = total
+
+
+def _restored_redaction_total(service):
+    """The restored total, or None while it is still being fetched."""
+    if dashboard_sink is not None:
+        return 0
+    restored = _restored_redaction_totals.get(service)
+    if restored is None:
+        with _restore_lock:
+            if service not in _restored_redaction_totals:
+                _restored_redaction_totals[service] = None
+                threading.Thread(
+                    target=_restore_redaction_total, args=(service,),
+                    name="observex-redaction-restore", daemon=True,
+                ).start()
+    return restored
+
+
+def emit_redaction_metrics(state, item):
+    # Per-service cumulative count, kept in this step's state: "total" and
+    # whether the restored total has been added to it yet.
+    service, (metadata_tw, counts) = item
+    if state is None:
+        state = {"total": 0, "seeded": False}
+    if not state["seeded"]:
+        restored = _restored_redaction_total(service)
+        if restored is not None:
+            state["total"] += restored
+            state["seeded"] = True
+    delta = counts["redacted_logs"]
+    if not delta:
+        return (state, item)
+    state["total"] += delta
+    now_iso = datetime.now(timezone.utc).isoformat()
+    # redaction_count stays cumulative: the PII panel reads its latest value as the total.
+    if state["seeded"]:
+        send_to_dashboard("/api/metrics", {
+            "service": service, "metric_type": "redaction_count",
+            "value": float(state["total"]), "timestamp": now_iso,
+        })
+    send_to_dashboard("/api/metrics", {
+        "service": service, "metric_type": "redaction_delta",
+        "value": float(delta), "timestamp": now_iso,
+    })
+    for kind, n in counts["tokens"].items():
+        send_to_dashboard("/api/metrics", {
+            "service": service, "metric_type": f"redaction_{kind}",
+            "value": float(n), "timestamp": now_iso,
+        })
+    return (state, item)
+
+
+# ---- Flow --------------------------------------------------------------------
+
+def _timed_parse(kind, parse):
+    seconds, items = PARSE_SECONDS.labels(kind), PARSED_ITEMS.labels(kind)
+
+    def timed(payload):
+        start = time.perf_counter()
+        out = parse(payload)
+        if out:  # every payload goes through both parsers
+            seconds.observe(time.perf_counter() - start)
+            items.inc(len(out))
+        return out
+
+    return timed
+
+
+def build_flow(source, trace_sink=None, score_batch_max=SCORE_BATCH_MAX):
+    """The detection dataflow over `source` (OTLP trace/log payloads).
+
+    Scored traces go to `trace_sink` when given, otherwise closed trace
+    windows are printed to stdout; `score_batch_max` caps the per-service
+    scoring batch.
+    """
+    flow = Dataflow("otel-anomaly-detection")
+    stream = op.input("rabbitmq-stream", flow, source)
+
+    # Parsing
+    parsed_traces = op.flat_map("parse-traces", stream, _timed_parse("trace", parse_trace))
+    parsed_logs = op.flat_map("parse-logs", stream, _timed_parse("log", parse_log))
+
+    # Trace reconstruction, features and per-service batched scoring
+    keyed_by_trace = op.key_on("key-by-trace", parsed_traces, get_trace_id_key)
+    trace_reconstructor = win.fold_window(
+        "window-reconstruct",
+        keyed_by_trace,
+        clock,
+        window_cfg,
+        build_full_trace,
+        fold_full_trace,
+        merge_full_trace,
+    )
+    closed_traces = op.filter(
+        "drop-empty-traces", trace_reconstructor.down, lambda item: bool(item[1][1]["spans"])
+    )
+    new_traces = op.filter("drop-replayed-traces", closed_traces, is_new_trace)
+    featured_traces = op.map("extract-features", new_traces, attach_features)
+    keyed_by_service = op.key_on(
+        "key-by-service", featured_traces, lambda t: t[2]["primary_service"]
+    )
+    trace_batches = op.collect(
+        "batch-by-service", keyed_by_service, SCORE_BATCH_TIMEOUT, score_batch_max
+    )
+    scored_batches = op.stateful_map("score-by-service", trace_batches, score_trace_batch)
+    scored_traces = op.flat_map("unbatch-scored", scored_batches, unbatch_scored)
+    emitted_traces = op.map("emit-trace-data", scored_traces, process_full_trace)
+
+    # Latency attribution
+    attribution_windows = win.fold_window(
+        "window-attribution",
+        op.flat_map("attribute-latency", featured_traces, attribution_by_service),
+        clock,
+        attribution_window_cfg,
+        build_attribution,
+        fold_attribution,
+        merge_attribution,
+    )
+    op.map("emit-attribution-metrics", attribution_windows.down, emit_attribution_metrics)
+
+    # Logs: redaction tagging, PII density, trace correlation buffer
+    tagged_logs = op.map("match-redactions", parsed_logs, tag_redactions)
+    log_keyed = op.key_on("key-log-svc", tagged_logs, lambda x: x.get("service_name", "unknown"))
+    op.stateful_map("log-handler", log_keyed, handle_log_with_redaction)
+    redaction_windows = win.fold_window(
+        "window-redactions",
+        log_keyed,
+        clock,
+        redaction_window_cfg,
+        build_redaction_counts,
+        fold_redaction_counts,
+        merge_redaction_counts,
+    )
+    op.stateful_map(
+        "emit-redaction-metrics",
+        op.map("key-redaction-windows", redaction_windows.down, lambda kv: (kv[0], kv)),
+        emit_redaction_metrics,
+    )
+
+    if trace_sink is not None:
+        op.output("trace-sink", emitted_traces, trace_sink)
+    else:
+        op.output("stdout", trace_reconstructor.down, StdOutSink())
+    return flow
+
 
-op.output("stdout", trace_reconstructor.down, StdOutSink())
+flow = build_flow(RabbitSource("otel-telemetry"))
@@ -0,0 +1,168 @@
+"""Memory-bounded, time-decaying membership filter for trace ids.
+
+With `x-stream-offset: first` a restarted processor re-reads the stream, so
+the same traces close and get scored again. `SeenTraces` remembers ids it
+has already emitted in two rotating Bloom filter generations: an id is
+"seen" if either generation has it, new ids go into the current one, and
+the current one becomes the previous one every `window_sec` (or as soon as
+it holds `capacity` ids, which keeps the false-positive rate at
+`error_rate`). An id is remembered for between one and two windows;
+memory is fixed at two bit arrays sized from `capacity` and `error_rate`.
+
+A false positive drops a genuine trace, so `error_rate` is kept small.
+The filter persists with `save` / `load` so it survives the restarts it is
+meant to cover. `RecentCloses` keeps the second half of a trace that
+straddled a window boundary from being taken for a replay.
+"""
+import os
+import math
+import time
+import pickle
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+
+class SeenTraces:
+
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 1e-4,
+                 window_sec: float = 3600.0):
+        self.capacity = int(capacity)
+        self.error_rate = float(error_rate)
+        self.window_sec = float(window_sec)
+        self.n_bits = max(8, int(math.ceil(-self.capacity * math.log(self.error_rate) / math.log(2) ** 2)))
+        self.n_hashes = max(1, int(round(self.n_bits / self.capacity * math.log(2))))
+        self._lock = threading.Lock()
+        self._current = bytearray((self.n_bits + 7) // 8)
+        self._previous = bytearray(len(self._current))
+        self._count = 0
+        self._rotated_at = time.time()
+        self.duplicates = 0
+
+    def _positions(self, trace_id: str):
+        digest = hashlib.blake2b(trace_id.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        m = self.n_bits
+        return [(h1 + i * h2) % m for i in range(self.n_hashes)]
+
+    @staticmethod
+    def _has(bits: bytearray, positions) -> bool:
+        for pos in positions:
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def _maybe_rotate(self, now: float):
+        elapsed = now - self._rotated_at
+        if elapsed >= 2 * self.window_sec:
+            self._previous = bytearray(len(self._current))
+        elif elapsed >= self.window_sec or self._count >= self.capacity:
+            self._previous = self._current
+        else:
+            return
+        self._current = bytearray(len(self._previous))
+        self._count = 0
+        self._rotated_at = now
+
+    def check_and_add(self, trace_id: str) -> bool:
+        """True if `trace_id` was (probably) seen before; records it either way."""
+        positions = self._positions(trace_id)
+        with self._lock:
+            self._maybe_rotate(time.time())
+            if self._has(self._current, positions):
+                self.duplicates += 1
+                return True
+            seen = self._has(self._previous, positions)
+            bits = self._current
+            for pos in positions:
+                bits[pos >> 3] |= 1 << (pos & 7)
+            self._count += 1
+            if seen:
+                self.duplicates += 1
+            return seen
+
+    def stats(self):
+        return {
+            "capacity": self.capacity,
+            "current_ids": self._count,
+            "duplicates": self.duplicates,
+            "bytes": 2 * len(self._current),
+            "window_age_sec": time.time() - self._rotated_at,
+        }
+
+    # ── Persistence ─────────────────────────────────────────────────
+
+    def save(self, path: str):
+        with self._lock:
+            state = {
+                "version": FORMAT_VERSION,
+                "params": (self.capacity, self.error_rate, self.window_sec),
+                "current": bytes(self._current),
+                "previous": bytes(self._previous),
+                "count": self._count,
+                "rotated_at": self._rotated_at,
+            }
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str, capacity: int, error_rate: float, window_sec: float) -> Optional["SeenTraces"]:
+        """The filter saved at `path`, or None if missing, unreadable or
+        saved with different parameters."""
+        try:
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable trace dedup filter {path}: {e}")
+            return None
+        if state.get("version") != FORMAT_VERSION or \
+                tuple(state.get("params", ())) != (int(capacity), float(error_rate), float(window_sec)):
+            logger.info(f"Trace dedup filter at {path} has other parameters; starting empty.")
+            return None
+        seen = cls(capacity, error_rate, window_sec)
+        seen._current = bytearray(state["current"])
+        seen._previous = bytearray(state["previous"])
+        seen._count = state["count"]
+        seen._rotated_at = state["rotated_at"]
+        return seen
+
+
+class RecentCloses:
+    """Which trace window last emitted each trace id, for one window back.
+
+    Trace windows are tumbling, so a trace still sending spans when its
+    window closes comes out of the next window too, with the rest of its
+    spans. `SeenTraces` cannot tell that late partial from a replay; this
+    can, because it is kept in memory only: a restarted processor starts
+    empty and its replays are still caught by the filter.
+    """
+
+    def __init__(self, window_sec: float):
+        self.window_sec = float(window_sec)
+        self._closes = OrderedDict()  # trace id -> close time, oldest first
+        self._lock = threading.Lock()
+
+    def late_partial(self, trace_id: str, close_ts: float) -> bool:
+        """Record that `trace_id` came out of the window closing at
+        `close_ts`; True if the window just before it emitted it as well."""
+        with self._lock:
+            closes = self._closes
+            while closes and next(iter(closes.values())) < close_ts - self.window_sec:
+                closes.popitem(last=False)
+            previous = closes.pop(trace_id, None)
+            closes[trace_id] = close_ts
+        return previous is not None and previous < close_ts
+
+    def __len__(self):
+        return len(self._closes)
@@ -10,51 +10,77 @@ Scorer contract (all implementations return this shape):
     }
 
 Rule detectors map to §IV of the paper:
-  - N+1 Query Regression (Chebyshev bound on span count)
+  - N+1 Query Regression (Chebyshev bound on the largest fan-out of one
+    operation under one parent)
   - Bimodal Latency (EWMA variance, eq. 2)
   - Dangling Parent (dependency-chain break)
   - PII Redaction Density (§IV-C, log-stream — separate class)
+RedactionMatcher counts collector redaction tokens for the log stream.
 """
 import math
+import re
 import time
 import logging
 from abc import ABC, abstractmethod
-from collections import deque
+from contextlib import contextmanager
 from typing import Dict, List, Optional
 
+from trace_index import TraceIndex
+
 logger = logging.getLogger(__name__)
 
 
-def extract_features(trace_stats: Dict, spans: List[Dict]) -> Dict:
-    """Derive the feature vector consumed by every Scorer."""
+def extract_features(trace_stats: Dict, spans: List[Dict],
+                     index: Optional[TraceIndex] = None) -> Dict:
+    """Derive the feature vector consumed by every Scorer.
+
+    Pass the trace's TraceIndex when one was already built; the structural
+    fields (`dangling_span`) come from it so detectors need not re-walk
+    the spans. The fan-out fields are copied from the counters the trace
+    fold keeps (`max_fanout`, `fanout_op`) when present.
+    """
     if not spans:
         return {
             "duration_ms": 0.0,
             "span_count": 0,
             "error_rate": 0.0,
             "primary_service": "unknown",
+            "dangling_span": None,
+            "max_fanout": 0,
+            "fanout_operation": None,
         }
 
-    errors = sum(1 for s in spans if s.get("status_code", 0) not in (0, 1))
+    if index is None:
+        index = TraceIndex(spans)
 
-    per_svc = {}
-    for s in spans:
-        svc = s.get("service", "unknown")
-        per_svc[svc] = per_svc.get(svc, 0.0) + s.get("duration_ms", 0.0)
-    primary = max(per_svc, key=per_svc.get) if per_svc else "unknown"
-
-    return {
+    features = {
         "duration_ms": float(trace_stats.get("duration_ms", 0.0)),
         "span_count": len(spans),
-        "error_rate": errors / len(spans),
-        "primary_service": primary,
+        "error_rate": index.error_count / len(spans),
+        "primary_service": index.primary_service,
+        "dangling_span": index.dangling_span,
     }
+    if "max_fanout" in trace_stats:
+        parent, name = trace_stats["fanout_op"] or ("", None)
+        features["max_fanout"] = trace_stats["max_fanout"]
+        features["fanout_operation"] = name
+        features["fanout_parent"] = parent
+    return features
 
 
 class Scorer(ABC):
     @abstractmethod
     def score(self, features: Dict, spans: List[Dict]) -> Dict: ...
 
+    def score_many(self, features_list: List[Dict], spans_list: List[List[Dict]]) -> List[Dict]:
+        """Score a micro-batch; defaults to `score` per trace, in order."""
+        return [self.score(f, sp) for f, sp in zip(features_list, spans_list)]
+
+    @property
+    def ready(self) -> bool:
+        """False while the scorer cannot produce verdicts yet (e.g. warmup)."""
+        return True
+
 
 class RuleDetectorScorer(Scorer):
     """Three deterministic trace-level detectors with online rolling stats."""
@@ -77,16 +103,24 @@ class RuleDetectorScorer(Scorer):
         metadata: Dict = {}
         service = features["primary_service"]
 
-        if self._check_n_plus_1(service, features["span_count"]):
+        # Fan-out of the most repeated (parent, operation) pair; span_count
+        # only when the trace fold did not count fan-out.
+        fanout = features.get("max_fanout", features["span_count"])
+        if self._check_n_plus_1(service, fanout):
             reasons.append("n_plus_1")
-            metadata["n_plus_1_count"] = features["span_count"]
+            metadata["n_plus_1_count"] = fanout
+            if features.get("fanout_operation"):
+                metadata["n_plus_1_operation"] = features["fanout_operation"]
 
         pre_var = self._latency_ewma.get(service, {}).get("var", 0.0)
         if self._check_bimodal(service, features["duration_ms"]):
             reasons.append("bimodal_latency")
             metadata["latency_variance"] = pre_var
 
-        dangling = self._find_dangling_span(spans)
+        if "dangling_span" in features:
+            dangling = features["dangling_span"]
+        else:
+            dangling = self._find_dangling_span(spans)
         if dangling:
             reasons.append("dangling_parent")
             metadata["dangling_span"] = dangling
@@ -98,20 +132,20 @@ class RuleDetectorScorer(Scorer):
             "metadata": metadata,
         }
 
-    def _check_n_plus_1(self, service: str, span_count: int) -> bool:
+    def _check_n_plus_1(self, service: str, fanout: int) -> bool:
         stats = self._span_count_stats.setdefault(
             service, {"n": 0, "mean": 0.0, "m2": 0.0}
         )
         fire = False
-        if stats["n"] >= self.N_PLUS_1_WARMUP and span_count >= self.N_PLUS_1_FLOOR:
+        if stats["n"] >= self.N_PLUS_1_WARMUP and fanout >= self.N_PLUS_1_FLOOR:
             variance = stats["m2"] / (stats["n"] - 1) if stats["n"] > 1 else 0.0
             std = math.sqrt(variance)
-            if span_count > stats["mean"] + self.N_PLUS_1_K * std:
+            if fanout > stats["mean"] + self.N_PLUS_1_K * std:
                 fire = True
         stats["n"] += 1
-        delta = span_count - stats["mean"]
+        delta = fanout - stats["mean"]
         stats["mean"] += delta / stats["n"]
-        stats["m2"] += delta * (span_count - stats["mean"])
+        stats["m2"] += delta * (fanout - stats["mean"])
         return fire
 
     def _check_bimodal(self, service: str, duration_ms: float) -> bool:
@@ -142,88 +176,209 @@ class RuleDetectorScorer(Scorer):
         return fire
 
     def _find_dangling_span(self, spans: List[Dict]) -> Optional[str]:
-        span_ids = {s.get("span_id") for s in spans if s.get("span_id")}
-        for s in spans:
-            parent = s.get("parent_span_id") or ""
-            if not parent:
-                continue
-            if parent not in span_ids:
-                return s.get("name", "unknown")
-        return None
+        return TraceIndex(spans).dangling_span
 
 
 class MLScorer(Scorer):
     """Adapter that plugs an ObserveXScorer (five-model ensemble) into the
     `Scorer` contract. Does not call learn_one — the owner of the ML
-    instance is responsible for online updates."""
+    instance is responsible for online updates. `ml_model` may be None
+    (not ready) until the ensemble has been warmed up."""
 
     def __init__(self, ml_model):
         self.ml = ml_model
 
+    @property
+    def ready(self) -> bool:
+        return self.ml is not None
+
     def score(self, features: Dict, spans: List[Dict]) -> Dict:
-        r = self.ml.score_one(features)
+        return self._verdict(self.ml.score_one(features))
+
+    def score_many(self, features_list: List[Dict], spans_list: List[List[Dict]]) -> List[Dict]:
+        return [self._verdict(r) for r in self.ml.score_many(features_list)]
+
+    @staticmethod
+    def _verdict(r: Dict) -> Dict:
         is_anom = bool(r.get("is_anomaly", False))
+        skipped = r.get("skipped") or []
+        # Models the cascade skipped have no score; they are left out of
+        # per_model and listed in metadata instead of reading as 0.0.
         per_model = {k: v for k, v in r.items()
-                     if k not in ("aggregate_score", "is_anomaly", "observations")}
+                     if k not in ("aggregate_score", "is_anomaly", "observations", "skipped")
+                     and k not in skipped}
         reason_tag = "ml_ensemble" if is_anom else None
         return {
             "score": float(r.get("aggregate_score", 0.0)),
             "is_anomaly": is_anom,
             "reasons": [reason_tag] if reason_tag else [],
-            "metadata": {},
+            "metadata": {"ml_skipped_models": list(skipped)} if skipped else {},
             "per_model": per_model,
         }
 
 
 class CompositeScorer(Scorer):
-    """Runs a list of scorers; score = max, reasons/metadata/per_model unioned."""
+    """Runs a list of scorers; score = max, reasons/metadata/per_model unioned.
+
+    Scorers that are not `ready` are skipped and the verdict is marked
+    `ml_pending` (only the ML adapter can be pending today)."""
 
     def __init__(self, scorers: List[Scorer]):
         self.scorers = scorers
 
     def score(self, features: Dict, spans: List[Dict]) -> Dict:
+        active = [s for s in self.scorers if s.ready]
+        pending = len(active) < len(self.scorers)
+        return self._merge([s.score(features, spans) for s in active], pending)
+
+    def score_many(self, features_list: List[Dict], spans_list: List[List[Dict]]) -> List[Dict]:
+        active = [s for s in self.scorers if s.ready]
+        pending = len(active) < len(self.scorers)
+        per_scorer = [s.score_many(features_list, spans_list) for s in active]
+        if not per_scorer:
+            return [self._merge([], pending) for _ in features_list]
+        return [self._merge(list(rs), pending) for rs in zip(*per_scorer)]
+
+    @staticmethod
+    def _merge(results: List[Dict], pending: bool = False) -> Dict:
         top = 0.0
         reasons: List[str] = []
         metadata: Dict = {}
         per_model: Dict = {}
-        for s in self.scorers:
-            r = s.score(features, spans)
+        for r in results:
             if r["score"] > top:
                 top = r["score"]
             reasons.extend(r.get("reasons", []))
             metadata.update(r.get("metadata", {}))
             per_model.update(r.get("per_model", {}))
+        if pending:
+            metadata["ml_pending"] = True
         return {
             "score": top,
             "is_anomaly": bool(reasons),
             "reasons": reasons,
             "metadata": metadata,
             "per_model": per_model,
+            "ml_pending": pending,
         }
 
 
+class ServiceDetectorState:
+    """All trace-scoring state for one primary service.
+
+    Lives in the dataflow's keyed state (one instance per service key), so
+    Welford/EWMA baselines shard across workers by key and are snapshotted
+    with the rest of the dataflow. Everything here must stay picklable.
+    The ML ensemble is owned by the dataflow's model pool and attached only
+    for the duration of a batch, so keyed state never pins it in memory.
+    """
+
+    def __init__(self, ml_model=None):
+        self.rules = RuleDetectorScorer()
+        self.ml = None
+        self._ml_adapter = MLScorer(None)
+        self.scorer = CompositeScorer([self.rules, self._ml_adapter])
+        if ml_model is not None:
+            self.attach_ml(ml_model)
+
+    def attach_ml(self, ml_model) -> None:
+        """Score with `ml_model` from now on; None switches back to rules-only."""
+        self.ml = ml_model
+        self._ml_adapter.ml = ml_model
+
+    @contextmanager
+    def using_ml(self, ml_model):
+        """`attach_ml` for the body of a with block; detached again on exit,
+        also when scoring raises, so a leased model never outlives its lease."""
+        self.attach_ml(ml_model)
+        try:
+            yield self
+        finally:
+            self.attach_ml(None)
+
+    def score(self, features: Dict, spans: List[Dict]) -> Dict:
+        """Score one trace, then let the ML ensemble learn from it."""
+        verdict = self.scorer.score(features, spans)
+        if self.ml is not None:
+            self.ml.learn_one(features)
+        return verdict
+
+    def score_many(self, features_list: List[Dict], spans_list: List[List[Dict]]) -> List[Dict]:
+        """Score a window's traces as one batch, then learn from each in order.
+        Rules still update per trace; the ML ensemble sees the batch against
+        the model state from before the batch."""
+        verdicts = self.scorer.score_many(features_list, spans_list)
+        if self.ml is not None:
+            for features in features_list:
+                self.ml.learn_one(features)
+        return verdicts
+
+
 class PIIDensityDetector:
-    """Paper §IV-C: redaction ratio per service over a sliding 60s window."""
+    """Paper §IV-C: redaction ratio per service over a sliding 60s window.
+
+    Counts live in a fixed ring of BUCKET_SEC-wide buckets per service with
+    running totals, so `observe` is O(1) and memory per service does not
+    grow with the log rate. The window edge is quantised to one bucket.
+    """
 
     WINDOW_SEC = 60
+    BUCKET_SEC = 1
     THRESHOLD = 0.8
     MIN_LOGS = 5
     COOLDOWN_SEC = 60
 
     def __init__(self):
-        self._buffers: Dict[str, deque] = {}
+        self._n_buckets = max(1, math.ceil(self.WINDOW_SEC / self.BUCKET_SEC))
+        self._buffers: Dict[str, Dict] = {}
         self._last_fired: Dict[str, float] = {}
 
+    def _ring(self, service: str) -> Dict:
+        ring = self._buffers.get(service)
+        if ring is None:
+            ring = {
+                "totals": [0] * self._n_buckets,
+                "redacted": [0] * self._n_buckets,
+                "head": -1,  # newest absolute bucket index seen
+                "total": 0,
+                "redacted_total": 0,
+            }
+            self._buffers[service] = ring
+        return ring
+
+    def _advance(self, ring: Dict, slot: int) -> None:
+        """Expire every bucket that has fallen out of the window by `slot`.
+        Touches at most `_n_buckets` cells, however long the gap."""
+        head = ring["head"]
+        if slot <= head:
+            return
+        n = self._n_buckets
+        for s in range(max(head + 1, slot - n + 1), slot + 1):
+            idx = s % n
+            ring["total"] -= ring["totals"][idx]
+            ring["redacted_total"] -= ring["redacted"][idx]
+            ring["totals"][idx] = 0
+            ring["redacted"][idx] = 0
+        ring["head"] = slot
+
     def observe(self, service: str, is_redacted: bool) -> Optional[Dict]:
         now = time.time()
-        buf = self._buffers.setdefault(service, deque())
-        buf.append((now, is_redacted))
-        while buf and (now - buf[0][0]) > self.WINDOW_SEC:
-            buf.popleft()
-        if len(buf) < self.MIN_LOGS:
+        slot = int(now // self.BUCKET_SEC)
+        ring = self._ring(service)
+        self._advance(ring, slot)
+        # A clock step backwards lands in the newest bucket instead.
+        idx = ring["head"] % self._n_buckets
+        ring["totals"][idx] += 1
+        ring["total"] += 1
+        if is_redacted:
+            ring["redacted"][idx] += 1
+            ring["redacted_total"] += 1
+
+        count = ring["total"]
+        if count < self.MIN_LOGS:
             return None
-        redacted = sum(1 for _, r in buf if r)
-        ratio = redacted / len(buf)
+        redacted = ring["redacted_total"]
+        ratio = redacted / count
         if ratio <= self.THRESHOLD:
             return None
         if now - self._last_fired.get(service, 0) < self.COOLDOWN_SEC:
@@ -232,11 +387,49 @@ class PIIDensityDetector:
         return {
             "service": service,
             "redaction_ratio": ratio,
-            "window_log_count": len(buf),
+            "window_log_count": count,
             "redacted_count": redacted,
         }
 
 
+DEFAULT_REDACTION_TOKENS = ("[REDACTED_EMAIL]", "[REDACTED_AUTHOR]", "[REDACTED_CC]")
+
+
+def _token_kind(token: str) -> str:
+    """"[REDACTED_EMAIL]" -> "email"; used as the per-kind metric suffix."""
+    kind = token.strip("[]<>{}() ").lower()
+    if kind.startswith("redacted_"):
+        kind = kind[len("redacted_"):]
+    return re.sub(r"[^a-z0-9]+", "_", kind).strip("_") or "token"
+
+
+class RedactionMatcher:
+    """Counts every redaction token kind in a log body in a single scan.
+
+    All tokens are compiled into one alternation (longest first, so a token
+    that prefixes another never shadows it), replacing a substring search
+    per token.
+    """
+
+    def __init__(self, tokens=DEFAULT_REDACTION_TOKENS):
+        self.tokens = tuple(dict.fromkeys(t for t in tokens if t))
+        if not self.tokens:
+            raise ValueError("RedactionMatcher needs at least one token")
+        self.kinds: Dict[str, str] = {t: _token_kind(t) for t in self.tokens}
+        ordered = sorted(self.tokens, key=len, reverse=True)
+        self._pattern = re.compile("|".join(re.escape(t) for t in ordered))
+
+    def count(self, body: str) -> Dict[str, int]:
+        """Return {kind: occurrences}; empty when the body has no tokens."""
+        counts: Dict[str, int] = {}
+        if not body:
+            return counts
+        for tok in self._pattern.findall(body):
+            kind = self.kinds[tok]
+            counts[kind] = counts.get(kind, 0) + 1
+        return counts
+
+
 # ---- Reason → payload helpers ---------------------------------------------
 
 def build_rule_flags(reasons: List[str], metadata: Dict) -> Dict:
@@ -245,12 +438,14 @@ def build_rule_flags(reasons: List[str], metadata: Dict) -> Dict:
     return {
         "n_plus_1": "n_plus_1" in reasons,
         "n_plus_1_count": int(metadata.get("n_plus_1_count", 0)),
+        "n_plus_1_operation": metadata.get("n_plus_1_operation"),
         "bimodal_latency": "bimodal_latency" in reasons,
         "latency_variance": float(metadata.get("latency_variance", 0.0)),
         "dependency_break": "dangling_parent" in reasons,
         "dangling_span": metadata.get("dangling_span"),
         "pii_density": False,
         "redaction_ratio": 0.0,
+        "ml_pending": bool(metadata.get("ml_pending", False)),
     }
 
 
@@ -0,0 +1,55 @@
+"""Page-Hinkley drift detection for the ML retrain schedule.
+
+Values are standardised against a reference window (the first
+`min_instances` values after construction or reset), so one set of
+parameters works for features on very different scales. Two-sided: both
+upward and downward mean shifts are reported.
+"""
+import math
+
+
+class PageHinkley:
+
+    def __init__(self, delta=0.5, threshold=15.0, alpha=0.9999,
+                 min_instances=30, min_std=1e-3):
+        self.delta = delta                  # tolerated shift, in reference σ
+        self.threshold = threshold          # alarm level, in reference σ
+        self.alpha = alpha                  # fading factor on the cumulative sums
+        self.min_instances = min_instances
+        self.min_std = min_std
+        self.reset()
+
+    def reset(self):
+        self.n = 0
+        self._ref_mean = 0.0
+        self._ref_m2 = 0.0
+        self._std = None
+        self._sum_up = 0.0
+        self._sum_down = 0.0
+        self._min_up = 0.0
+        self._min_down = 0.0
+
+    def update(self, x) -> bool:
+        """Feed one value; True when a shift is detected (the detector then
+        resets and learns a new reference window)."""
+        self.n += 1
+        if self._std is None:
+            # Still learning the reference window (Welford).
+            delta = x - self._ref_mean
+            self._ref_mean += delta / self.n
+            self._ref_m2 += delta * (x - self._ref_mean)
+            if self.n >= self.min_instances:
+                var = self._ref_m2 / (self.n - 1) if self.n > 1 else 0.0
+                self._std = max(math.sqrt(var), self.min_std)
+            return False
+
+        z = (x - self._ref_mean) / self._std
+        self._sum_up = self.alpha * self._sum_up + (z - self.delta)
+        self._sum_down = self.alpha * self._sum_down + (-z - self.delta)
+        self._min_up = min(self._min_up, self._sum_up)
+        self._min_down = min(self._min_down, self._sum_down)
+        if (self._sum_up - self._min_up > self.threshold
+                or self._sum_down - self._min_down > self.threshold):
+            self.reset()
+            return True
+        return False
@@ -0,0 +1,94 @@
+"""Array-form inference for a fitted scikit-learn IsolationForest.
+
+`FlatIsolationForest.from_sklearn(iso)` exports every tree into padded
+NumPy node arrays so a batch is scored by one vectorised walk over all
+(tree, sample) pairs instead of sklearn's input validation and per-tree
+`apply` calls. `score_samples` matches `IsolationForest.score_samples`. Exported per
+tree, then raveled into one array each:
+
+    feature[T, N]    split feature column (leaves: 0)
+    threshold[T, N]  split value (x <= threshold goes left, as in sklearn)
+    left[T, N]       left child index (leaves point to themselves)
+    right[T, N]      right child index (leaves point to themselves)
+    path[T, N]       leaf depth + c(n_node_samples), the path-length
+                     adjustment for unresolved leaf samples
+"""
+import numpy as np
+
+
+def _average_path_length(n):
+    """c(n): average unsuccessful-search path length in a BST of n nodes."""
+    n = np.asarray(n, dtype=float)
+    out = np.zeros_like(n)
+    out[n == 2] = 1.0
+    big = n > 2
+    out[big] = 2.0 * (np.log(n[big] - 1.0) + np.euler_gamma) - 2.0 * (n[big] - 1.0) / n[big]
+    return out
+
+
+class FlatIsolationForest:
+
+    def __init__(self, feature, threshold, left, right, path, max_depth, denominator):
+        self.n_trees, self.width = feature.shape
+        self.max_depth = max_depth
+        self.denominator = denominator
+        # Stored raveled, children as global indices, so a traversal step
+        # over all (tree, sample) pairs is plain 1-D gathers.
+        offset = (np.arange(self.n_trees) * self.width)[:, None]
+        self._roots = offset.astype(np.intp)
+        self._feature = feature.ravel().astype(np.intp)
+        self._threshold = threshold.ravel()
+        self._left = (left + offset).ravel().astype(np.intp)
+        self._right = (right + offset).ravel().astype(np.intp)
+        self._path = path.ravel()
+
+    @classmethod
+    def from_sklearn(cls, iso):
+        trees = [est.tree_ for est in iso.estimators_]
+        n_features = iso.n_features_in_
+        width = max(t.node_count for t in trees)
+        shape = (len(trees), width)
+        feature = np.zeros(shape, dtype=np.intp)
+        threshold = np.zeros(shape, dtype=float)
+        left = np.tile(np.arange(width, dtype=np.intp), (len(trees), 1))
+        right = left.copy()
+        path = np.zeros(shape, dtype=float)
+        max_depth = 0
+
+        for i, (tree, columns) in enumerate(zip(trees, iso.estimators_features_)):
+            n = tree.node_count
+            internal = tree.children_left[:n] != -1
+            # Trees fitted on a feature subset index into that subset.
+            columns = np.asarray(columns, dtype=np.intp)
+            cols = columns if len(columns) != n_features else np.arange(n_features)
+            feature[i, :n][internal] = cols[tree.feature[:n][internal]]
+            threshold[i, :n][internal] = tree.threshold[:n][internal]
+            left[i, :n][internal] = tree.children_left[:n][internal]
+            right[i, :n][internal] = tree.children_right[:n][internal]
+
+            depth = np.zeros(n, dtype=np.intp)
+            for node in range(n):  # children always follow their parent
+                if internal[node]:
+                    depth[tree.children_left[node]] = depth[node] + 1
+                    depth[tree.children_right[node]] = depth[node] + 1
+            max_depth = max(max_depth, int(depth.max()))
+            path[i, :n] = depth + _average_path_length(tree.n_node_samples[:n])
+
+        denominator = len(trees) * float(_average_path_length([iso.max_samples_])[0])
+        return cls(feature, threshold, left, right, path, max_depth, denominator)
+
+    def score_samples(self, X):
+        """Same values as `IsolationForest.score_samples(X)`: the opposite of
+        the anomaly score, lower is more abnormal."""
+        # sklearn's trees compare in float32.
+        X = np.asarray(X, dtype=np.float32).astype(float)
+        shape = (self.n_trees, len(X))
+        rows = np.broadcast_to(np.arange(len(X))[None, :], shape)
+        idx = np.broadcast_to(self._roots, shape)
+        for _ in range(self.max_depth):
+            go_left = X[rows, self._feature[idx]] <= self._threshold[idx]
+            idx = np.where(go_left, self._left[idx], self._right[idx])
+        depths = self._path[idx].sum(axis=0)
+        if self.denominator == 0:
+            return -np.ones(len(X))
+        return -(2.0 ** (-depths / self.denominator))
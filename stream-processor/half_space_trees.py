@@ -0,0 +1,162 @@
+"""Array-backed Half-Space Trees (Tan, Ting & Liu, 2011).
+
+Drop-in replacement for `river.anomaly.HalfSpaceTrees` as used by
+ObserveXScorer: same constructor arguments, same tree construction (same
+`random.Random(seed)` draw sequence, so identical splits), same window
+pivot and the same score in [0, 1] where higher means more anomalous.
+
+Each forest is stored as heap-ordered NumPy arrays — node i has children
+2i+1 / 2i+2 — so one traversal step moves every (tree, sample) pair at once:
+
+    feature[T, n_internal]    split feature index
+    threshold[T, n_internal]  split value (x < threshold goes left)
+    l_mass[T, n_nodes]        mass counted in the current (latest) window
+    r_mass[T, n_nodes]        mass from the previous (reference) window
+"""
+import random
+
+import numpy as np
+
+
+class HalfSpaceTrees:
+
+    PADDING = 0.15
+
+    def __init__(self, n_trees=10, height=8, window_size=250, limits=None,
+                 seed=None, features=None):
+        self.n_trees = n_trees
+        self.height = height
+        self.window_size = window_size
+        self.limits = dict(limits or {})
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.counter = 0
+        self._first_window = True
+
+        self.features = None
+        self.feature = None
+        self.threshold = None
+        self.l_mass = None
+        self.r_mass = None
+        if features is not None:
+            self._build(list(features))
+
+    # ── Construction ────────────────────────────────────────────────
+
+    @property
+    def size_limit(self):
+        return 0.1 * self.window_size
+
+    @property
+    def max_score(self):
+        return self.n_trees * self.window_size * (2 ** (self.height + 1) - 1)
+
+    def _build(self, features):
+        self.features = list(features)
+        n_internal = 2 ** self.height - 1
+        n_nodes = 2 ** (self.height + 1) - 1
+        self.feature = np.zeros((self.n_trees, n_internal), dtype=np.intp)
+        self.threshold = np.zeros((self.n_trees, n_internal), dtype=float)
+        self.l_mass = np.zeros((self.n_trees, n_nodes), dtype=np.int64)
+        self.r_mass = np.zeros((self.n_trees, n_nodes), dtype=np.int64)
+        for t in range(self.n_trees):
+            # river draws over the features in sorted-name order.
+            limits = {f: tuple(self.limits.get(f, (0.0, 1.0))) for f in sorted(self.features)}
+            self._build_node(t, 0, self.height, limits)
+
+    def _build_node(self, t, node, height, limits):
+        # Same draw order as river's make_padded_tree: pick the feature
+        # (weighted by range), pick the split, then left subtree, then right.
+        if height == 0:
+            return
+        names = list(limits)
+        on = self.rng.choices(
+            population=names, weights=[limits[f][1] - limits[f][0] for f in names]
+        )[0]
+        a, b = limits[on]
+        at = self.rng.uniform(a + self.PADDING * (b - a), b - self.PADDING * (b - a))
+        self.feature[t, node] = self.features.index(on)
+        self.threshold[t, node] = at
+
+        limits[on] = (a, at)
+        self._build_node(t, 2 * node + 1, height - 1, limits)
+        limits[on] = (at, b)
+        self._build_node(t, 2 * node + 2, height - 1, limits)
+        limits[on] = (a, b)
+
+    # ── Traversal ───────────────────────────────────────────────────
+
+    def _paths(self, X):
+        """Node index at every depth for every (tree, sample): (h+1, T, m)."""
+        m = X.shape[0]
+        trees = np.arange(self.n_trees)[:, None]
+        idx = np.zeros((self.n_trees, m), dtype=np.intp)
+        paths = np.empty((self.height + 1, self.n_trees, m), dtype=np.intp)
+        cols = np.arange(m)[None, :]
+        for depth in range(self.height):
+            paths[depth] = idx
+            f = self.feature[trees, idx]
+            go_right = X[cols, f] >= self.threshold[trees, idx]
+            idx = 2 * idx + 1 + go_right
+        paths[self.height] = idx
+        return paths
+
+    def _matrix(self, x):
+        return np.array([[float(x.get(f, 0.0)) for f in self.features]])
+
+    # ── Learning ────────────────────────────────────────────────────
+
+    def learn_one(self, x):
+        if self.features is None:
+            self._build(list(x))
+        self.learn_many(self._matrix(x))
+        return self
+
+    def learn_many(self, X):
+        """Learn rows of X (columns in `features` order) in order, pivoting
+        the window exactly where row-by-row learning would."""
+        X = np.asarray(X, dtype=float)
+        if X.ndim != 2 or X.shape[0] == 0:
+            return self
+        if self.features is None:
+            raise ValueError("features must be set before learn_many")
+        trees = np.arange(self.n_trees)[None, :, None]
+        start = 0
+        while start < len(X):
+            take = min(self.window_size - self.counter, len(X) - start)
+            chunk = X[start:start + take]
+            paths = self._paths(chunk)
+            if take == 1:
+                # One path per tree visits distinct nodes: plain fancy add.
+                self.l_mass[trees[0, :, 0], paths[:, :, 0]] += 1
+            else:
+                np.add.at(self.l_mass, (np.broadcast_to(trees, paths.shape), paths), 1)
+            self.counter += take
+            start += take
+            if self.counter == self.window_size:
+                self.r_mass = self.l_mass
+                self.l_mass = np.zeros_like(self.r_mass)
+                self._first_window = False
+                self.counter = 0
+        return self
+
+    # ── Scoring ─────────────────────────────────────────────────────
+
+    def score_one(self, x):
+        if self._first_window or self.features is None:
+            return 0
+        return float(self.score_many(self._matrix(x))[0])
+
+    def score_many(self, X):
+        X = np.asarray(X, dtype=float)
+        if self._first_window or self.features is None:
+            return np.zeros(len(X))
+        paths = self._paths(X)
+        trees = np.arange(self.n_trees)[None, :, None]
+        mass = self.r_mass[trees, paths]                       # (h+1, T, m)
+        below = mass < self.size_limit
+        # A walk stops after the first node whose mass is below the limit.
+        reached = (np.cumsum(below, axis=0) - below) == 0
+        weights = (2.0 ** np.arange(self.height + 1))[:, None, None]
+        score = (mass * weights * reached).sum(axis=(0, 1))
+        return 1 - score / self.max_score
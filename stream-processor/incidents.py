@@ -0,0 +1,129 @@
+"""Group per-trace alerts into incidents.
+
+During an incident every slow trace of one service/route becomes an
+anomaly, and without grouping each one is an alert row, a WebSocket message
+and a candidate for RCA. `IncidentAggregator` keys alerts by
+(service, route, anomaly_type):
+
+  * the first alert for a key opens an incident; that alert is sent as
+    usual, together with an "open" event;
+  * later alerts only bump its occurrence count and scores, and the first
+    `max_exemplars` trace ids are kept as exemplars;
+  * `sweep` emits an "update" at most every `update_sec` while the count
+    changes, and a "resolve" once the key has been quiet for `window_sec`.
+
+Sweeps are driven by traffic (the dataflow calls `sweep` as traces and logs
+pass), so when the whole stream stops incidents resolve once it resumes.
+"""
+import time
+import hashlib
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+
+class _Incident:
+    __slots__ = ("incident_id", "service", "route", "anomaly_type", "opened_at",
+                 "last_seen", "occurrences", "score_sum", "max_score", "exemplars",
+                 "emitted_occurrences", "emitted_at")
+
+    def __init__(self, key, now: float):
+        self.service, self.route, self.anomaly_type = key
+        digest = hashlib.blake2b(f"{key}|{now!r}".encode(), digest_size=8).hexdigest()
+        self.incident_id = f"inc-{digest}"
+        self.opened_at = self.last_seen = self.emitted_at = now
+        self.occurrences = 0
+        self.emitted_occurrences = 0
+        self.score_sum = 0.0
+        self.max_score = 0.0
+        self.exemplars: List[str] = []
+
+    def event(self, kind: str, now: float) -> Dict:
+        self.emitted_occurrences = self.occurrences
+        self.emitted_at = now
+        return {
+            "event": kind,
+            "incident_id": self.incident_id,
+            "service": self.service,
+            "route": self.route,
+            "anomaly_type": self.anomaly_type,
+            "opened_at": _iso(self.opened_at),
+            "last_seen": _iso(self.last_seen),
+            "resolved_at": _iso(now) if kind == "resolve" else None,
+            "occurrences": self.occurrences,
+            "max_score": self.max_score,
+            "mean_score": self.score_sum / max(1, self.occurrences),
+            "exemplar_trace_ids": list(self.exemplars),
+        }
+
+
+class IncidentAggregator:
+
+    def __init__(self, window_sec: float = 300.0, update_sec: float = 30.0,
+                 max_exemplars: int = 5, max_open: int = 10_000, sweep_sec: float = 1.0):
+        self.window_sec = float(window_sec)
+        self.update_sec = float(update_sec)
+        self.max_exemplars = int(max_exemplars)
+        self.max_open = int(max_open)
+        self.sweep_sec = float(sweep_sec)
+        self._open: Dict[Tuple, _Incident] = {}
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+        self.suppressed = 0
+
+    def record(self, alert: Dict, now: Optional[float] = None) -> Tuple[List[Dict], bool]:
+        """Fold one alert in. Returns (events, whether its trace is kept as an
+        exemplar); the events end with "open" if this alert opened an
+        incident, after any incident it displaced was resolved."""
+        now = time.time() if now is None else now
+        key = (alert["service"], alert["route"], alert.get("anomaly_type"))
+        score = float(alert.get("anomaly_score") or 0.0)
+        events = []
+        with self._lock:
+            incident = self._open.get(key)
+            if incident is not None and now - incident.last_seen >= self.window_sec:
+                # Quiet for a full window but not swept yet.
+                events.append(self._open.pop(key).event("resolve", now))
+                incident = None
+            if incident is None:
+                if len(self._open) >= self.max_open:
+                    oldest = min(self._open, key=lambda k: self._open[k].last_seen)
+                    events.append(self._open.pop(oldest).event("resolve", now))
+                incident = self._open[key] = _Incident(key, now)
+            else:
+                self.suppressed += 1
+            incident.occurrences += 1
+            incident.last_seen = now
+            incident.score_sum += score
+            incident.max_score = max(incident.max_score, score)
+            exemplar = len(incident.exemplars) < self.max_exemplars
+            if exemplar:
+                incident.exemplars.append(alert["trace_id"])
+            if incident.occurrences == 1:
+                events.append(incident.event("open", now))
+        return events, exemplar
+
+    def sweep(self, now: Optional[float] = None, force: bool = False) -> List[Dict]:
+        """Due "update" and "resolve" events; a no-op more often than every
+        `sweep_sec` unless `force`."""
+        now = time.time() if now is None else now
+        events = []
+        with self._lock:
+            if not force and now - self._last_sweep < self.sweep_sec:
+                return events
+            self._last_sweep = now
+            for key, incident in list(self._open.items()):
+                if now - incident.last_seen >= self.window_sec:
+                    events.append(incident.event("resolve", now))
+                    del self._open[key]
+                elif incident.occurrences != incident.emitted_occurrences and \
+                        now - incident.emitted_at >= self.update_sec:
+                    events.append(incident.event("update", now))
+        return events
+
+    def open_count(self) -> int:
+        return len(self._open)
@@ -1,11 +1,12 @@
 """Five-model streaming ML scorer for ObserveX anomaly detection.
 
 Implements the paper's ensemble ML engine (Section III.D):
-  1. Half-Space Trees (River, online)
-  2. Isolation Forest (scikit-learn, batch retrained on sliding window)
-  3. One-Class SVM (scikit-learn, batch retrained on sliding window)
-  4. Autoencoder / MLP (scikit-learn, batch retrained on sliding window)
-  5. Local Outlier Factor (scikit-learn, batch retrained on sliding window)
+  1. Half-Space Trees (NumPy port of River's, online)
+  2. Isolation Forest (scikit-learn, batch retrained on drift; scored from
+     the flat array export in flat_iforest.py)
+  3. One-Class SVM (scikit-learn, batch retrained on drift)
+  4. Autoencoder / MLP (scikit-learn, batch retrained on drift)
+  5. Local Outlier Factor (scikit-learn, batch retrained on drift)
 
 Scores from all five models are min-max normalised to [0, 1] and combined
 via soft-voting aggregation (60% ML avg + 40% rule score). A trace is flagged
@@ -14,12 +15,37 @@ as anomalous when the aggregate score exceeds a calibrated threshold.
 Warmed up at startup on the synthetic telemetry corpus
 (`synthetic_telemetry.jsonl`) that matches the live OTel feature space
 (duration_ms, span_count, error_rate), then continues learning online.
+
+Batch models are refit only when a Page-Hinkley detector (drift.py) sees the
+feature stream or the ensemble score shift, bounded by a minimum and maximum
+interval, on a reservoir sample of the normal traffic since the last fit.
+Fits run on a shared background thread pool; the fitted set is swapped in as
+one object, so scoring always sees a single consistent generation and never
+waits on a fit.
+
+`save_snapshot` / `load_latest_snapshot` persist whole ensembles (HS-Trees,
+fitted batch models, buffer, observation count) so a restart can skip
+warmup.
 """
+import os
+import glob
+import json
+import time
+import pickle
+import random
+import hashlib
 import logging
+import threading
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 
+from drift import PageHinkley
+from flat_iforest import FlatIsolationForest
+from half_space_trees import HalfSpaceTrees
+from self_metrics import histogram
+
 # Suppress sklearn convergence/fit warnings during background retraining
 warnings.filterwarnings("ignore")
 
@@ -36,18 +62,115 @@ except ImportError:
     _HAS_SKLEARN = False
     logger.warning("scikit-learn not installed; batch ML models will be disabled.")
 
-# ── River import (with graceful fallback) ───────────────────────────
-try:
-    from river.anomaly import HalfSpaceTrees
-except ImportError:
-    class HalfSpaceTrees:
-        """Dummy fallback so imports don't explode in envs without River."""
-        def __init__(self, **kwargs):
-            self.kwargs = kwargs
-        def learn_one(self, x):
-            pass
-        def score_one(self, x):
-            return 0.5
+
+# ── Scoring cascade ─────────────────────────────────────────────────
+# With the default bands (= ANOMALY_THRESHOLD, 0.5) the cascade never changes
+# a verdict; widening them trades exactness for more skips. Set
+# OBSERVEX_CASCADE=0 to always run every model.
+CASCADE_ENABLED = os.getenv("OBSERVEX_CASCADE", "1") != "0"
+CASCADE_NORMAL_MAX = float(os.getenv("OBSERVEX_CASCADE_NORMAL_MAX", "0.5"))
+CASCADE_ANOMALY_MIN = float(os.getenv("OBSERVEX_CASCADE_ANOMALY_MIN", "0.5"))
+EXPENSIVE_MODELS = ("one_class_svm", "autoencoder_mse", "lof")
+
+# ── Drift-triggered retrain schedule ─────────────────────────────
+# Intervals count normal (error-free) observations since the last fit. A
+# detected drift retrains no sooner than the minimum interval; without drift
+# the models are still refreshed once the maximum interval has passed.
+RETRAIN_MIN_INTERVAL = int(os.getenv("OBSERVEX_RETRAIN_MIN_INTERVAL", "50"))
+RETRAIN_MAX_INTERVAL = int(os.getenv("OBSERVEX_RETRAIN_MAX_INTERVAL", "5000"))
+RESERVOIR_SIZE = int(os.getenv("OBSERVEX_RESERVOIR_SIZE", "500"))
+DRIFT_FEATURES = ("duration_ms", "span_count")  # error_rate is 0 on every training row
+# Pickled size of one reservoir row (a list of three floats), for estimated_bytes.
+RESERVOIR_ROW_BYTES = 32
+
+# ── Background retrain pool (shared by every scorer in the process) ─
+# 0 disables the pool and refits inline on the caller's thread.
+RETRAIN_WORKERS = int(os.getenv("OBSERVEX_RETRAIN_WORKERS", "1"))
+
+MODEL_SECONDS = histogram(
+    "observex_model_score_seconds", "Time per score_many batch, by model", ("model",)
+)
+RETRAIN_SECONDS = histogram(
+    "observex_retrain_seconds", "Batch model refit time",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+
+_retrain_pool = None
+_retrain_lock = threading.Lock()
+_retrain_pending = 0
+
+
+def _get_retrain_pool():
+    global _retrain_pool
+    with _retrain_lock:
+        if _retrain_pool is None:
+            _retrain_pool = ThreadPoolExecutor(
+                max_workers=RETRAIN_WORKERS, thread_name_prefix="observex-retrain"
+            )
+        return _retrain_pool
+
+
+def retrain_queue_depth():
+    """Retrains submitted to the pool and not yet finished (all scorers)."""
+    return _retrain_pending
+
+
+class _BatchModels:
+    """One fitted generation of the four batch models. Never mutated after
+    construction; replaced wholesale on retrain.
+
+    `iso_flat` is the Isolation Forest exported to node arrays, regenerated
+    with every generation and used for scoring in place of `iso`. `nbytes`
+    is the pickled size, measured once where the generation is built (the
+    retrain thread) so the model pool never serialises on the hot path."""
+
+    __slots__ = ("iso", "iso_flat", "svm", "lof", "ae", "generation", "nbytes")
+
+    def __init__(self, iso, svm, lof, ae, generation):
+        self.iso = iso
+        self.iso_flat = FlatIsolationForest.from_sklearn(iso)
+        self.svm = svm
+        self.lof = lof
+        self.ae = ae
+        self.generation = generation
+        self.nbytes = 0
+        self.nbytes = len(pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        if isinstance(state, tuple):  # default slots pickling (older snapshots)
+            state = state[1]
+        for name, value in state.items():
+            setattr(self, name, value)
+        if "iso_flat" not in state:
+            self.iso_flat = FlatIsolationForest.from_sklearn(self.iso)
+        if "nbytes" not in state:
+            self.nbytes = 0
+            self.nbytes = len(pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def _fit_batch_models(X, generation):
+    iso = IsolationForest(contamination=0.1, random_state=42)
+    svm = OneClassSVM(kernel="rbf", gamma="scale", nu=0.1)
+    lof = LocalOutlierFactor(n_neighbors=20, novelty=True)
+    ae = MLPRegressor(
+        hidden_layer_sizes=(16, 8, 16),
+        activation="relu",
+        solver="adam",
+        max_iter=200,
+        random_state=42,
+    )
+    iso.fit(X)
+    svm.fit(X)
+    lof.fit(X)
+    ae.fit(X, X)  # Autoencoder: reconstruct input
+    return _BatchModels(iso, svm, lof, ae, generation)
+
+
+# Column order of every feature matrix (and of snapshot schema checks).
+FEATURE_SCHEMA = ("duration_ms", "span_count", "error_rate")
 
 
 def _feature_vec(features):
@@ -60,63 +183,146 @@ def _feature_vec(features):
     }
 
 
+def load_corpus_matrix(path):
+    """Read the span-level synthetic corpus (JSONL) into an (n × 3) raw
+    feature matrix — duration_ms, span_count=1, error_rate=0 — in one pass."""
+    durations = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+            except Exception:
+                continue
+            durations.append(float(rec.get("duration_ms", 0) or 0))
+    d = np.asarray(durations, dtype=float)
+    return np.column_stack([d, np.ones_like(d), np.zeros_like(d)])
+
+
 class ObserveXScorer:
     """Five-model ensemble anomaly scorer (paper Section III.D).
 
     Soft-voting aggregation: aggregate = 0.6 × ML_avg + 0.4 × rule_score.
     Anomaly threshold: aggregate > 0.5.
+
+    Cascade: the rule score, HS-Trees and Isolation Forest are computed
+    first. Because every model score lies in [0, 1], they bound the final
+    aggregate; a trace whose upper bound is ≤ `cascade_normal_max` or whose
+    lower bound is > `cascade_anomaly_min` skips the expensive models
+    (EXPENSIVE_MODELS) and reports the lower bound as its aggregate.
+
+    Retraining: normal observations feed a uniform reservoir (RESERVOIR_SIZE)
+    and per-feature Page-Hinkley detectors; scored aggregates feed one more.
+    A drift empties the reservoir so the next fit sees only post-shift
+    traffic, and the fit runs once BUFFER_SIZE rows have arrived and
+    `retrain_min_interval` has passed. `retrain_max_interval` forces a
+    refresh when nothing drifts.
     """
 
     HS_NORMALIZER = 0.8
     ANOMALY_THRESHOLD = 0.5
 
-    # Sliding window for batch model retraining
+    # Minimum reservoir rows for a batch fit
     BUFFER_SIZE = 100
 
-    def __init__(self):
-        # ── 1. HS-Trees (online, River) ─────────────────────────────
+    def __init__(self, cascade=None, cascade_normal_max=None, cascade_anomaly_min=None,
+                 retrain_min_interval=None, retrain_max_interval=None):
+        self.cascade = CASCADE_ENABLED if cascade is None else cascade
+        self.cascade_normal_max = (
+            CASCADE_NORMAL_MAX if cascade_normal_max is None else cascade_normal_max
+        )
+        self.cascade_anomaly_min = (
+            CASCADE_ANOMALY_MIN if cascade_anomaly_min is None else cascade_anomaly_min
+        )
+        self._cascade_scored = 0
+        self._cascade_normal = 0
+        self._cascade_anomalous = 0
+
+        # ── 1. HS-Trees (online, array-backed) ──────────────────────
         self.hs_trees = HalfSpaceTrees(
             n_trees=25,
             height=8,
             window_size=100,
             seed=42,
+            features=FEATURE_SCHEMA,
         )
 
         # ── 2–5. Batch models (scikit-learn) ────────────────────────
-        if _HAS_SKLEARN:
-            self.iso_model = IsolationForest(
-                contamination=0.1, random_state=42
-            )
-            self.svm_model = OneClassSVM(
-                kernel="rbf", gamma="scale", nu=0.1
-            )
-            self.lof_model = LocalOutlierFactor(
-                n_neighbors=20, novelty=True
-            )
-            self.ae_model = MLPRegressor(
-                hidden_layer_sizes=(16, 8, 16),
-                activation="relu",
-                solver="adam",
-                max_iter=200,
-                random_state=42,
-            )
-        else:
-            self.iso_model = None
-            self.svm_model = None
-            self.lof_model = None
-            self.ae_model = None
+        # Fitted on the retrain pool; None until the first fit lands.
+        self._models = None
 
-        # Sliding window buffer — only normal-looking traces to avoid
-        # poisoning the batch models with anomalous data.
+        # Reservoir of normal-looking traces since the last fit (or drift),
+        # to avoid poisoning the batch models with anomalous data.
         self._buffer = []
-        self._models_trained = False
+        self._reservoir_seen = 0
+        self._rng = random.Random(42)
         self._observations = 0
 
+        # Drift-triggered schedule
+        self.retrain_min_interval = (
+            RETRAIN_MIN_INTERVAL if retrain_min_interval is None else retrain_min_interval
+        )
+        self.retrain_max_interval = (
+            RETRAIN_MAX_INTERVAL if retrain_max_interval is None else retrain_max_interval
+        )
+        self._feature_drift = {f: PageHinkley() for f in DRIFT_FEATURES}
+        self._score_drift = PageHinkley()
+        self._score_drift_generation = 0
+        self._since_retrain = 0
+        self._drift_pending = None
+        self._drift_events = {}
+        self._last_retrain_reason = None
+
+        # Retrain bookkeeping (reported by retrain_stats()).
+        self._lock = threading.Lock()
+        self._retrain_future = None
+        self._generation = 0
+        self._retrains = 0
+        self._retrains_failed = 0
+        self._last_retrain_s = 0.0
+
+    def __getstate__(self):
+        # Keyed-state snapshots and per-service clones must not carry the
+        # lock or an in-flight future. The lock keeps a retrain landing on
+        # another thread out of the copy.
+        with self._lock:
+            state = self.__dict__.copy()
+        state.pop("_lock", None)
+        state["_retrain_future"] = None
+        return state
+
+    def __setstate__(self, state):
+        # Defaults for fields added after the snapshot was written.
+        self.__dict__.update(
+            cascade=CASCADE_ENABLED,
+            cascade_normal_max=CASCADE_NORMAL_MAX,
+            cascade_anomaly_min=CASCADE_ANOMALY_MIN,
+            _cascade_scored=0,
+            _cascade_normal=0,
+            _cascade_anomalous=0,
+            retrain_min_interval=RETRAIN_MIN_INTERVAL,
+            retrain_max_interval=RETRAIN_MAX_INTERVAL,
+            _reservoir_seen=len(state.get("_buffer", ())),
+            _rng=random.Random(42),
+            _feature_drift={f: PageHinkley() for f in DRIFT_FEATURES},
+            _score_drift=PageHinkley(),
+            _score_drift_generation=state.get("_generation", 0),
+            _since_retrain=0,
+            _drift_pending=None,
+            _drift_events={},
+            _last_retrain_reason=None,
+        )
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
     def learn_one(self, features):
         """Update all models with a new observation.
 
-        HS-Trees learns online on every call. Batch models are retrained
-        whenever the buffer fills up (every BUFFER_SIZE normal observations).
+        HS-Trees learns online on every call. Normal observations go into
+        the reservoir and the drift detectors; batch models are refit in the
+        background when `_retrain_reason` says so.
         """
         vec = _feature_vec(features)
         self._observations += 1
@@ -124,36 +330,195 @@ class ObserveXScorer:
         # HS-Trees: always learns online
         self.hs_trees.learn_one(vec)
 
-        # Batch models: buffer only normal-looking traces (error_rate == 0)
+        # Batch models: sample only normal-looking traces (error_rate == 0)
         # to prevent poisoning the boundary estimation.
         if _HAS_SKLEARN and vec["error_rate"] == 0:
-            self._buffer.append([
+            self._reservoir_add([
                 vec["duration_ms"],
                 vec["span_count"],
                 vec["error_rate"],
             ])
+            self._since_retrain += 1
+            for name, detector in self._feature_drift.items():
+                if detector.update(vec[name]):
+                    self._on_drift(name)
+
+            reason = self._retrain_reason()
+            if reason:
+                self._schedule_retrain(reason)
+
+    def learn_many(self, X_raw):
+        """Bulk-learn an (n × 3) matrix of raw features in FEATURE_SCHEMA
+        column order (duration_ms, span_count, error_rate).
+
+        HS-Trees learns every row with the same window pivots as `learn_one`.
+        Normal rows go through the reservoir, and the batch models are fit
+        once, synchronously, if a fit is due. Drift detection is skipped: a
+        bulk load is one training set, not a stream to watch.
+        """
+        X_raw = np.asarray(X_raw, dtype=float).reshape(-1, len(FEATURE_SCHEMA))
+        if len(X_raw) == 0:
+            return
+        X = np.column_stack([
+            np.minimum(X_raw[:, 0] / 1000.0, 5.0),
+            X_raw[:, 1],
+            X_raw[:, 2],
+        ])
+        self._observations += len(X)
+
+        self.hs_trees.learn_many(X)
+
+        if not _HAS_SKLEARN:
+            return
+        normal = X[X[:, 2] == 0].tolist()
+        for row in normal:
+            self._reservoir_add(row)
+        self._since_retrain += len(normal)
+        reason = self._retrain_reason()
+        if reason:
+            self.wait_for_retrain()
+            X_fit = self._take_training_set(reason)
+            self._retrain_batch_models(X_fit)
+
+    def _reservoir_add(self, row):
+        """Algorithm R: every normal row since the reservoir was last emptied
+        is kept with equal probability."""
+        self._reservoir_seen += 1
+        if len(self._buffer) < RESERVOIR_SIZE:
+            self._buffer.append(row)
+        else:
+            j = self._rng.randrange(self._reservoir_seen)
+            if j < RESERVOIR_SIZE:
+                self._buffer[j] = row
 
-            if len(self._buffer) >= self.BUFFER_SIZE:
-                self._retrain_batch_models()
-
-    def _retrain_batch_models(self):
-        """Retrain all batch models on the current buffer."""
-        X = np.array(self._buffer)
-        try:
-            self.iso_model.fit(X)
-            self.svm_model.fit(X)
-            self.lof_model.fit(X)
-            self.ae_model.fit(X, X)  # Autoencoder: reconstruct input
-            self._models_trained = True
+    def _on_drift(self, source):
+        self._drift_events[source] = self._drift_events.get(source, 0) + 1
+        if self._drift_pending is None:
             logger.info(
-                f"Batch models retrained on {len(self._buffer)} samples "
-                f"(total observations: {self._observations})"
+                f"Drift detected on {source} after {self._since_retrain} normal "
+                f"observations; resampling for retrain"
             )
+            # Train the next generation on post-shift traffic only.
+            self._buffer = []
+            self._reservoir_seen = 0
+        self._drift_pending = source
+
+    def _retrain_reason(self):
+        """Why a fit is due now, or None."""
+        if len(self._buffer) < self.BUFFER_SIZE or self._retrain_in_flight():
+            return None
+        if self._models is None and self._generation == 0:
+            return "initial"
+        if self._since_retrain < self.retrain_min_interval:
+            return None
+        if self._drift_pending is not None:
+            return f"drift:{self._drift_pending}"
+        if self._since_retrain >= self.retrain_max_interval:
+            return "max_interval"
+        return None
+
+    def _retrain_in_flight(self):
+        future = self._retrain_future
+        return future is not None and not future.done()
+
+    def _take_training_set(self, reason):
+        """Snapshot the reservoir and start a fresh sampling period."""
+        X = np.array(self._buffer)
+        self._buffer = []
+        self._reservoir_seen = 0
+        self._since_retrain = 0
+        self._drift_pending = None
+        self._last_retrain_reason = reason
+        # New reference windows for the data the next generation sees.
+        for detector in self._feature_drift.values():
+            detector.reset()
+        return X
+
+    def _schedule_retrain(self, reason):
+        """Snapshot the reservoir and refit off the caller's thread.
+
+        At most one fit per scorer is in flight; `_retrain_reason` holds
+        further triggers back until it has landed.
+        """
+        X = self._take_training_set(reason)
+
+        if RETRAIN_WORKERS <= 0:
+            self._retrain_batch_models(X)
+            return
+
+        global _retrain_pending
+        with self._lock:
+            with _retrain_lock:
+                _retrain_pending += 1
+            self._retrain_future = _get_retrain_pool().submit(self._pooled_retrain, X)
+
+    def _pooled_retrain(self, X):
+        global _retrain_pending
+        try:
+            self._retrain_batch_models(X)
+        finally:
+            with _retrain_lock:
+                _retrain_pending -= 1
+
+    def _retrain_batch_models(self, X):
+        """Fit a new generation of batch models on X and swap it in."""
+        start = time.perf_counter()
+        try:
+            models = _fit_batch_models(X, self._generation + 1)
         except Exception as e:
+            with self._lock:
+                self._retrains_failed += 1
             logger.warning(f"Batch model retraining failed: {e}")
+            return
+        duration = time.perf_counter() - start
+        RETRAIN_SECONDS.observe(duration)
+
+        with self._lock:
+            self._models = models  # atomic swap; scorers read it once per call
+            self._generation = models.generation
+            self._retrains += 1
+            self._last_retrain_s = duration
+        logger.info(
+            f"Batch models retrained on {len(X)} samples in {duration * 1000:.0f}ms "
+            f"({self._last_retrain_reason}, generation {models.generation}, "
+            f"total observations: {self._observations}, "
+            f"retrain queue: {retrain_queue_depth()})"
+        )
+
+    def estimated_bytes(self):
+        """Approximate pickled size without serialising anything: the batch
+        models' size recorded at fit time plus the HS-Trees arrays and the
+        reservoir."""
+        models = self._models
+        hst = self.hs_trees
+        arrays = sum(
+            a.nbytes for a in (hst.feature, hst.threshold, hst.l_mass, hst.r_mass) if a is not None
+        )
+        return (models.nbytes if models is not None else 0) + arrays + \
+            len(self._buffer) * RESERVOIR_ROW_BYTES
 
-        # Keep a sliding window: discard oldest half
-        self._buffer = self._buffer[self.BUFFER_SIZE // 2:]
+    def wait_for_retrain(self, timeout=None):
+        """Block until the in-flight retrain (if any) has been swapped in."""
+        future = self._retrain_future
+        if future is not None:
+            try:
+                future.result(timeout=timeout)
+            except Exception as e:
+                logger.warning(f"Waiting for batch retrain failed: {e}")
+
+    def retrain_stats(self):
+        return {
+            "generation": self._generation,
+            "in_flight": self._retrain_in_flight(),
+            "queue_depth": retrain_queue_depth(),
+            "retrains": self._retrains,
+            "failed": self._retrains_failed,
+            "last_retrain_ms": self._last_retrain_s * 1000.0,
+            "last_reason": self._last_retrain_reason,
+            "since_retrain": self._since_retrain,
+            "drift_pending": self._drift_pending,
+            "drift_events": dict(self._drift_events),
+        }
 
     def score_one(self, features):
         """Generate per-model + aggregate ensemble score.
@@ -161,72 +526,230 @@ class ObserveXScorer:
         Returns dict with keys:
           - hs_trees, isolation_forest, one_class_svm, autoencoder_mse, lof
           - aggregate_score, is_anomaly, observations
+          - skipped: models the cascade did not run (their score reads 0.0)
         """
-        duration = features.get("duration_ms", 0)
-        span_count = features.get("span_count", 1)
-        error_rate = features.get("error_rate", 0)
+        return self.score_many([features])[0]
 
-        vec = _feature_vec(features)
+    def score_many(self, features_list):
+        """Score a batch of traces as one matrix.
+
+        Same output per element as `score_one`, evaluated against the current
+        model state: every model, HS-Trees included, sees a single (n × 3)
+        call instead of n (1 × 3) calls.
+        """
+        n = len(features_list)
+        if n == 0:
+            return []
+
+        vecs = [_feature_vec(f) for f in features_list]
+        X = np.array(
+            [[v["duration_ms"], v["span_count"], v["error_rate"]] for v in vecs],
+            dtype=float,
+        )
+        duration = np.array([f.get("duration_ms", 0) for f in features_list], dtype=float)
+        span_count = np.array([f.get("span_count", 1) for f in features_list], dtype=float)
+        error_rate = np.array([f.get("error_rate", 0) for f in features_list], dtype=float)
 
         # ── 1. Rule Score (deterministic bounds) ────────────────────
-        rule_score = 0.0
-        if duration > 1000:
-            rule_score = max(rule_score, 0.8)
-        if span_count > 30:
-            rule_score = max(rule_score, 0.9)
-        if error_rate > 0.1:
-            rule_score = max(rule_score, 0.95)
+        rule_score = np.zeros(n)
+        rule_score = np.maximum(rule_score, np.where(duration > 1000, 0.8, 0.0))
+        rule_score = np.maximum(rule_score, np.where(span_count > 30, 0.9, 0.0))
+        rule_score = np.maximum(rule_score, np.where(error_rate > 0.1, 0.95, 0.0))
 
         # ── 2. HS-Trees Score (always available) ────────────────────
-        hs_raw = self.hs_trees.score_one(vec)
-        hs_norm = min(hs_raw / self.HS_NORMALIZER, 1.0)
+        t0 = time.perf_counter()
+        hs_raw = self.hs_trees.score_many(X)
+        MODEL_SECONDS.labels("hs_trees").observe(time.perf_counter() - t0)
 
         scores = {
-            "hs_trees": hs_norm,
-            "isolation_forest": 0.0,
-            "one_class_svm": 0.0,
-            "autoencoder_mse": 0.0,
-            "lof": 0.0,
+            "hs_trees": np.minimum(hs_raw / self.HS_NORMALIZER, 1.0),
+            "isolation_forest": np.zeros(n),
+            "one_class_svm": np.zeros(n),
+            "autoencoder_mse": np.zeros(n),
+            "lof": np.zeros(n),
         }
 
         # ── 3. Batch Models (only if trained) ───────────────────────
-        if _HAS_SKLEARN and self._models_trained:
-            X_test = np.array([[
-                vec["duration_ms"],
-                vec["span_count"],
-                vec["error_rate"],
-            ]])
+        models = self._models  # one generation for the whole batch
+        skip_normal = np.zeros(n, dtype=bool)
+        skip_anomalous = np.zeros(n, dtype=bool)
+        if _HAS_SKLEARN and models is not None:
             try:
                 # Isolation Forest: score_samples returns negative anomaly scores
-                iso_raw = -self.iso_model.score_samples(X_test)[0]
-                scores["isolation_forest"] = max(0.0, min(1.0, (iso_raw + 0.5) / 0.5))
-
-                # One-Class SVM: score_samples returns signed distance to boundary
-                svm_raw = -self.svm_model.score_samples(X_test)[0]
-                scores["one_class_svm"] = max(0.0, min(1.0, (svm_raw + 10) / 20))
-
-                # LOF: score_samples returns negative outlier factor
-                lof_raw = -self.lof_model.score_samples(X_test)[0]
-                scores["lof"] = max(0.0, min(1.0, (lof_raw - 1) / 1))
-
-                # Autoencoder: MSE reconstruction error
-                pred = self.ae_model.predict(X_test)
-                mse = float(np.mean((X_test - pred) ** 2))
-                scores["autoencoder_mse"] = max(0.0, min(1.0, mse / 0.1))
-
+                t0 = time.perf_counter()
+                iso_raw = -models.iso_flat.score_samples(X)
+                scores["isolation_forest"] = np.clip((iso_raw + 0.5) / 0.5, 0.0, 1.0)
+                MODEL_SECONDS.labels("isolation_forest").observe(time.perf_counter() - t0)
             except Exception as e:
                 logger.debug(f"Batch model scoring error (non-fatal): {e}")
 
+            # Cascade: bound the aggregate with the expensive models at 0 / 1.
+            if self.cascade:
+                known = sum(v for k, v in scores.items() if k not in EXPENSIVE_MODELS)
+                lower = 0.6 * known / len(scores) + 0.4 * rule_score
+                upper = lower + 0.6 * len(EXPENSIVE_MODELS) / len(scores)
+                skip_normal = upper <= self.cascade_normal_max
+                skip_anomalous = (lower > self.cascade_anomaly_min) & ~skip_normal
+            need = ~(skip_normal | skip_anomalous)
+
+            if need.any():
+                Xe = X[need]
+                try:
+                    # One-Class SVM: score_samples returns signed distance to boundary
+                    t0 = time.perf_counter()
+                    svm_raw = -models.svm.score_samples(Xe)
+                    scores["one_class_svm"][need] = np.clip((svm_raw + 10) / 20, 0.0, 1.0)
+
+                    # LOF: score_samples returns negative outlier factor
+                    t1 = time.perf_counter()
+                    lof_raw = -models.lof.score_samples(Xe)
+                    scores["lof"][need] = np.clip((lof_raw - 1) / 1, 0.0, 1.0)
+
+                    # Autoencoder: MSE reconstruction error
+                    t2 = time.perf_counter()
+                    pred = models.ae.predict(Xe)
+                    mse = np.mean((Xe - pred) ** 2, axis=1)
+                    scores["autoencoder_mse"][need] = np.clip(mse / 0.1, 0.0, 1.0)
+                    t3 = time.perf_counter()
+                    MODEL_SECONDS.labels("one_class_svm").observe(t1 - t0)
+                    MODEL_SECONDS.labels("lof").observe(t2 - t1)
+                    MODEL_SECONDS.labels("autoencoder_mse").observe(t3 - t2)
+
+                except Exception as e:
+                    logger.debug(f"Batch model scoring error (non-fatal): {e}")
+
+            self._cascade_scored += n
+            self._cascade_normal += int(skip_normal.sum())
+            self._cascade_anomalous += int(skip_anomalous.sum())
+
         # ── 4. Soft Voting Aggregation ──────────────────────────────
         # Paper: "Scores from all five models are min-max normalised to [0,1]
         # and averaged into a single ensemble score."
         # We weight: 60% ML ensemble + 40% rule score
-        ml_values = list(scores.values())
-        ml_avg = sum(ml_values) / len(ml_values)
-        aggregate = (0.6 * ml_avg) + (0.4 * rule_score)
+        ml_avg = sum(scores.values()) / len(scores)
+        aggregate = np.minimum((0.6 * ml_avg) + (0.4 * rule_score), 1.0)
+
+        # Score drift is measured against the generation that produced it.
+        if models is not None:
+            if models.generation != self._score_drift_generation:
+                self._score_drift.reset()
+                self._score_drift_generation = models.generation
+            for value in aggregate.tolist():
+                if self._score_drift.update(value):
+                    self._on_drift("score")
+
+        skipped = skip_normal | skip_anomalous
+        results = []
+        for i in range(n):
+            r = {name: float(col[i]) for name, col in scores.items()}
+            r["aggregate_score"] = float(aggregate[i])
+            r["is_anomaly"] = r["aggregate_score"] > self.ANOMALY_THRESHOLD
+            r["observations"] = self._observations
+            r["skipped"] = list(EXPENSIVE_MODELS) if skipped[i] else []
+            results.append(r)
+        return results
+
+    def cascade_stats(self):
+        """How often the cheap stage was decisive, over all scored traces
+        with trained batch models."""
+        scored = self._cascade_scored
+        hits = self._cascade_normal + self._cascade_anomalous
+        return {
+            "enabled": self.cascade,
+            "scored": scored,
+            "skipped_normal": self._cascade_normal,
+            "skipped_anomalous": self._cascade_anomalous,
+            "hit_rate": hits / scored if scored else 0.0,
+        }
 
-        scores["aggregate_score"] = min(aggregate, 1.0)
-        scores["is_anomaly"] = scores["aggregate_score"] > self.ANOMALY_THRESHOLD
-        scores["observations"] = self._observations
 
-        return scores
+# ── Ensemble snapshots ──────────────────────────────────────────────
+# File layout: one JSON header line, then the pickled {name: ObserveXScorer}
+# payload. The header carries the format/schema versions and the payload's
+# SHA-256 so stale or truncated files are rejected before unpickling.
+SNAPSHOT_VERSION = 2  # 2: array-backed HS-Trees
+FEATURE_SCHEMA_VERSION = 1
+SNAPSHOT_GLOB = "ensemble-*.snap"
+
+
+class FrozenScorer:
+    """An ObserveXScorer pickled at one point in time. It pickles as that
+    scorer, so `save_snapshot` can write copies taken earlier by the thread
+    that owns each ensemble, and `load_snapshot` returns plain scorers."""
+
+    __slots__ = ("blob", "_observations", "_generation")
+
+    def __init__(self, scorer):
+        self.blob = pickle.dumps(scorer, protocol=pickle.HIGHEST_PROTOCOL)
+        self._observations = scorer._observations
+        self._generation = scorer._generation
+
+    def __reduce__(self):
+        return (pickle.loads, (self.blob,))
+
+
+def save_snapshot(directory, ensembles, keep=3):
+    """Atomically write `ensembles` ({name: ObserveXScorer or FrozenScorer})
+    to a new versioned file in `directory`, keeping the newest `keep` files."""
+    os.makedirs(directory, exist_ok=True)
+    payload = pickle.dumps(ensembles, protocol=pickle.HIGHEST_PROTOCOL)
+    header = {
+        "version": SNAPSHOT_VERSION,
+        "feature_schema_version": FEATURE_SCHEMA_VERSION,
+        "features": list(FEATURE_SCHEMA),
+        "sha256": hashlib.sha256(payload).hexdigest(),
+        "created_at": time.time(),
+        "ensembles": {
+            name: {"observations": e._observations, "generation": e._generation}
+            for name, e in ensembles.items()
+        },
+    }
+    name = f"ensemble-{int(time.time() * 1000):015d}-{os.getpid()}.snap"
+    path = os.path.join(directory, name)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(json.dumps(header).encode("utf-8") + b"\n")
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+    for old in sorted(glob.glob(os.path.join(directory, SNAPSHOT_GLOB)))[:-keep]:
+        try:
+            os.remove(old)
+        except OSError:
+            pass
+    return path
+
+
+def load_snapshot(path):
+    """Load one snapshot file; raises ValueError if it fails validation."""
+    with open(path, "rb") as f:
+        header = json.loads(f.readline().decode("utf-8"))
+        payload = f.read()
+    if header.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"unsupported snapshot version {header.get('version')}")
+    if (header.get("feature_schema_version") != FEATURE_SCHEMA_VERSION
+            or tuple(header.get("features", ())) != FEATURE_SCHEMA):
+        raise ValueError("feature schema mismatch")
+    if hashlib.sha256(payload).hexdigest() != header.get("sha256"):
+        raise ValueError("checksum mismatch")
+    return pickle.loads(payload)
+
+
+def load_latest_snapshot(directory):
+    """Return the newest valid snapshot in `directory` as {name: scorer},
+    or None when there is none. Invalid files are skipped with a warning."""
+    for path in sorted(glob.glob(os.path.join(directory, SNAPSHOT_GLOB)), reverse=True):
+        start = time.perf_counter()
+        try:
+            ensembles = load_snapshot(path)
+        except Exception as e:
+            logger.warning(f"Skipping ensemble snapshot {path}: {e}")
+            continue
+        logger.info(
+            f"Loaded {len(ensembles)} ensemble(s) from {path} "
+            f"in {(time.perf_counter() - start) * 1000:.0f}ms"
+        )
+        return ensembles
+    return None
@@ -0,0 +1,204 @@
+"""Bounded pool of per-key ML ensembles.
+
+Keys are a primary service, or service + root route, depending on the pool
+mode. A key is scored by the shared global ensemble until it has been seen
+`min_traces` times; then it gets its own ensemble, cloned from the global
+one. Resident ensembles are kept in LRU order and evicted once their
+estimated (pickled) size exceeds the memory budget or their number exceeds
+`max_models`; an evicted key falls back to the global ensemble and has to
+warm up again before it is re-admitted.
+
+Mode "global" never creates per-key ensembles: every key shares the global
+one. The pool is process-wide and thread-safe, and never holds more than
+`max_models` ensembles plus `max_cold_keys` small counters.
+
+For snapshots each resident ensemble also carries a frozen (pickled) copy,
+refreshed by `checkpoint` on the worker that owns the key while it holds
+the lease, so a snapshot never reads an ensemble another thread is
+updating. The copies are not counted against the memory budget.
+"""
+import copy
+import time
+import pickle
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+POOL_MODES = ("global", "service", "service_route")
+
+
+def _estimate_bytes(model):
+    # ObserveXScorer sizes itself from figures recorded off-thread at fit
+    # time; pickling is only the fallback for other models.
+    if hasattr(model, "estimated_bytes"):
+        return model.estimated_bytes()
+    try:
+        return len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception as e:
+        logger.debug(f"Could not size ensemble (non-fatal): {e}")
+        return 0
+
+
+class _Resident:
+    __slots__ = ("model", "bytes", "generation", "frozen", "frozen_at")
+
+    def __init__(self, model):
+        self.model = model
+        self.generation = getattr(model, "_generation", None)
+        self.bytes = _estimate_bytes(model)
+        self.frozen = None
+        self.frozen_at = float("-inf")
+
+
+class ModelPool:
+
+    def __init__(self, global_model, mode="service", budget_bytes=512 * 2 ** 20,
+                 max_models=64, min_traces=50, max_cold_keys=10_000, freeze=None):
+        if mode not in POOL_MODES:
+            raise ValueError(f"Unknown ML pool mode {mode!r}; expected one of {POOL_MODES}")
+        self.global_model = global_model
+        self.mode = mode
+        self.budget_bytes = budget_bytes
+        self.max_models = max_models
+        self.min_traces = min_traces
+        self.max_cold_keys = max_cold_keys
+        # model -> picklable point-in-time copy; None disables checkpoints.
+        self.freeze = freeze
+
+        # Serialises learn_one on the shared global ensemble across workers;
+        # per-key ensembles are only touched by the worker owning the key.
+        self.global_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._resident = OrderedDict()   # key -> _Resident, least recent first
+        self._cold = OrderedDict()       # key -> traces seen while cold
+        self._resident_bytes = 0
+        self._created = 0
+        self._evictions = 0
+
+    def key_for(self, service, route):
+        if self.mode == "service_route":
+            return f"{service}|{route}"
+        return service
+
+    def model_for(self, key, traces=1):
+        """Ensemble to score `key` with after `traces` more traces of it:
+        its own if resident (or just admitted), else the global one."""
+        if self.mode == "global":
+            return self.global_model
+        with self._lock:
+            entry = self._resident.get(key)
+            if entry is not None:
+                self._resident.move_to_end(key)
+                if getattr(entry.model, "_generation", None) != entry.generation:
+                    # Retrained since last sized.
+                    self._resident_bytes -= entry.bytes
+                    entry.generation = getattr(entry.model, "_generation", None)
+                    entry.bytes = _estimate_bytes(entry.model)
+                    self._resident_bytes += entry.bytes
+                    self._evict(keep=key)
+                return entry.model
+
+            seen = self._cold.pop(key, 0) + traces
+            if seen < self.min_traces:
+                self._cold[key] = seen
+                while len(self._cold) > self.max_cold_keys:
+                    self._cold.popitem(last=False)
+                return self.global_model
+
+            with self.global_lock:
+                model = copy.deepcopy(self.global_model)
+            self._admit(key, model)
+            self._created += 1
+            return model
+
+    @contextmanager
+    def lease(self, key, traces=1):
+        """`model_for`, holding the global lock while the global ensemble
+        is in use."""
+        model = self.model_for(key, traces)
+        if model is self.global_model:
+            with self.global_lock:
+                yield model
+        else:
+            yield model
+
+    def restore(self, ensembles):
+        """Admit snapshotted per-key ensembles (most recently used last)."""
+        if self.mode == "global":
+            return
+        with self._lock:
+            for key, model in ensembles.items():
+                self._admit(key, model)
+
+    def _admit(self, key, model):
+        entry = _Resident(model)
+        self._resident[key] = entry
+        self._resident_bytes += entry.bytes
+        self._evict(keep=key)
+
+    def _evict(self, keep):
+        while self._resident and (
+            len(self._resident) > self.max_models
+            or self._resident_bytes > self.budget_bytes
+        ):
+            key = next(iter(self._resident))
+            if key == keep:
+                if len(self._resident) == 1:
+                    break  # a single ensemble over budget still serves its key
+                self._resident.move_to_end(key)
+                continue
+            entry = self._resident.pop(key)
+            self._resident_bytes -= entry.bytes
+            self._evictions += 1
+            logger.info(
+                f"Evicted ML ensemble for {key} ({entry.bytes / 2 ** 20:.1f} MiB); "
+                f"falls back to the global ensemble"
+            )
+
+    def resident(self):
+        """{key: ensemble}, least recently used first."""
+        with self._lock:
+            return {key: entry.model for key, entry in self._resident.items()}
+
+    def checkpoint(self, key, model, max_age=0.0):
+        """Replace `key`'s frozen copy with `freeze(model)` if it is older
+        than `max_age` seconds. Only the thread leasing `key` (or one that
+        owns it before scoring starts) may call this."""
+        if self.freeze is None:
+            return False
+        with self._lock:
+            entry = self._resident.get(key)
+            if entry is None or entry.model is not model \
+                    or time.monotonic() - entry.frozen_at < max_age:
+                return False
+        frozen = self.freeze(model)
+        with self._lock:
+            if self._resident.get(key) is entry:
+                entry.frozen = frozen
+                entry.frozen_at = time.monotonic()
+        return True
+
+    def frozen(self):
+        """{key: frozen copy} of the resident ensembles that have one, least
+        recently used first."""
+        with self._lock:
+            return {
+                key: entry.frozen for key, entry in self._resident.items()
+                if entry.frozen is not None
+            }
+
+    def stats(self):
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "resident_models": len(self._resident),
+                "resident_bytes": self._resident_bytes,
+                "budget_bytes": self.budget_bytes,
+                "max_models": self.max_models,
+                "cold_keys": len(self._cold),
+                "created": self._created,
+                "evictions": self._evictions,
+            }
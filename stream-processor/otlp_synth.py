@@ -0,0 +1,144 @@
+"""Deterministic synthetic OTLP traces with ground-truth labels.
+
+Each generated item is one OTLP/JSON trace payload (the shape the collector
+publishes to RabbitMQ: `resourceSpans` per service) plus its label:
+
+    normal      gateway → python-service, a few tens of ms
+    slow        the python-service handler takes 1–2 s
+    n_plus_1    the handler issues 25–40 repeated SELECT children
+    dangling    a span references a parent that never arrives
+    error       the handler fails (status code 2)
+    bimodal     the slow-quote endpoint: ~100 ms, or ~2 s one time in five
+    pii         a normal-shaped trace whose handler logs redacted PII
+
+With `logs=True` every trace is followed by a `resourceLogs` payload with
+one handler log line (carrying the collector's redaction tokens for `pii`).
+TRAFFIC_MIX is trigger_traffic.py's "mixed" profile.
+
+The same seed always yields the same payloads, timestamps included.
+"""
+import random
+
+LABELS = ("normal", "slow", "n_plus_1", "dangling", "error", "bimodal", "pii")
+# Labels the trace detectors should flag, and labels they should not;
+# bimodal is neither (its fast mode is a normal trace).
+ANOMALY_LABELS = ("slow", "n_plus_1", "dangling", "error")
+NORMAL_LABELS = ("normal", "pii")
+DEFAULT_MIX = {"normal": 0.90, "slow": 0.03, "n_plus_1": 0.03, "dangling": 0.02, "error": 0.02}
+TRAFFIC_MIX = {"normal": 0.80, "bimodal": 0.05, "n_plus_1": 0.10, "pii": 0.05}
+
+GATEWAY = "api-gateway"
+BACKEND = "python-service"
+BASE_UNIX_NANO = 1_767_225_600 * 10 ** 9  # 2026-01-01T00:00:00Z
+TRACE_SPACING_NS = 20 * 10 ** 6  # one trace every 20 ms of synthetic time
+ROUTES = {"bimodal": "/api/slow-quote", "n_plus_1": "/api/n-plus-1", "pii": "/api/pii"}
+# Same tokens as detectors.DEFAULT_REDACTION_TOKENS (the collector's).
+REDACTION_TOKENS = ("[REDACTED_EMAIL]", "[REDACTED_AUTHOR]", "[REDACTED_CC]")
+
+
+def _hex(rng, nbytes):
+    return "%0*x" % (nbytes * 2, rng.getrandbits(nbytes * 8))
+
+
+def _span(trace_id, span_id, parent_id, name, start_ns, dur_ms, status=0, route=None):
+    span = {
+        "traceId": trace_id,
+        "spanId": span_id,
+        "parentSpanId": parent_id,
+        "name": name,
+        "startTimeUnixNano": str(start_ns),
+        "endTimeUnixNano": str(start_ns + int(dur_ms * 1e6)),
+        "status": {"code": status},
+    }
+    if route:
+        span["attributes"] = [{"key": "http.route", "value": {"stringValue": route}}]
+    return span
+
+
+def _payload(by_service):
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": [
+                    {"key": "service.name", "value": {"stringValue": svc}},
+                ]},
+                "scopeSpans": [{"scope": {"name": "otlp_synth"}, "spans": spans}],
+            }
+            for svc, spans in by_service.items()
+        ]
+    }
+
+
+def make_trace(rng, label, start_ns):
+    """One OTLP payload of the given label starting at `start_ns`."""
+    trace_id = _hex(rng, 16)
+    root_id, handler_id = _hex(rng, 8), _hex(rng, 8)
+
+    handler_ms = rng.lognormvariate(3.2, 0.3)  # ~25 ms
+    if label == "slow":
+        handler_ms = 1000.0 + 1000.0 * rng.random()
+    elif label == "bimodal":
+        handler_ms = rng.gauss(2000.0, 200.0) if rng.random() < 0.2 else rng.gauss(100.0, 10.0)
+    children = []
+    if label == "n_plus_1":
+        n = rng.randint(25, 40)
+        t = start_ns + int(2e6)
+        for _ in range(n):
+            dur = 2.0 + rng.random() * 3.0
+            children.append(_span(trace_id, _hex(rng, 8), handler_id, "SELECT quotes", t, dur))
+            t += int((dur + 0.5) * 1e6)
+        handler_ms = max(handler_ms, (t - start_ns) / 1e6 + 1.0)
+    else:
+        children.append(_span(trace_id, _hex(rng, 8), handler_id, "SELECT quotes",
+                              start_ns + int(2e6), min(handler_ms * 0.4, 50.0)))
+
+    route = ROUTES.get(label, "/api/quote")
+    gateway_ms = handler_ms + 4.0 + rng.random() * 4.0
+    handler = _span(
+        trace_id, handler_id, root_id, f"GET {route}", start_ns + int(1e6), handler_ms,
+        status=2 if label == "error" else 0, route=route,
+    )
+    if label == "dangling":
+        handler["parentSpanId"] = _hex(rng, 8)
+    proxy_route = "/api/proxy-" + route[len("/api/"):]
+    root = _span(trace_id, root_id, "", f"GET {proxy_route}", start_ns, gateway_ms,
+                 route=proxy_route)
+    return _payload({GATEWAY: [root], BACKEND: [handler] + children})
+
+
+def make_logs(rng, trace_payload, label):
+    """The handler's log line for a trace from `make_trace`, as OTLP logs."""
+    handler = trace_payload["resourceSpans"][-1]["scopeSpans"][0]["spans"][0]
+    if label == "pii":
+        body = (f"quote requested by {REDACTION_TOKENS[0]} "
+                f"author={REDACTION_TOKENS[1]} card={REDACTION_TOKENS[2]}")
+    else:
+        body = f"quote served id={rng.randint(1, 500)}"
+    return {
+        "resourceLogs": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": BACKEND}},
+            ]},
+            "scopeLogs": [{"scope": {"name": "otlp_synth"}, "logRecords": [{
+                "timeUnixNano": handler["endTimeUnixNano"],
+                "traceId": handler["traceId"],
+                "spanId": handler["spanId"],
+                "severityText": "INFO",
+                "body": {"stringValue": body},
+            }]}],
+        }]
+    }
+
+
+def generate(n, seed=42, mix=None, logs=False):
+    """Yield (payload, label) for n traces, each followed by its logs
+    payload when `logs` is set."""
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    labels, weights = zip(*mix.items())
+    for i in range(n):
+        label = rng.choices(labels, weights)[0]
+        payload = make_trace(rng, label, BASE_UNIX_NANO + i * TRACE_SPACING_NS)
+        yield payload, label
+        if logs:
+            yield make_logs(rng, payload, label), label
@@ -0,0 +1,173 @@
+"""On-demand sampling profiler and allocation diff for a running process.
+
+Opt-in with OBSERVEX_PROFILING=1. A capture is started by SIGUSR2 or an
+admin endpoint (POST /debug/profile?seconds=N on the processor's metrics
+port, POST /api/admin/profile on the backend) and runs for a fixed time:
+
+  * a sampler thread reads every other thread's stack through
+    sys._current_frames() at OBSERVEX_PROFILE_HZ and counts identical
+    stacks, written as `<stem>.collapsed` ("thread;frame;frame count" per
+    line, ready for flamegraph.pl / speedscope);
+  * tracemalloc runs for the same window and the top allocation sites by
+    growth are written to `<stem>.tracemalloc.txt`.
+
+Nothing runs while idle: no sampler thread exists and tracemalloc is off
+between captures. One capture at a time. dashboard/backend vendors this
+module; keep the two copies in step.
+"""
+import os
+import sys
+import time
+import signal
+import logging
+import threading
+import tracemalloc
+from collections import Counter
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILING_ENABLED = os.getenv("OBSERVEX_PROFILING", "0") == "1"
+PROFILE_DIR = os.getenv("OBSERVEX_PROFILE_DIR", os.path.join(os.getcwd(), "profiles"))
+PROFILE_HZ = float(os.getenv("OBSERVEX_PROFILE_HZ", "100"))
+DEFAULT_SECONDS = 30.0
+MAX_SECONDS = 300.0
+TRACEMALLOC_FRAMES = 10
+TRACEMALLOC_TOP = 50
+
+_capture_lock = threading.Lock()
+_last_result: Optional[Dict] = None
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _stack(frame) -> str:
+    frames = []
+    while frame is not None:
+        frames.append(_frame_label(frame))
+        frame = frame.f_back
+    frames.reverse()
+    return ";".join(frames)
+
+
+def _sample(seconds: float, hz: float) -> Counter:
+    stacks = Counter()
+    me = threading.get_ident()
+    names = {t.ident: t.name.replace(";", ":") for t in threading.enumerate()}
+    interval = 1.0 / hz
+    deadline = time.monotonic() + seconds
+    next_tick = time.monotonic()
+    while next_tick < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            name = names.get(ident) or f"thread-{ident}"
+            stacks[f"{name};{_stack(frame)}"] += 1
+        next_tick += interval
+        delay = next_tick - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+    return stacks
+
+
+def _write_tracemalloc(path: str, before, after):
+    stats = after.compare_to(before, "lineno")
+    with open(path, "w") as f:
+        f.write(f"# top {TRACEMALLOC_TOP} allocation sites by growth during the capture\n")
+        for stat in stats[:TRACEMALLOC_TOP]:
+            f.write(f"{stat}\n")
+        f.write("\n# largest growth, full traceback\n")
+        for stat in after.compare_to(before, "traceback")[:5]:
+            f.write(f"{stat.size_diff / 1024:+.1f} KiB in {stat.count_diff:+d} blocks\n")
+            for line in stat.traceback.format():
+                f.write(f"{line}\n")
+            f.write("\n")
+
+
+def capture(seconds: float = DEFAULT_SECONDS, hz: float = PROFILE_HZ,
+            out_dir: str = PROFILE_DIR, trace_memory: bool = True) -> Optional[Dict]:
+    """Profile the process for `seconds` (blocking). Returns the written
+    paths and sample count, or None if a capture is already running."""
+    if not _capture_lock.acquire(blocking=False):
+        return None
+    return _capture_locked(seconds, hz, out_dir, trace_memory)
+
+
+def _capture_locked(seconds: float = DEFAULT_SECONDS, hz: float = PROFILE_HZ,
+                    out_dir: str = PROFILE_DIR, trace_memory: bool = True) -> Dict:
+    # `capture` once the caller holds _capture_lock; releases it.
+    global _last_result
+    started_tracing = False
+    try:
+        seconds = max(0.1, min(float(seconds), MAX_SECONDS))
+        os.makedirs(out_dir, exist_ok=True)
+        stem = os.path.join(out_dir, f"profile-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}")
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            started_tracing = True
+        before = tracemalloc.take_snapshot() if trace_memory else None
+        logger.info(f"Profiling for {seconds:g}s at {hz:g} Hz -> {stem}.*")
+
+        start = time.perf_counter()
+        stacks = _sample(seconds, hz)
+        elapsed = time.perf_counter() - start
+
+        result = {"seconds": elapsed, "samples": sum(stacks.values()), "hz": hz}
+        result["collapsed"] = stem + ".collapsed"
+        with open(result["collapsed"], "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        if trace_memory:
+            after = tracemalloc.take_snapshot()
+            result["tracemalloc"] = stem + ".tracemalloc.txt"
+            _write_tracemalloc(result["tracemalloc"], before, after)
+        logger.info(f"Profile written: {result}")
+        _last_result = result
+        return result
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+        _capture_lock.release()
+
+
+def start_capture(**kwargs) -> bool:
+    """Run `capture` on a background thread; False if one is running. The
+    lock is taken here, so of two concurrent callers only one starts."""
+    if not _capture_lock.acquire(blocking=False):
+        return False
+    try:
+        threading.Thread(
+            target=_capture_locked, kwargs=kwargs, name="observex-profiler", daemon=True
+        ).start()
+    except BaseException:
+        _capture_lock.release()
+        raise
+    return True
+
+
+def is_running() -> bool:
+    return _capture_lock.locked()
+
+
+def last_result() -> Optional[Dict]:
+    return _last_result
+
+
+def install_signal_handler(signum: int = getattr(signal, "SIGUSR2", 0)) -> bool:
+    """`kill -USR2 <pid>` starts a default capture. Main thread only; no-op
+    where the signal does not exist."""
+    if not signum:
+        return False
+
+    def _handler(_signum, _frame):
+        if not start_capture():
+            logger.warning("Profile capture already running; signal ignored.")
+
+    try:
+        signal.signal(signum, _handler)
+    except ValueError:  # not on the main thread
+        return False
+    return True
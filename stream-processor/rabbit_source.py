@@ -4,11 +4,18 @@ import logging
 import traceback
 from bytewax.inputs import DynamicSource, StatelessSourcePartition
 
+from self_metrics import counter
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 import time
 
+MESSAGES = counter("observex_source_messages_total", "Messages consumed from RabbitMQ", ("queue",))
+MESSAGE_BYTES = counter("observex_source_bytes_total", "Message bytes consumed from RabbitMQ", ("queue",))
+DISCARDED = counter("observex_source_discarded_total", "Messages dropped as non-JSON", ("queue",))
+RECONNECTS = counter("observex_source_reconnects_total", "RabbitMQ connection resets", ("queue",))
+
 class RabbitPartition(StatelessSourcePartition):
     def __init__(self, queue_name, host, user, password):
         self._queue_name = queue_name
@@ -19,6 +26,8 @@ class RabbitPartition(StatelessSourcePartition):
         self._iterator = None
         self._last_setup_attempt = 0
         self._backoff = 1.0
+        self._messages = MESSAGES.labels(queue_name)
+        self._bytes = MESSAGE_BYTES.labels(queue_name)
         logger.info(f"Initialized RabbitPartition for {queue_name}")
 
     def _setup(self):
@@ -77,23 +86,28 @@ class RabbitPartition(StatelessSourcePartition):
                 print(f"DEBUG [RabbitSource] GOT MESSAGE: {len(body)} bytes")
                 # Acknowledge immediately - Stream queues ignore nack/reject
                 self._channel.basic_ack(method_frame.delivery_tag)
+                self._messages.inc()
+                self._bytes.inc(len(body))
                 try:
                     decoded_body = body.decode('utf-8', errors='ignore')
                     data = json.loads(decoded_body)
                     return [data]
                 except json.JSONDecodeError:
                     logger.warning(f"Discarding non-JSON from {self._queue_name}.")
+                    DISCARDED.labels(self._queue_name).inc()
                     return []
             else:
                 return [] # Timeout reached, no message
                 
         except pika.exceptions.AMQPConnectionError:
             logger.warning(f"Connection lost for {self._queue_name}, resetting.")
+            RECONNECTS.labels(self._queue_name).inc()
             self._connection = None
             self._iterator = None
             return []
         except Exception as e:
             logger.error(f"Error in next_batch for {self._queue_name}: {e}")
+            RECONNECTS.labels(self._queue_name).inc()
             self._connection = None
             self._iterator = None
             return []
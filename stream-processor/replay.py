@@ -0,0 +1,261 @@
+"""Offline replay / backtest of the trace detection pipeline.
+
+Runs recorded or synthetic OTLP traces through the same code the dataflow
+uses — parse_trace → trace assembly (trace_assembly) → TraceIndex +
+extract_features → per-service ServiceDetectorState (CompositeScorer) —
+as fast as the CPU allows, with no RabbitMQ, Bytewax or dashboard backend.
+Reports spans/s, traces/s, per-stage cost and, for labeled input,
+precision/recall.
+
+Usage:
+    python replay.py --synthetic 20000
+    python replay.py --synthetic 20000 --ml --json replay.json
+    python replay.py --otlp recorded.jsonl       # one OTLP payload per line,
+                                                 # or {"label": ..., "payload": ...}
+    python replay.py --formats ../formats/traces # captured collector dumps
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from collections import defaultdict
+
+# Inline batch-model fits keep a replay deterministic; must be set before
+# ml_scorer is imported.
+os.environ.setdefault("OBSERVEX_RETRAIN_WORKERS", "0")
+
+from telemetry_parser import parse_trace
+from trace_assembly import build_full_trace, fold_full_trace
+from trace_index import TraceIndex
+from detectors import extract_features, ServiceDetectorState
+import otlp_synth
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), "synthetic_telemetry.jsonl")
+STAGES = ("parse", "assemble", "features", "score")
+
+
+# ---- Inputs: iterables of (otlp_payload, label or None) --------------------
+
+def load_otlp_jsonl(path):
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            rec = json.loads(line)
+            if "payload" in rec:
+                yield rec["payload"], rec.get("label")
+            else:
+                yield rec, None
+
+
+def load_formats(path):
+    """OTLP payloads pretty-printed inside a captured listener dump."""
+    text = open(path).read()
+    decoder = json.JSONDecoder()
+    pos = text.find("{")
+    while pos != -1:
+        try:
+            obj, end = decoder.raw_decode(text, pos)
+        except ValueError:
+            pos = text.find("{", pos + 1)
+            continue
+        if isinstance(obj, dict) and "resourceSpans" in obj:
+            yield obj, None
+        pos = text.find("{", end)
+
+
+# ---- Replay ----------------------------------------------------------------
+
+class Replay:
+
+    def __init__(self, ml_pool=None, batch_size=256):
+        self.ml_pool = ml_pool
+        self.batch_size = batch_size
+        self.states = {}
+        self.stage_s = dict.fromkeys(STAGES, 0.0)
+        self.spans = 0
+        self.verdicts = {}   # trace_id -> verdict
+        self.labels = {}     # trace_id -> label
+
+    def run(self, payloads):
+        start = time.perf_counter()
+        traces = self._assemble(payloads)
+        featured = self._features(traces)
+        self._score(featured)
+        self.wall_s = time.perf_counter() - start
+        self.traces = len(traces)
+
+    def _assemble(self, payloads):
+        traces = {}
+        for payload, label in payloads:
+            t0 = time.perf_counter()
+            spans = parse_trace(payload)
+            t1 = time.perf_counter()
+            for span in spans:
+                stats = traces.get(span["trace_id"])
+                if stats is None:
+                    stats = traces[span["trace_id"]] = build_full_trace()
+                    if label is not None:
+                        self.labels[span["trace_id"]] = label
+                fold_full_trace(stats, span)
+            t2 = time.perf_counter()
+            self.stage_s["parse"] += t1 - t0
+            self.stage_s["assemble"] += t2 - t1
+            self.spans += len(spans)
+        return traces
+
+    def _features(self, traces):
+        t0 = time.perf_counter()
+        featured = []
+        for trace_id, stats in traces.items():
+            stats["index"] = TraceIndex(stats["spans"])
+            featured.append((trace_id, stats, extract_features(stats, stats["spans"], stats["index"])))
+        self.stage_s["features"] += time.perf_counter() - t0
+        return featured
+
+    def _score(self, featured):
+        # Same batching as "batch-by-service": per-service groups in arrival
+        # order, flushed at batch_size.
+        pending = defaultdict(list)
+        for item in featured:
+            service = item[2]["primary_service"]
+            pending[service].append(item)
+            if len(pending[service]) >= self.batch_size:
+                self._score_batch(service, pending.pop(service))
+        for service, batch in pending.items():
+            self._score_batch(service, batch)
+
+    def _score_batch(self, service, batch):
+        t0 = time.perf_counter()
+        state = self.states.get(service)
+        if state is None:
+            state = self.states[service] = ServiceDetectorState()
+        features_list = [f for _, _, f in batch]
+        spans_list = [stats["spans"] for _, stats, _ in batch]
+        if self.ml_pool is not None:
+            with self.ml_pool.lease(self.ml_pool.key_for(service, None), len(batch)) as ml:
+                with state.using_ml(ml):
+                    verdicts = state.score_many(features_list, spans_list)
+        else:
+            verdicts = state.score_many(features_list, spans_list)
+        for (trace_id, _, _), verdict in zip(batch, verdicts):
+            self.verdicts[trace_id] = verdict
+        self.stage_s["score"] += time.perf_counter() - t0
+
+    # ---- Report ------------------------------------------------------------
+
+    def report(self):
+        traces = max(self.traces, 1)
+        result = {
+            "spans": self.spans,
+            "traces": self.traces,
+            "wall_s": self.wall_s,
+            "spans_per_s": self.spans / self.wall_s if self.wall_s else 0.0,
+            "traces_per_s": self.traces / self.wall_s if self.wall_s else 0.0,
+            "stages": {
+                stage: {"total_ms": s * 1000.0, "us_per_trace": s / traces * 1e6}
+                for stage, s in self.stage_s.items()
+            },
+        }
+        if self.labels:
+            result["detection"] = self._detection()
+        return result
+
+    def _detection(self):
+        tp = fp = fn = tn = 0
+        by_label = defaultdict(lambda: [0, 0])  # label -> [flagged, total]
+        for trace_id, label in self.labels.items():
+            verdict = self.verdicts.get(trace_id)
+            if verdict is None:
+                continue
+            flagged = bool(verdict["is_anomaly"])
+            by_label[label][0] += flagged
+            by_label[label][1] += 1
+            if label not in otlp_synth.ANOMALY_LABELS and label not in otlp_synth.NORMAL_LABELS:
+                continue  # no ground truth at the trace level (bimodal)
+            positive = label in otlp_synth.ANOMALY_LABELS
+            tp += flagged and positive
+            fp += flagged and not positive
+            fn += positive and not flagged
+            tn += not flagged and not positive
+        precision = tp / (tp + fp) if tp + fp else 0.0
+        recall = tp / (tp + fn) if tp + fn else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        return {
+            "tp": tp, "fp": fp, "fn": fn, "tn": tn,
+            "precision": precision, "recall": recall, "f1": f1,
+            "flag_rate_by_label": {
+                label: flagged / total for label, (flagged, total) in sorted(by_label.items())
+            },
+        }
+
+
+def build_ml_pool(corpus, mode):
+    from ml_scorer import ObserveXScorer, load_corpus_matrix
+    from model_pool import ModelPool
+
+    template = ObserveXScorer()
+    if os.path.exists(corpus):
+        template.learn_many(load_corpus_matrix(corpus))
+    else:
+        print(f"Warmup corpus not found at {corpus}; ML ensemble starts cold.", file=sys.stderr)
+    return ModelPool(template, mode=mode)
+
+
+def print_report(result, source):
+    print(f"Replay: {source}")
+    print(f"  {result['spans']} spans, {result['traces']} traces in {result['wall_s']:.2f}s")
+    print(f"  {result['spans_per_s']:,.0f} spans/s  {result['traces_per_s']:,.0f} traces/s")
+    for stage, s in result["stages"].items():
+        print(f"  {stage:9s} {s['total_ms']:10.1f}ms  {s['us_per_trace']:8.1f}us/trace")
+    det = result.get("detection")
+    if det:
+        print(f"  precision {det['precision']:.3f}  recall {det['recall']:.3f}  f1 {det['f1']:.3f}"
+              f"  (tp={det['tp']} fp={det['fp']} fn={det['fn']} tn={det['tn']})")
+        for label, rate in det["flag_rate_by_label"].items():
+            print(f"    flagged {label:9s} {rate:6.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--synthetic", type=int, metavar="N",
+                        help="Generate N labeled traces (otlp_synth)")
+    source.add_argument("--otlp", metavar="PATH", help="OTLP JSONL, one payload per line")
+    source.add_argument("--formats", metavar="PATH", help="Captured collector dump (formats/traces)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--traffic", action="store_true",
+                        help="Synthetic mix of trigger_traffic.py (normal/N+1/bimodal/PII)")
+    parser.add_argument("--batch", type=int, default=256, help="Per-service scoring batch size")
+    parser.add_argument("--ml", action="store_true", help="Score with the ML ensemble as well as rules")
+    parser.add_argument("--pool", default="service", help="ML pool mode (global, service, service_route)")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="ML warmup corpus")
+    parser.add_argument("--json", metavar="PATH", help="Also write the report as JSON")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        mix = otlp_synth.TRAFFIC_MIX if args.traffic else None
+        payloads = otlp_synth.generate(args.synthetic, seed=args.seed, mix=mix)
+        source_desc = f"{args.synthetic} synthetic traces"
+    elif args.otlp:
+        payloads, source_desc = load_otlp_jsonl(args.otlp), args.otlp
+    else:
+        payloads, source_desc = load_formats(args.formats), args.formats
+
+    # Materialise first so input generation is not timed as pipeline work.
+    payloads = list(payloads)
+    replay = Replay(build_ml_pool(args.corpus, args.pool) if args.ml else None, args.batch)
+    replay.run(payloads)
+    result = replay.report()
+    result["source"] = source_desc
+    result["ml"] = args.ml
+    print_report(result, source_desc)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
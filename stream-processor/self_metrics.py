@@ -0,0 +1,268 @@
+"""Self-instrumentation counters and histograms in Prometheus text format.
+
+The hot path only does a dict lookup (cached per label set) and an add
+under a per-series lock; nothing is formatted until `/metrics` is scraped.
+Gauges are callbacks evaluated at scrape time, so state that already lives
+elsewhere (the ML pool, the log buffer) is read, not mirrored.
+
+    PARSE = histogram("observex_parse_seconds", "Payload parse time", ("kind",))
+    PARSE.labels("trace").observe(0.0003)
+    serve(9464)   # GET http://host:9464/metrics
+
+No dependency on prometheus_client; the output is the 0.0.4 text format.
+Other debug handlers (profiling.py) can be mounted on the same listener
+with `add_route`. dashboard/backend vendors this module without the
+listener; keep the two copies in step.
+"""
+import json
+import bisect
+import logging
+import threading
+from urllib.parse import parse_qs, urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds, 100µs .. 10s.
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_str(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _CounterChild:
+    __slots__ = ("_lock", "value")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ("_lock", "_bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self._lock = threading.Lock()
+        self._bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last: +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self._bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def render(self):
+        lines = self._header()
+        for values, child in list(self._children.items()):
+            lines.append(f"{self.name}{_label_str(self.labelnames, values)} {_num(child.value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def render(self):
+        lines = self._header()
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts, total, count = list(child.counts), child.sum, child.count
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = _label_str(self.labelnames, values, f'le="{_num(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _label_str(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_num(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Read at scrape time from `fn`: a number, or {label values: number}.
+    Returning None omits the series (e.g. while a component is starting)."""
+    kind = "gauge"
+
+    def __init__(self, name, help_text, fn: Callable, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self.fn = fn
+
+    def render(self):
+        try:
+            value = self.fn()
+        except Exception as e:
+            logger.debug(f"Gauge {self.name} failed: {e}")
+            value = None
+        if value is None:
+            return []
+        lines = self._header()
+        if isinstance(value, dict):
+            for values, v in value.items():
+                values = values if isinstance(values, tuple) else (values,)
+                lines.append(f"{self.name}{_label_str(self.labelnames, values)} {_num(v)}")
+        else:
+            lines.append(f"{self.name} {_num(value)}")
+        return lines
+
+
+class Registry:
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            # Re-registering returns the existing metric (modules reloaded by
+            # tooling, or two modules sharing a series).
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help_text, labelnames=()) -> Counter:
+    return REGISTRY.register(Counter(name, help_text, labelnames))
+
+
+def histogram(name, help_text, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help_text, labelnames, buckets))
+
+
+def gauge(name, help_text, fn, labelnames=()) -> Gauge:
+    return REGISTRY.register(Gauge(name, help_text, fn, labelnames))
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+# (method, path) -> fn({query param: value}) -> (status, JSON-able body)
+_routes: Dict[Tuple[str, str], Callable] = {}
+
+
+def add_route(path: str, fn: Callable, method: str = "GET"):
+    _routes[(method, path)] = fn
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if urlsplit(self.path).path == "/metrics":
+            self._reply(200, render().encode(), CONTENT_TYPE)
+            return
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        fn = _routes.get((method, url.path))
+        if fn is None:
+            known = any(path == url.path for _, path in _routes)
+            self.send_error(405 if known else 404)
+            return
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        status, body = fn(query)
+        self._reply(status, json.dumps(body).encode(), "application/json")
+
+    def _reply(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # one line per scrape is noise
+
+
+def serve(port: int, host: str = "0.0.0.0") -> Optional[ThreadingHTTPServer]:
+    """Serve /metrics on a daemon thread; None (logged) if the port is taken."""
+    try:
+        server = ThreadingHTTPServer((host, port), _Handler)
+    except OSError as e:
+        logger.error(f"Metrics endpoint not started on {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="observex-metrics", daemon=True).start()
+    logger.info(f"Serving self metrics on http://{host}:{port}/metrics")
+    return server
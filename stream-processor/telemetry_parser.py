@@ -31,6 +31,7 @@ def parse_trace(trace_payload):
                     "route": extract_span_attr(span, "http.route") or span.get("name"),
                     "duration_ms": duration_ms,
                     "start_time": datetime.fromtimestamp(start_time / 1_000_000_000, tz=timezone.utc).isoformat(),
+                    "start_ms": start_time / 1_000_000,
                     "status_code": span.get("status", {}).get("code", 0)
                 })
     return results
@@ -0,0 +1,69 @@
+"""Trace reconstruction: folds parsed spans (telemetry_parser.parse_trace)
+into one trace-stats dict per trace_id.
+
+Used as the `fold_window` callbacks in dataflow.py and directly by the
+offline replay tool.
+"""
+from datetime import datetime, timezone
+
+SPAN_ANOMALY_MS = 500.0  # cosmetic per-span flag; trace-level verdict comes from scorer
+
+
+def get_trace_id_key(span):
+    return span["trace_id"]
+
+
+def build_full_trace():
+    # fanout counts children per (parent_span_id, span name) as spans arrive,
+    # so the N+1 statistic (max_fanout / fanout_op) is ready at window close.
+    return {
+        "duration_ms": 0, "spans": [], "has_anomaly": False, "start_time": None,
+        "fanout": {}, "max_fanout": 0, "fanout_op": None,
+    }
+
+
+def fold_full_trace(stats, span):
+    start_time = span.get("start_time") or datetime.now(timezone.utc).isoformat()
+    duration = span.get("duration_ms", 0)
+    stats["spans"].append({
+        "name": span.get("route", "unknown"),
+        "service": span.get("service_name", "unknown"),
+        "duration_ms": duration,
+        "start_time": start_time,
+        "start_ms": span.get("start_ms"),
+        "trace_id": span.get("trace_id", "unknown"),
+        "span_id": span.get("span_id", ""),
+        "parent_span_id": span.get("parent_span_id", ""),
+        "status_code": span.get("status_code", 0),
+        "is_anomaly": duration > SPAN_ANOMALY_MS,
+    })
+    stats["duration_ms"] = max(stats["duration_ms"], duration)
+    fan_key = (span.get("parent_span_id") or "", span.get("route", "unknown"))
+    fan = stats["fanout"].get(fan_key, 0) + 1
+    stats["fanout"][fan_key] = fan
+    if fan > stats["max_fanout"]:
+        stats["max_fanout"] = fan
+        stats["fanout_op"] = fan_key
+    if duration > SPAN_ANOMALY_MS:
+        stats["has_anomaly"] = True
+    if not stats["start_time"] or start_time < stats["start_time"]:
+        stats["start_time"] = start_time
+    return stats
+
+
+def merge_full_trace(s1, s2):
+    fanout = dict(s1["fanout"])
+    for key, n in s2["fanout"].items():
+        fanout[key] = fanout.get(key, 0) + n
+    fanout_op = max(fanout, key=fanout.get) if fanout else None
+    return {
+        "duration_ms": max(s1["duration_ms"], s2["duration_ms"]),
+        "spans": s1["spans"] + s2["spans"],
+        "has_anomaly": s1["has_anomaly"] or s2["has_anomaly"],
+        "start_time": s1["start_time"] if (
+            not s2["start_time"] or (s1["start_time"] and s1["start_time"] < s2["start_time"])
+        ) else s2["start_time"],
+        "fanout": fanout,
+        "max_fanout": fanout[fanout_op] if fanout_op else 0,
+        "fanout_op": fanout_op,
+    }
@@ -0,0 +1,260 @@
+"""One-pass structural index over a reconstructed trace's spans.
+
+Built once per closed trace and shared by feature extraction, the rule
+detectors and the per-service metrics, so they all read the same parent →
+child structure instead of each re-walking the span list. `compact()` is
+the JSON form attached to alerts, which the backend's RCA reads as-is.
+
+`latency_attribution()` adds per-span self time (duration minus the union
+of its children's intervals) and the critical path (walking back from
+each span's end through the latest-ending child), both summed per service
+and per service + route. Each span's children are visited once, so the
+cost is linear in spans apart from sorting each span's children.
+
+Spans are the dicts produced by the trace fold (name, service,
+duration_ms, start_ms, start_time, span_id, parent_span_id, status_code,
+is_anomaly).
+"""
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+# Status codes counted as errors (OTel UNSET=0 and OK=1 are not).
+OK_STATUS_CODES = (0, 1)
+# Edges carried in the compact form; the RCA prompt shows 15.
+COMPACT_EDGE_LIMIT = 15
+# Largest critical-path contributors carried in the compact form.
+COMPACT_PATH_LIMIT = 10
+
+
+def _label(span: Dict) -> str:
+    return f"{span.get('service') or '?'}::{span.get('name') or '?'}"
+
+
+def _start_ms(span: Dict) -> float:
+    start = span.get("start_ms")
+    if start is not None:
+        return float(start)
+    try:
+        return datetime.fromisoformat(span["start_time"]).timestamp() * 1000.0
+    except (KeyError, TypeError, ValueError):
+        return 0.0
+
+
+def _new_agg() -> Dict:
+    return {"spans": 0, "errors": 0, "duration_ms": 0.0, "durations": []}
+
+
+class TraceIndex:
+
+    def __init__(self, spans: List[Dict]):
+        self.spans = spans
+        self.by_id: Dict[str, int] = {}
+        self.children: List[List[int]] = [[] for _ in spans]
+        self.roots: List[int] = []
+        self.dangling: List[int] = []
+        self.depth: List[int] = [0] * len(spans)
+        self.services: Dict[str, Dict] = {}
+        self.routes: Dict[str, Dict] = {}
+        self.error_count = 0
+        self.slow_count = 0
+
+        for pos, s in enumerate(spans):
+            sid = s.get("span_id")
+            if sid:
+                self.by_id.setdefault(sid, pos)
+            is_error = s.get("status_code", 0) not in OK_STATUS_CODES
+            duration = s.get("duration_ms", 0.0)
+            self.error_count += is_error
+            self.slow_count += bool(s.get("is_anomaly"))
+            for aggs, key in ((self.services, s.get("service", "unknown")),
+                              (self.routes, s.get("name", "unknown"))):
+                agg = aggs.get(key)
+                if agg is None:
+                    agg = aggs[key] = _new_agg()
+                agg["spans"] += 1
+                agg["errors"] += is_error
+                agg["duration_ms"] += duration
+                agg["durations"].append(duration)
+
+        # Parent links resolve only once every span_id is known.
+        for pos, s in enumerate(spans):
+            parent = s.get("parent_span_id") or ""
+            parent_pos = self.by_id.get(parent) if parent else None
+            if parent_pos is None or parent_pos == pos:
+                self.roots.append(pos)
+                if parent:
+                    self.dangling.append(pos)
+            else:
+                self.children[parent_pos].append(pos)
+
+        # Depths from every root (dangling spans root their own subtree).
+        stack = list(self.roots)
+        seen = [False] * len(spans)
+        for pos in stack:
+            seen[pos] = True
+        while stack:
+            pos = stack.pop()
+            for child in self.children[pos]:
+                if not seen[child]:
+                    seen[child] = True
+                    self.depth[child] = self.depth[pos] + 1
+                    stack.append(child)
+        self.max_depth = max(self.depth, default=0)
+        self._bounds_ms = None
+        self._attribution = None
+
+    @property
+    def primary_service(self) -> str:
+        """Service with the most summed span time (first seen on ties)."""
+        if not self.services:
+            return "unknown"
+        return max(self.services, key=lambda svc: self.services[svc]["duration_ms"])
+
+    @property
+    def dangling_span(self) -> Optional[str]:
+        """Name of the first span whose parent is missing from the trace."""
+        if not self.dangling:
+            return None
+        return self.spans[self.dangling[0]].get("name", "unknown")
+
+    # ── Latency attribution ─────────────────────────────────────────
+
+    def _bounds(self) -> Tuple[List[float], List[float]]:
+        if self._bounds_ms is None:
+            start = [_start_ms(s) for s in self.spans]
+            end = [st + s.get("duration_ms", 0.0) for st, s in zip(start, self.spans)]
+            self._bounds_ms = (start, end)
+        return self._bounds_ms
+
+    def self_times(self) -> List[float]:
+        """Per span: duration minus the time covered by any child."""
+        start, end = self._bounds()
+        out = []
+        for pos, kids in enumerate(self.children):
+            lo, hi = start[pos], end[pos]
+            if not kids:
+                out.append(max(hi - lo, 0.0))
+                continue
+            covered, cursor = 0.0, lo
+            for child in sorted(kids, key=start.__getitem__):
+                cs, ce = max(start[child], cursor), min(end[child], hi)
+                if ce > cs:
+                    covered += ce - cs
+                    cursor = ce
+            out.append(max(hi - lo - covered, 0.0))
+        return out
+
+    def critical_path(self) -> Dict[int, float]:
+        """{span position: ms it alone spends on the critical path}. The
+        path starts at the longest root; the values sum to its duration.
+        Empty when there is no root, i.e. the parent links form a cycle
+        (a span's ancestors can then never be walked to an end)."""
+        if not self.roots:
+            return {}
+        start, end = self._bounds()
+        root = max(self.roots, key=lambda pos: end[pos] - start[pos])
+        crit: Dict[int, float] = {}
+
+        def by_end(pos):
+            return sorted(self.children[pos], key=end.__getitem__, reverse=True)
+
+        # Frame: [span, window start, cursor walking back, children, next child]
+        stack = [[root, start[root], end[root], by_end(root), 0]]
+        while stack:
+            frame = stack[-1]
+            pos, lo, cursor, kids, i = frame
+            while i < len(kids):
+                child = kids[i]
+                i += 1
+                if start[child] >= cursor or end[child] <= lo:
+                    continue  # overlapped by a later child, or outside the window
+                ce = min(end[child], cursor)
+                cs = max(start[child], lo)
+                crit[pos] = crit.get(pos, 0.0) + (cursor - ce)
+                cursor = cs
+                if not self.children[child]:
+                    crit[child] = crit.get(child, 0.0) + (ce - cs)
+                    continue  # leaf: no frame needed
+                frame[2], frame[4] = cursor, i
+                stack.append([child, cs, ce, by_end(child), 0])
+                break
+            else:
+                crit[pos] = crit.get(pos, 0.0) + max(cursor - lo, 0.0)
+                stack.pop()
+        return crit
+
+    def latency_attribution(self) -> Dict:
+        """Critical-path and self time per service, and per route within
+        each service (`routes[service][route]`). Computed once, then cached."""
+        if self._attribution is not None:
+            return self._attribution
+        self_ms = self.self_times()
+        crit = self.critical_path()
+        services: Dict[str, Dict] = {}
+        routes: Dict[str, Dict[str, Dict]] = {}
+        for pos, s in enumerate(self.spans):
+            svc = s.get("service", "unknown")
+            route = s.get("name", "unknown")
+            crit_ms, own_ms = crit.get(pos, 0.0), self_ms[pos]
+            agg = services.get(svc)
+            if agg is None:
+                agg = services[svc] = {"critical_ms": 0.0, "self_ms": 0.0}
+                routes[svc] = {}
+            agg["critical_ms"] += crit_ms
+            agg["self_ms"] += own_ms
+            agg = routes[svc].get(route)
+            if agg is None:
+                agg = routes[svc][route] = {"critical_ms": 0.0, "self_ms": 0.0}
+            agg["critical_ms"] += crit_ms
+            agg["self_ms"] += own_ms
+        top = sorted(crit.items(), key=lambda kv: kv[1], reverse=True)[:COMPACT_PATH_LIMIT]
+        self._attribution = {
+            "critical_path_ms": sum(crit.values()),
+            "services": services,
+            "routes": routes,
+            "path": [
+                [self.spans[pos].get("span_id", ""), _label(self.spans[pos]), ms]
+                for pos, ms in top if ms > 0
+            ],
+        }
+        return self._attribution
+
+    def compact(self) -> Dict:
+        """JSON-safe summary for alerts and the backend RCA."""
+        spans = self.spans
+        edges = []
+        edge_count = 0
+        for pos, kids in enumerate(self.children):
+            for child in kids:
+                edge_count += 1
+                if len(edges) < COMPACT_EDGE_LIMIT:
+                    edges.append([spans[pos].get("span_id", ""),
+                                  spans[child].get("span_id", ""),
+                                  _label(spans[child])])
+        durations = [s.get("duration_ms", 0.0) for s in spans]
+        return {
+            "span_count": len(spans),
+            "max_depth": self.max_depth,
+            "error_count": self.error_count,
+            "slow_span_count": self.slow_count,
+            "min_span_ms": min(durations, default=0.0),
+            "max_span_ms": max(durations, default=0.0),
+            "avg_span_ms": sum(durations) / len(durations) if durations else 0.0,
+            "roots": [spans[pos].get("span_id", "") for pos in self.roots],
+            "edges": edges,
+            "edge_count": edge_count,
+            "dangling": [
+                [spans[pos].get("span_id", ""), _label(spans[pos]),
+                 spans[pos].get("parent_span_id", "")]
+                for pos in self.dangling
+            ],
+            "services": {
+                svc: {k: agg[k] for k in ("spans", "errors", "duration_ms")}
+                for svc, agg in self.services.items()
+            },
+            "routes": {
+                route: {k: agg[k] for k in ("spans", "errors", "duration_ms")}
+                for route, agg in self.routes.items()
+            },
+            "attribution": self.latency_attribution(),
+        }
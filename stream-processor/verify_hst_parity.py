@@ -0,0 +1,76 @@
+"""Parity check: array-backed HalfSpaceTrees vs. river.anomaly.HalfSpaceTrees.
+
+Replays the same feature stream through both implementations with
+ObserveXScorer's parameters and compares score_one before every learn_one,
+then checks that the batch paths (learn_many / score_many) match row-by-row.
+
+Usage:
+    python verify_hst_parity.py
+    python verify_hst_parity.py --rows 5000 --tolerance 1e-9
+"""
+import sys
+import time
+import argparse
+
+import numpy as np
+from river.anomaly import HalfSpaceTrees as RiverHST
+
+from half_space_trees import HalfSpaceTrees
+from ml_scorer import FEATURE_SCHEMA
+
+PARAMS = {"n_trees": 25, "height": 8, "window_size": 100, "seed": 42}
+
+
+def synthetic_stream(rows, seed=0):
+    """Feature vectors in ObserveXScorer's input space (_feature_vec)."""
+    rng = np.random.default_rng(seed)
+    duration = np.minimum(rng.lognormal(mean=-2.0, sigma=1.0, size=rows), 5.0)
+    span_count = rng.integers(1, 40, size=rows).astype(float)
+    error_rate = (rng.random(rows) < 0.1).astype(float)
+    return np.column_stack([duration, span_count, error_rate])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--tolerance", type=float, default=1e-9)
+    args = parser.parse_args()
+
+    X = synthetic_stream(args.rows)
+    dicts = [dict(zip(FEATURE_SCHEMA, row)) for row in X.tolist()]
+
+    river = RiverHST(**PARAMS)
+    ours = HalfSpaceTrees(**PARAMS, features=FEATURE_SCHEMA)
+    worst = 0.0
+    river_s = ours_s = 0.0
+    for x in dicts:
+        t0 = time.perf_counter()
+        a = river.score_one(x)
+        river.learn_one(x)
+        t1 = time.perf_counter()
+        b = ours.score_one(x)
+        ours.learn_one(x)
+        t2 = time.perf_counter()
+        river_s += t1 - t0
+        ours_s += t2 - t1
+        worst = max(worst, abs(a - b))
+    print(f"  online score_one max |diff|: {worst:.3e}")
+    print(f"  river  {river_s / len(dicts) * 1e6:7.1f}us/row (score+learn)")
+    print(f"  numpy  {ours_s / len(dicts) * 1e6:7.1f}us/row (score+learn)")
+
+    bulk = HalfSpaceTrees(**PARAMS, features=FEATURE_SCHEMA).learn_many(X)
+    t0 = time.perf_counter()
+    batch = bulk.score_many(X)
+    batch_s = time.perf_counter() - t0
+    rowwise = np.array([river.score_one(x) for x in dicts])
+    batch_worst = float(np.abs(batch - rowwise).max())
+    print(f"  learn_many/score_many max |diff|: {batch_worst:.3e} "
+          f"({batch_s / len(X) * 1e6:.1f}us/row)")
+
+    ok = worst <= args.tolerance and batch_worst <= args.tolerance
+    print("PARITY OK" if ok else "PARITY FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Parity check: FlatIsolationForest vs. sklearn IsolationForest.score_samples.
+
+Fits ObserveXScorer's Isolation Forest on a synthetic training window,
+exports it, and compares scores and per-trace cost at several batch sizes.
+
+Usage:
+    python verify_iforest_parity.py
+    python verify_iforest_parity.py --rows 5000 --tolerance 1e-9
+"""
+import sys
+import time
+import argparse
+
+import numpy as np
+from sklearn.ensemble import IsolationForest
+
+from flat_iforest import FlatIsolationForest
+from verify_hst_parity import synthetic_stream
+
+
+def per_trace_us(fn, X, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(X)
+    return (time.perf_counter() - start) / repeat / len(X) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--tolerance", type=float, default=1e-9)
+    args = parser.parse_args()
+
+    train = synthetic_stream(500, seed=1)
+    train = train[train[:, 2] == 0]
+    iso = IsolationForest(contamination=0.1, random_state=42).fit(train)
+    start = time.perf_counter()
+    flat = FlatIsolationForest.from_sklearn(iso)
+    print(f"  export: {(time.perf_counter() - start) * 1000:.1f}ms "
+          f"({flat.n_trees} trees x {flat.width} nodes)")
+
+    X = synthetic_stream(args.rows)
+    worst = float(np.abs(iso.score_samples(X) - flat.score_samples(X)).max())
+    print(f"  score_samples max |diff|: {worst:.3e}")
+    for batch in (1, 64, 256):
+        Xb = X[:batch]
+        print(f"  batch {batch:4d}: sklearn {per_trace_us(iso.score_samples, Xb):8.1f}us/trace"
+              f"  flat {per_trace_us(flat.score_samples, Xb):7.1f}us/trace")
+
+    ok = worst <= args.tolerance
+    print("PARITY OK" if ok else "PARITY FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
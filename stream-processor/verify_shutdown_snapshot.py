@@ -0,0 +1,75 @@
+"""Shutdown check: SIGTERM still leaves a snapshot behind.
+
+Starts a process that imports the dataflow module with an empty snapshot
+directory and waits for its ML ensemble, sends it SIGTERM (what stop.sh
+and `docker stop` do), and checks that it exits with the SIGTERM status
+and has written an ensemble snapshot and the trace dedup filter.
+
+Usage:
+    python verify_shutdown_snapshot.py
+    python verify_shutdown_snapshot.py --timeout 180
+"""
+import os
+import sys
+import glob
+import time
+import signal
+import argparse
+import tempfile
+import subprocess
+
+CHILD = """
+import sys, time
+import dataflow
+if not dataflow.wait_for_ml(float(sys.argv[1])):
+    sys.exit("ML ensemble not ready")
+print("ready", flush=True)
+while True:
+    time.sleep(1)
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    snapshot_dir = tempfile.mkdtemp(prefix="observex-shutdown-")
+    env = dict(
+        os.environ,
+        OBSERVEX_SNAPSHOT_DIR=snapshot_dir,
+        OBSERVEX_SNAPSHOT_INTERVAL_SEC="1e9",  # only the shutdown snapshot
+        OBSERVEX_METRICS_PORT="0",
+    )
+    child = subprocess.Popen(
+        [sys.executable, "-c", CHILD, str(args.timeout)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env, stdout=subprocess.PIPE, text=True,
+    )
+    line = child.stdout.readline().strip()
+    if line != "ready":
+        child.kill()
+        print(f"SHUTDOWN FAILED: child did not start ({line!r}, exit {child.wait()})")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    child.send_signal(signal.SIGTERM)
+    try:
+        code = child.wait(timeout=args.timeout)
+    except subprocess.TimeoutExpired:
+        child.kill()
+        print("SHUTDOWN FAILED: child still running after SIGTERM")
+        sys.exit(1)
+    print(f"  exit status {code} after {(time.perf_counter() - start) * 1000:.0f}ms")
+
+    snapshots = glob.glob(os.path.join(snapshot_dir, "ensemble-*.snap"))
+    bloom = os.path.exists(os.path.join(snapshot_dir, "seen-traces.bloom"))
+    print(f"  snapshots: {[os.path.basename(p) for p in snapshots]}, dedup filter: {bloom}")
+
+    ok = code == 128 + signal.SIGTERM and len(snapshots) == 1 and bloom
+    print("SHUTDOWN OK" if ok else "SHUTDOWN FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
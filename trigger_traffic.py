@@ -14,6 +14,15 @@ Traffic Profile (from paper):
 Corpus distribution: 80% normal, 10% N+1, 5% bimodal, 5% PII
 RPS range: 20-100 req/s (default 10/s = paper's λ)
 
+Load model:
+  Open loop. Send times follow a Poisson process at the profile's current
+  rate and never wait for earlier responses; requests share one asyncio
+  httpx connection pool. Latency is measured from each request's intended
+  send time, so a slow gateway shows up in the percentiles instead of
+  silently lowering the offered rate (coordinated omission). Service time
+  (from the actual send) is reported alongside. Histograms are
+  log-bucketed (~1% resolution) with bounded memory at any rate.
+
 Usage:
     python trigger_traffic.py                          # Default: 60s research-profile traffic
     python trigger_traffic.py --duration 120           # Run for 2 minutes
@@ -25,17 +34,19 @@ Usage:
     python trigger_traffic.py --mode burst             # Ramp 20→100 RPS over duration
     python trigger_traffic.py --rps 10                 # Poisson mean λ=10 req/s
     python trigger_traffic.py --corpus 1000            # Generate exactly 1000 traces then stop
+    python trigger_traffic.py --profile ramp --rps 100 --rps-end 2000 --duration 120
+    python trigger_traffic.py --profile step --rps 100 --step-rps 250 --step-seconds 20 --rps-end 3000
 """
 
 import argparse
-import requests
-import time
-import random
+import asyncio
+import json
 import math
-import sys
-import threading
-from datetime import datetime
-from collections import defaultdict
+import random
+import signal
+from collections import Counter
+
+import httpx
 
 # ── Gateway endpoint configuration ────────────────────────────────
 GATEWAY = "http://localhost:3001"
@@ -63,10 +74,63 @@ MODE_DISTRIBUTIONS = {
     "burst":   {"weights": {"normal": 0.80, "slow": 0.05, "n_plus_1": 0.10, "pii": 0.05}},
 }
 
-# ── Stats tracking ────────────────────────────────────────────────
-stats = {"total": 0, "success": 0, "errors": 0, "latencies": [], "per_type": defaultdict(int)}
-stats_lock = threading.Lock()
+PROFILES = ("constant", "ramp", "step")
+REQUEST_TIMEOUT_S = 30.0
+
+
+# ── Latency histograms ────────────────────────────────────────────
+
+class LatencyHistogram:
+    """HDR-style log-bucketed histogram: ~1% relative error, memory bounded
+    by the value range (a few hundred buckets), O(1) record. bench_backend.py
+    uses it too."""
+
+    FLOOR_MS = 0.01
+    GROWTH = 1.01
+
+    def __init__(self):
+        self.counts = Counter()
+        self.n = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def record(self, ms):
+        self.n += 1
+        self.total += ms
+        self.min = min(self.min, ms)
+        self.max = max(self.max, ms)
+        bucket = int(math.log(max(ms, self.FLOOR_MS) / self.FLOOR_MS) / math.log(self.GROWTH))
+        self.counts[bucket] += 1
+
+    def percentile(self, q):
+        if not self.n:
+            return 0.0
+        rank, seen = q / 100.0 * self.n, 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return min(self.FLOOR_MS * self.GROWTH ** (bucket + 1), self.max)
+        return self.max
+
+    def summary(self):
+        out = {"avg": self.total / self.n if self.n else 0.0, "min": self.min if self.n else 0.0}
+        out.update({f"p{q:g}": self.percentile(q) for q in (50, 90, 95, 99, 99.9)})
+        out["max"] = self.max
+        return out
+
+
+class EndpointStats:
+
+    def __init__(self):
+        self.sent = 0
+        self.success = 0
+        self.errors = Counter()          # "http_5xx", "connect", "timeout", ...
+        self.latency = LatencyHistogram()   # from intended send time
+        self.service = LatencyHistogram()   # from actual send time
+
 
+# ── Rate profiles ─────────────────────────────────────────────────
 
 def poisson_interval(lam):
     """
@@ -78,6 +142,27 @@ def poisson_interval(lam):
     return -math.log(1.0 - random.random()) / lam
 
 
+def compute_burst_rps(elapsed, duration, rps_min=20, rps_max=100):
+    """
+    Linearly ramp RPS from rps_min to rps_max over the run duration.
+    Paper Section VI.A: "20–100 requests/s"
+    """
+    progress = min(elapsed / duration, 1.0)
+    return rps_min + (rps_max - rps_min) * progress
+
+
+def rate_at(args, elapsed):
+    """Offered rate (req/s) `elapsed` seconds into the run."""
+    if args.mode == "burst":
+        return compute_burst_rps(elapsed, args.duration)
+    if args.profile == "ramp":
+        return compute_burst_rps(elapsed, args.duration, args.rps, args.rps_end)
+    if args.profile == "step":
+        rps = args.rps + args.step_rps * int(elapsed // args.step_seconds)
+        return min(rps, args.rps_end) if args.rps_end else rps
+    return args.rps
+
+
 def weighted_choice(weights):
     """Select an endpoint key based on the paper-specified distribution weights."""
     keys = list(weights.keys())
@@ -85,96 +170,166 @@ def weighted_choice(weights):
     return random.choices(keys, weights=vals, k=1)[0]
 
 
-def send_request(endpoint_key):
-    """Send a single HTTP request and track stats."""
-    ep = ENDPOINTS[endpoint_key]
-    try:
-        start = time.time()
-        resp = requests.get(ep["url"], timeout=30)
-        latency = (time.time() - start) * 1000
-
-        with stats_lock:
-            stats["total"] += 1
-            stats["success"] += 1
-            stats["latencies"].append(latency)
-            stats["per_type"][endpoint_key] += 1
-
-        status_color = "\033[32m" if resp.status_code < 400 else "\033[33m"
-        print(f"  [{datetime.now().strftime('%H:%M:%S.%f')[:-3]}] "
-              f"{ep['label']:20s} {status_color}{resp.status_code}\033[0m  "
-              f"{latency:7.0f}ms")
-    except requests.exceptions.ConnectionError:
-        with stats_lock:
-            stats["total"] += 1
-            stats["errors"] += 1
-            stats["per_type"][endpoint_key] += 1
-        print(f"  [{datetime.now().strftime('%H:%M:%S.%f')[:-3]}] "
-              f"{ep['label']:20s} \033[31mCONNECTION REFUSED\033[0m")
-    except requests.exceptions.Timeout:
-        with stats_lock:
-            stats["total"] += 1
-            stats["errors"] += 1
-            stats["per_type"][endpoint_key] += 1
-        print(f"  [{datetime.now().strftime('%H:%M:%S.%f')[:-3]}] "
-              f"{ep['label']:20s} \033[31mTIMEOUT (>30s)\033[0m")
-    except Exception as e:
-        with stats_lock:
-            stats["total"] += 1
-            stats["errors"] += 1
-            stats["per_type"][endpoint_key] += 1
-        print(f"  [{datetime.now().strftime('%H:%M:%S.%f')[:-3]}] "
-              f"{ep['label']:20s} \033[31mERROR: {e}\033[0m")
-
-
-def send_request_threaded(endpoint_key):
-    """Fire a request in a background thread (non-blocking for high RPS)."""
-    t = threading.Thread(target=send_request, args=(endpoint_key,), daemon=True)
-    t.start()
-    return t
+# ── Sending ───────────────────────────────────────────────────────
 
+async def send_request(client, endpoint_key, intended, stats):
+    """Send one request; latency counts from `intended` (loop time)."""
+    loop = asyncio.get_running_loop()
+    ep_stats = stats[endpoint_key]
+    ep_stats.sent += 1
+    started = loop.time()
+    try:
+        resp = await client.get(ENDPOINTS[endpoint_key]["url"])
+        if resp.status_code < 400:
+            ep_stats.success += 1
+        else:
+            ep_stats.errors[f"http_{resp.status_code // 100}xx"] += 1
+    except httpx.TimeoutException:
+        ep_stats.errors["timeout"] += 1
+    except httpx.ConnectError:
+        ep_stats.errors["connect"] += 1
+    except httpx.HTTPError as e:
+        ep_stats.errors[type(e).__name__] += 1
+    except asyncio.CancelledError:
+        ep_stats.errors["abandoned"] += 1
+        raise
+    done = loop.time()
+    ep_stats.latency.record((done - intended) * 1000.0)
+    ep_stats.service.record((done - started) * 1000.0)
+
+
+async def report_progress(stats, inflight, start):
+    loop = asyncio.get_running_loop()
+    last_sent = 0
+    while True:
+        await asyncio.sleep(1.0)
+        sent = sum(s.sent for s in stats.values())
+        errors = sum(sum(s.errors.values()) for s in stats.values())
+        print(f"  [{loop.time() - start:6.1f}s] sent {sent:8d}  {sent - last_sent:6d}/s"
+              f"  in-flight {len(inflight):6d}  errors {errors}")
+        last_sent = sent
+
+
+async def generate(args, dist):
+    """Open-loop scheduler: returns (stats, dropped, seconds)."""
+    stats = {key: EndpointStats() for key in dist["weights"]}
+    limits = httpx.Limits(max_connections=args.connections,
+                          max_keepalive_connections=args.connections)
+    inflight = set()
+    dropped = 0
+    loop = asyncio.get_running_loop()
+    # Ctrl+C ends the schedule but still drains and reports.
+    stop = asyncio.Event()
+    try:
+        loop.add_signal_handler(signal.SIGINT, stop.set)
+    except NotImplementedError:  # Windows event loops
+        pass
+
+    async with httpx.AsyncClient(limits=limits, timeout=REQUEST_TIMEOUT_S) as client:
+        start = intended = loop.time()
+        progress = asyncio.create_task(report_progress(stats, inflight, start))
+        request_count = 0
+        while not stop.is_set():
+            # Stop condition: corpus mode or duration mode
+            if args.corpus > 0:
+                if request_count >= args.corpus:
+                    break
+            elif intended - start >= args.duration:
+                break
 
-def compute_burst_rps(elapsed, duration, rps_min=20, rps_max=100):
-    """
-    Linearly ramp RPS from rps_min to rps_max over the run duration.
-    Paper Section VI.A: "20–100 requests/s"
-    """
-    progress = min(elapsed / duration, 1.0)
-    return rps_min + (rps_max - rps_min) * progress
+            now = loop.time()
+            if intended > now:
+                await asyncio.sleep(intended - now)
 
+            endpoint_key = weighted_choice(dist["weights"])
+            if len(inflight) >= args.max_inflight:
+                dropped += 1
+            else:
+                task = asyncio.create_task(send_request(client, endpoint_key, intended, stats))
+                inflight.add(task)
+                task.add_done_callback(inflight.discard)
+            request_count += 1
 
-def print_summary(duration_actual):
+            # Poisson-distributed inter-arrival delay on an absolute
+            # schedule: a late wakeup is caught up, not carried forward.
+            # Paper Section V: "Poisson-distributed inter-arrivals (λ=10/s)"
+            intended += poisson_interval(rate_at(args, intended - start))
+        if stop.is_set():
+            print("\n\033[33mStopped by user (Ctrl+C).\033[0m")
+
+        if inflight:
+            print(f"\n  Waiting for {len(inflight)} outstanding requests...")
+            _, pending = await asyncio.wait(set(inflight), timeout=REQUEST_TIMEOUT_S)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        progress.cancel()
+    return stats, dropped, loop.time() - start
+
+
+# ── Reporting ─────────────────────────────────────────────────────
+
+def summarize(stats, dropped, duration_actual):
+    total = sum(s.sent for s in stats.values())
+    overall, overall_service = LatencyHistogram(), LatencyHistogram()
+    for s in stats.values():
+        for src, into in ((s.latency, overall), (s.service, overall_service)):
+            into.counts.update(src.counts)
+            into.n += src.n
+            into.total += src.total
+            into.min = min(into.min, src.min)
+            into.max = max(into.max, src.max)
+    return {
+        "duration_s": duration_actual,
+        "total": total,
+        "success": sum(s.success for s in stats.values()),
+        "errors": sum(sum(s.errors.values()) for s in stats.values()),
+        "dropped": dropped,
+        "effective_rps": total / max(duration_actual, 0.1),
+        "latency_ms": overall.summary(),
+        "service_time_ms": overall_service.summary(),
+        "endpoints": {
+            key: {
+                "sent": s.sent,
+                "success": s.success,
+                "errors": dict(s.errors),
+                "latency_ms": s.latency.summary(),
+                "service_time_ms": s.service.summary(),
+            }
+            for key, s in stats.items() if s.sent
+        },
+    }
+
+
+def print_summary(summary):
     """Print a detailed traffic generation summary with per-type breakdown."""
     print("\n\033[1m==========================================\033[0m")
     print("\033[1m  ObserveX Traffic Generation Summary\033[0m")
     print("\033[1m==========================================\033[0m")
-    print(f"  Actual Duration: {duration_actual:.1f}s")
-    print(f"  Total Requests:  {stats['total']}")
-    print(f"  Successful:      \033[32m{stats['success']}\033[0m")
-    print(f"  Errors:          \033[31m{stats['errors']}\033[0m")
-    if stats['total'] > 0:
-        effective_rps = stats['total'] / max(duration_actual, 0.1)
-        print(f"  Effective RPS:   {effective_rps:.1f}")
+    print(f"  Actual Duration: {summary['duration_s']:.1f}s")
+    print(f"  Total Requests:  {summary['total']}")
+    print(f"  Successful:      \033[32m{summary['success']}\033[0m")
+    print(f"  Errors:          \033[31m{summary['errors']}\033[0m")
+    if summary["dropped"]:
+        print(f"  Dropped:         \033[31m{summary['dropped']}\033[0m (--max-inflight reached)")
+    if summary["total"] > 0:
+        print(f"  Effective RPS:   {summary['effective_rps']:.1f}")
 
     # Per-type breakdown
     print("\n  \033[1mPer-Type Breakdown:\033[0m")
-    for etype, count in sorted(stats["per_type"].items()):
-        pct = (count / stats['total'] * 100) if stats['total'] > 0 else 0
-        label = ENDPOINTS[etype]["label"]
-        print(f"    {label:20s}  {count:5d}  ({pct:5.1f}%)")
-
-    if stats["latencies"]:
-        lats = sorted(stats["latencies"])
-        avg = sum(lats) / len(lats)
-        p50 = lats[len(lats) // 2]
-        p95 = lats[int(len(lats) * 0.95)]
-        p99 = lats[int(len(lats) * 0.99)]
-        print(f"\n  \033[1mLatency Distribution:\033[0m")
-        print(f"    Avg:  {avg:7.0f}ms")
-        print(f"    P50:  {p50:7.0f}ms")
-        print(f"    P95:  {p95:7.0f}ms")
-        print(f"    P99:  {p99:7.0f}ms")
-        print(f"    Min:  {lats[0]:7.0f}ms")
-        print(f"    Max:  {lats[-1]:7.0f}ms")
+    print(f"    {'':20s}  {'count':>6s}  {'share':>6s}  {'p50':>8s}  {'p99':>8s}  {'p99.9':>8s}  errors")
+    for key, ep in sorted(summary["endpoints"].items()):
+        pct = ep["sent"] / summary["total"] * 100
+        lat = ep["latency_ms"]
+        errors = ", ".join(f"{k}={v}" for k, v in sorted(ep["errors"].items())) or "-"
+        print(f"    {ENDPOINTS[key]['label']:20s}  {ep['sent']:6d}  {pct:5.1f}%"
+              f"  {lat['p50']:6.0f}ms  {lat['p99']:6.0f}ms  {lat['p99.9']:6.0f}ms  {errors}")
+
+    lat, svc = summary["latency_ms"], summary["service_time_ms"]
+    if summary["total"] > 0:
+        print(f"\n  \033[1mLatency Distribution:\033[0m   (from intended send / service time)")
+        for name in ("avg", "p50", "p90", "p95", "p99", "p99.9", "min", "max"):
+            print(f"    {name.upper() if name[0] == 'p' else name.title():6s} {lat[name]:8.0f}ms  {svc[name]:8.0f}ms")
     print("\033[1m==========================================\033[0m")
 
 
@@ -191,10 +346,16 @@ Modes:
   all     - 25%% each endpoint type
   burst   - Ramp RPS from 20→100 over duration (paper Section VI.A)
 
+Profiles (rate over time; burst mode always ramps 20→100):
+  constant - --rps throughout
+  ramp     - linear from --rps to --rps-end over --duration
+  step     - --rps, plus --step-rps every --step-seconds (capped at --rps-end)
+
 Examples:
   %(prog)s --duration 60 --mode mixed --rps 10     # Paper's λ=10/s Poisson
   %(prog)s --duration 120 --mode burst              # Ramp 20→100 RPS
   %(prog)s --corpus 1000 --mode mixed               # Generate exactly 1000 traces
+  %(prog)s --profile ramp --rps 100 --rps-end 3000 --duration 300
         """
     )
     parser.add_argument("--duration", type=int, default=60,
@@ -202,14 +363,38 @@ Examples:
     parser.add_argument("--mode", choices=list(MODE_DISTRIBUTIONS.keys()), default="mixed",
                         help="Traffic mode (default: mixed)")
     parser.add_argument("--rps", type=float, default=10,
-                        help="Mean requests/second — Poisson λ (default: 10, paper's λ)")
+                        help="Mean requests/second — Poisson λ (default: 10, paper's λ); "
+                             "the starting rate for ramp/step profiles")
     parser.add_argument("--corpus", type=int, default=0,
                         help="Generate exactly N traces then stop (overrides --duration). "
                              "Paper uses 1000.")
+    parser.add_argument("--profile", choices=PROFILES, default="constant",
+                        help="Rate profile (default: constant)")
+    parser.add_argument("--rps-end", type=float, default=0,
+                        help="Final rate for ramp, cap for step")
+    parser.add_argument("--step-rps", type=float, default=100,
+                        help="Rate added per step (default: 100)")
+    parser.add_argument("--step-seconds", type=float, default=10,
+                        help="Seconds per step (default: 10)")
+    parser.add_argument("--connections", type=int, default=200,
+                        help="Shared HTTP connection pool size (default: 200)")
+    parser.add_argument("--max-inflight", type=int, default=20000,
+                        help="Drop (and count) sends beyond this many outstanding requests")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Seed endpoint choice and arrivals for a repeatable schedule")
+    parser.add_argument("--json", metavar="PATH",
+                        help="Also write the summary (histogram percentiles) as JSON")
     parser.add_argument("--concurrent", action="store_true",
-                        help="Send requests concurrently (non-blocking, for high RPS)")
+                        help="Accepted for compatibility; requests are always concurrent")
     args = parser.parse_args()
 
+    if args.rps <= 0:
+        parser.error("--rps must be positive")
+    if args.profile == "ramp" and args.rps_end <= 0:
+        parser.error("--profile ramp needs --rps-end")
+    if args.seed is not None:
+        random.seed(args.seed)
+
     dist = MODE_DISTRIBUTIONS[args.mode]
     is_burst = args.mode == "burst"
     use_corpus = args.corpus > 0
@@ -224,64 +409,23 @@ Examples:
         print(f"  Duration:     {args.duration}s")
     if is_burst:
         print(f"  RPS:          20 → 100 (ramping)")
+    elif args.profile == "ramp":
+        print(f"  RPS:          {args.rps:g} → {args.rps_end:g} (ramping, Poisson)")
+    elif args.profile == "step":
+        print(f"  RPS:          {args.rps:g} +{args.step_rps:g} every {args.step_seconds:g}s"
+              + (f" up to {args.rps_end:g}" if args.rps_end else "") + " (Poisson)")
     else:
         print(f"  RPS (λ):      {args.rps} (Poisson inter-arrivals)")
     print(f"  Distribution: {', '.join(f'{k}={v*100:.0f}%' for k,v in dist['weights'].items())}")
-    print(f"  Concurrent:   {'Yes' if args.concurrent else 'No'}")
+    print(f"  Connections:  {args.connections} (open loop)")
     print(f"------------------------------------------")
 
-    start_time = time.time()
-    threads = []
-    request_count = 0
-
-    try:
-        while True:
-            elapsed = time.time() - start_time
-
-            # Stop condition: corpus mode or duration mode
-            if use_corpus:
-                if request_count >= args.corpus:
-                    break
-            else:
-                if elapsed >= args.duration:
-                    break
-
-            # Select endpoint from paper-specified distribution
-            endpoint_key = weighted_choice(dist["weights"])
-
-            # Compute current RPS (burst ramps, otherwise constant)
-            if is_burst:
-                current_rps = compute_burst_rps(elapsed, args.duration)
-            else:
-                current_rps = args.rps
-
-            # Send request
-            if args.concurrent:
-                t = send_request_threaded(endpoint_key)
-                threads.append(t)
-            else:
-                send_request(endpoint_key)
-
-            request_count += 1
-
-            # Poisson-distributed inter-arrival delay
-            # Paper Section V: "Poisson-distributed inter-arrivals (λ=10/s)"
-            delay = poisson_interval(current_rps)
-            # Cap delay to avoid extremely long waits from Poisson tail
-            delay = min(delay, 2.0 / current_rps)
-            time.sleep(delay)
-
-    except KeyboardInterrupt:
-        print("\n\033[33mStopped by user (Ctrl+C).\033[0m")
-
-    # Wait for outstanding threads
-    if args.concurrent and threads:
-        print(f"\n  Waiting for {len(threads)} outstanding requests...")
-        for t in threads:
-            t.join(timeout=5)
-
-    duration_actual = time.time() - start_time
-    print_summary(duration_actual)
+    stats, dropped, duration_actual = asyncio.run(generate(args, dist))
+    summary = summarize(stats, dropped, duration_actual)
+    print_summary(summary)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
 
 
 if __name__ == "__main__":